@@ -246,6 +246,8 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
     # where to look for cgf.xml and in what order: CGFXMLPATH env var,
     # or module directory
     xml_file_path = [os.getenv('CGFXMLPATH'), os.path.dirname(__file__)]
+    # code generated from cgf.xml, if any
+    xml_struct_module = "pyffi.formats.cgf._structs"
     EPSILON = 0.0001 # used for comparing floats
     # regular expression for file name extension matching on cgf files
     RE_FILENAME = re.compile(r'^.*\.(cgf|cga|chr|caf)$', re.IGNORECASE)
@@ -385,6 +387,7 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
                         'expected an instance of %s but got instance of %s'
                         %(self._template, value.__class__))
                 self._value = value
+            pyffi.object_models.xml.basic.touch()
 
         def read(self, stream, data):
             """Read chunk index.
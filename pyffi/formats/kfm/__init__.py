@@ -148,6 +148,8 @@ class KfmFormat(pyffi.object_models.xml.FileFormat):
     # KFMXMLPATH env var, or KfmFormat module directory
     xml_file_path = [os.getenv('KFMXMLPATH'),
                      os.path.join(os.path.dirname(__file__), "kfmxml")]
+    # code generated from kfm.xml, if any
+    xml_struct_module = "pyffi.formats.kfm._structs"
     # file name regular expression match
     RE_FILENAME = re.compile(r'^.*\.kfm$', re.IGNORECASE)
     # used for comparing floats
@@ -348,6 +348,8 @@ end
 #
 # ***** END LICENSE BLOCK *****
 
+from functools import partial
+import io
 from itertools import repeat, chain
 import logging
 import math # math.pi
@@ -372,6 +374,7 @@ import pyffi.utils.quickhull
 # XXX convert the following to absolute imports
 from pyffi.object_models.editable import EditableBoolComboBox
 from pyffi.utils.graph import EdgeFilter
+from pyffi.object_models.xml.array import Array
 from pyffi.object_models.xml.basic import BasicBase
 from pyffi.object_models.xml.struct_ import StructBase
 
@@ -384,6 +387,8 @@ class NifFormat(FileFormat):
     # or NifFormat module directory
     xml_file_path = [os.getenv('NIFXMLPATH'),
                      os.path.join(os.path.dirname(__file__), "nifxml")]
+    # code generated from nif.xml, if any
+    xml_struct_module = "pyffi.formats.nif._structs"
     # filter for recognizing NIF files by extension
     # .kf are NIF files containing keyframes
     # .kfa are NIF files containing keyframes in DAoC style
@@ -416,6 +421,9 @@ class NifFormat(FileFormat):
 
     class StringOffset(pyffi.object_models.common.Int):
         """This is just an integer with -1 as default value."""
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             pyffi.object_models.common.Int.__init__(self, **kwargs)
             self.set_value(-1)
@@ -432,6 +440,9 @@ class NifFormat(FileFormat):
         >>> i.get_value()
         True
         """
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value(False)
@@ -440,17 +451,14 @@ class NifFormat(FileFormat):
             return self._value
 
         def set_value(self, value):
-            if isinstance(value, str):
-                if value.lower() == 'false':
-                    self._value = False
-                    return
-                elif value == '0':
-                    self._value = False
-                    return
-            if value:
+            if isinstance(value, str) and (
+                    value.lower() == 'false' or value == '0'):
+                self._value = False
+            elif value:
                 self._value = True
             else:
                 self._value = False
+            pyffi.object_models.xml.basic.touch()
 
         def get_size(self, data=None):
             ver = data.version if data else -1
@@ -480,11 +488,16 @@ class NifFormat(FileFormat):
                                          int(self._value)))
 
     class Flags(pyffi.object_models.common.UShort):
+        __slots__ = ()
+
         def __str__(self):
             return hex(self.get_value())
 
     class Ref(BasicBase):
         """Reference to another block."""
+
+        __slots__ = ("_template",)
+
         _is_template = True
         _has_links = True
         _has_refs = True
@@ -506,13 +519,16 @@ class NifFormat(FileFormat):
                             'expected an instance of %s but got instance of %s'
                             % (self._template, value.__class__))
                 self._value = value
+            pyffi.object_models.xml.basic.touch()
 
         def get_size(self, data=None):
             return 4
 
         def get_hash(self, data=None):
+            # the digest of the block is used rather than its full hash,
+            # which would hold the hash of the whole branch
             if self.get_value():
-                return self.get_value().get_hash(data)
+                return self.get_value().get_hash_digest(data)
             else:
                 return None
 
@@ -521,6 +537,8 @@ class NifFormat(FileFormat):
             block_index, = struct.unpack(data._byte_order + 'i',
                                          stream.read(4))
             data._link_stack.append(block_index)
+            if data._link_offsets is not None:
+                data._link_offsets.append(stream.tell() - 4)
 
         def write(self, stream, data):
             """Write block reference."""
@@ -604,6 +622,28 @@ class NifFormat(FileFormat):
             if self.get_value() is not None:
                 self.get_value().replace_global_node(oldbranch, newbranch)
 
+        def replace_global_nodes(self, replacements,
+                                 edge_filter=EdgeFilter()):
+            """
+            >>> from pyffi.formats.nif import NifFormat
+            >>> x = NifFormat.NiNode()
+            >>> y = NifFormat.NiNode()
+            >>> z = NifFormat.NiNode()
+            >>> w = NifFormat.NiNode()
+            >>> x.add_child(y)
+            >>> x.add_child(z)
+            >>> y.add_child(z)
+            >>> x.replace_global_nodes({z: w})
+            >>> x.children[1] is w
+            True
+            >>> y.children[0] is w
+            True
+            """
+            if self.get_value() in replacements:
+                self.set_value(replacements[self.get_value()])
+            if self.get_value() is not None:
+                self.get_value().replace_global_nodes(replacements)
+
         def get_detail_display(self):
             # return the node itself, if it is not None
             if self.get_value() is not None:
@@ -613,6 +653,9 @@ class NifFormat(FileFormat):
 
     class Ptr(Ref):
         """A weak reference to another block, used to point up the hierarchy tree. The reference is not returned by the L{get_refs} function to avoid infinite recursion."""
+
+        __slots__ = ()
+
         _is_template = True
         _has_links = True
         _has_refs = False
@@ -632,6 +675,7 @@ class NifFormat(FileFormat):
                             'expected an instance of %s but got instance of %s'
                             % (self._template, value.__class__))
                 self._value = weakref.ref(value)
+            pyffi.object_models.xml.basic.touch()
 
         def __str__(self):
             # avoid infinite recursion
@@ -650,6 +694,12 @@ class NifFormat(FileFormat):
                 self.set_value(newbranch)
                 #print("replacing", repr(oldbranch), "->", repr(newbranch))
 
+        def replace_global_nodes(self, replacements,
+                                 edge_filter=EdgeFilter()):
+            # overridden to avoid infinite recursion
+            if self.get_value() in replacements:
+                self.set_value(replacements[self.get_value()])
+
     class LineString(BasicBase):
         """Basic type for strings ending in a newline character (0x0a).
 
@@ -674,6 +724,9 @@ class NifFormat(FileFormat):
         >>> str(m)
         'Hi There'
         """
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value('')
@@ -683,6 +736,7 @@ class NifFormat(FileFormat):
 
         def set_value(self, value):
             self._value = pyffi.object_models.common._as_bytes(value).rstrip('\x0a'.encode("ascii"))
+            pyffi.object_models.xml.basic.touch()
 
         def __str__(self):
             return pyffi.object_models.common._as_str(self._value)
@@ -701,6 +755,8 @@ class NifFormat(FileFormat):
             stream.write("\x0a".encode("ascii"))
 
     class HeaderString(BasicBase):
+        __slots__ = ()
+
         def __str__(self):
             return 'NetImmerse/Gamebryo File Format, Version x.x.x.x'
 
@@ -781,6 +837,8 @@ class NifFormat(FileFormat):
                 return "%s File Format, Version %s" % (s, v)
 
     class FileVersion(pyffi.object_models.common.UInt):
+        __slots__ = ()
+
         def set_value(self):
             raise NotImplementedError("file version is specified via data")
 
@@ -840,6 +898,9 @@ class NifFormat(FileFormat):
 
     class ShortString(BasicBase):
         """Another type for strings."""
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self._value = ''.encode("ascii")
@@ -852,6 +913,7 @@ class NifFormat(FileFormat):
             if len(val) > 254:
                 raise ValueError('string too long')
             self._value = val
+            pyffi.object_models.xml.basic.touch()
 
         def __str__(self):
             return pyffi.object_models.common._as_str(self._value)
@@ -875,6 +937,8 @@ class NifFormat(FileFormat):
             stream.write('\x00'.encode("ascii"))
 
     class string(SizedString):
+        __slots__ = ()
+
         _has_strings = True
 
         def get_size(self, data=None):
@@ -887,6 +951,8 @@ class NifFormat(FileFormat):
         def read(self, stream, data):
             n, = struct.unpack(data._byte_order + 'i', stream.read(4))
             if data.version >= 0x14010003:
+                if data._string_offsets is not None:
+                    data._string_offsets.append((stream.tell() - 4, n))
                 if n == -1:
                     self._value = ''.encode("ascii")
                 else:
@@ -907,12 +973,14 @@ class NifFormat(FileFormat):
                         struct.pack(data._byte_order + 'i', -1))
                 else:
                     try:
-                        stream.write(struct.pack(
-                            data._byte_order + 'i',
-                            data._string_list.index(self._value)))
-                    except ValueError:
+                        if data._string_index_dct is not None:
+                            index = data._string_index_dct[self._value]
+                        else:
+                            index = data._string_list.index(self._value)
+                    except (KeyError, ValueError):
                         raise ValueError(
                             "string '%s' not in string list" % self._value)
+                    stream.write(struct.pack(data._byte_order + 'i', index))
             else:
                 stream.write(struct.pack(data._byte_order + 'I',
                                          len(self._value)))
@@ -931,6 +999,9 @@ class NifFormat(FileFormat):
 
     class FilePath(string):
         """A file path."""
+
+        __slots__ = ()
+
         def get_hash(self, data=None):
             """Returns a case insensitive hash value."""
             return self.get_value().lower()
@@ -938,6 +1009,9 @@ class NifFormat(FileFormat):
     class ByteArray(BasicBase):
         """Array (list) of bytes. Implemented as basic type to speed up reading
         and also to prevent data to be dumped by __str__."""
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value("".encode()) # b'' for > py25
@@ -947,6 +1021,7 @@ class NifFormat(FileFormat):
 
         def set_value(self, value):
             self._value = pyffi.object_models.common._as_bytes(value)
+            pyffi.object_models.xml.basic.touch()
 
         def get_size(self, data=None):
             return len(self._value) + 4
@@ -970,6 +1045,9 @@ class NifFormat(FileFormat):
     class ByteMatrix(BasicBase):
         """Matrix of bytes. Implemented as basic type to speed up reading
         and to prevent data being dumped by __str__."""
+
+        __slots__ = ()
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self.set_value([])
@@ -986,6 +1064,7 @@ class NifFormat(FileFormat):
                 #assert(isinstance(x, basestring))
                 assert(len(x) == size1)
             self._value = value # should be a list of strings of bytes
+            pyffi.object_models.xml.basic.touch()
 
         def get_size(self, data=None):
             if len(self._value) == 0:
@@ -1090,12 +1169,56 @@ class NifFormat(FileFormat):
         _link_stack = None
         _block_dct = None
         _string_list = None
+        _string_index_dct = None
         _block_index_dct = None
+        _raw_blocks = None
+        _link_offsets = None
+        _string_offsets = None
+
+        class _RawBlock(object):
+            """The bytes of a block as it was read, along with the state
+            of the data needed to parse them. Blocks that have not been
+            parsed yet, and blocks that have not changed since they were
+            parsed, are written from these bytes.
+
+            :ivar raw: The bytes of the block.
+            :ivar block_type: The block type, as listed in the header.
+            :ivar data_stream: Usage and access of a NiDataStream block,
+                or ``None``.
+            :ivar layout: The version, user version, user version 2,
+                and byte order of the bytes.
+            :ivar string_list: The strings of the header.
+            :ivar block_dct: Maps block indices to blocks.
+            :ivar scan: ``None``, or once the links and strings of the
+                block are known, a tuple with a parsed copy of the
+                block (``None`` if the block itself has been parsed),
+                the offsets and indices of its links, and the offsets
+                and indices of its strings.
+            """
+
+            __slots__ = ("raw", "block_type", "data_stream", "layout",
+                         "string_list", "block_dct", "scan")
+
+            def __init__(self, raw, block_type, data_stream, layout,
+                         string_list, block_dct, scan=None):
+                self.raw = raw
+                self.block_type = block_type
+                self.data_stream = data_stream
+                self.layout = layout
+                self.string_list = string_list
+                self.block_dct = block_dct
+                self.scan = scan
+
+        def _get_layout(self):
+            """Return everything that determines how blocks are stored."""
+            return (self.version, self.user_version, self.user_version_2,
+                    self._byte_order)
 
         class VersionUInt(pyffi.object_models.common.UInt):
             def set_value(self, value):
                 if value is None:
                     self._value = None
+                    pyffi.object_models.xml.basic.touch()
                 else:
                     pyffi.object_models.common.UInt.set_value(self, value)
 
@@ -1130,21 +1253,26 @@ class NifFormat(FileFormat):
             self.roots = []
             # empty list of blocks
             self.blocks = []
+            # maps blocks that have not been parsed to their bytes
+            self._raw_blocks = {}
             # not a neosteam or ndoors nif
             self.modification = None
 
+        # note: the getters bypass get_value, as the struct classes
+        # look up the version of the data for every read and write
+
         def _getVersion(self):
-            return self._version_value_.get_value()
+            return self._version_value_._value
         def _setVersion(self, value):
             self._version_value_.set_value(value)
             
         def _getUserVersion(self):
-            return self._user_version_value_.get_value()
+            return self._user_version_value_._value
         def _setUserVersion(self, value):
             self._user_version_value_.set_value(value)
 
         def _getUserVersion2(self):
-            return self._user_version_2_value_.get_value()
+            return self._user_version_2_value_._value
         def _setUserVersion2(self, value):
             self._user_version_2_value_.set_value(value)
 
@@ -1253,6 +1381,15 @@ class NifFormat(FileFormat):
                     root.replace_global_node(oldbranch, newbranch,
                                            edge_filter=edge_filter)
 
+        def replace_global_nodes(self, replacements,
+                                 edge_filter=EdgeFilter()):
+            for i, root in enumerate(self.roots):
+                if root in replacements:
+                    self.roots[i] = replacements[root]
+                else:
+                    root.replace_global_nodes(replacements,
+                                              edge_filter=edge_filter)
+
         def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
             yield self._version_value_
             yield self._user_version_value_
@@ -1283,11 +1420,33 @@ class NifFormat(FileFormat):
             finally:
                 stream.seek(pos)
 
-        def read(self, stream):
+        def read(self, stream, lazy=False, block_types=None,
+                 incremental=False):
             """Read a NIF file. Does not reset stream position.
 
             :param stream: The stream from which to read.
             :type stream: ``file``
+            :param lazy: If ``True``, and the header lists the size of
+                every block (that is, for version 20.2.0.7 and up), then
+                the blocks are not parsed whilst reading. Instead, the
+                raw bytes of each block are kept, and the block is only
+                parsed (and its links fixed) on first access of any of
+                its attributes, for instance when a spell inspects it,
+                or when :meth:`write` walks the tree. Blocks that are
+                never parsed are written back byte for byte, apart from
+                their link and string indices, which are updated if
+                needed.
+            :type lazy: ``bool``
+            :param block_types: If not ``None``, then blocks that are
+                not of any of these types are treated as with *lazy*,
+                whilst blocks of these types are parsed as usual.
+            :type block_types: ``tuple`` of block classes
+            :param incremental: If ``True``, then also keep the bytes of
+                the blocks that are parsed, so :meth:`write` can copy
+                those blocks that have not changed, rather than
+                serialize them again. Only supported from nif version
+                3.3.0.13 onwards. The stream must be seekable.
+            :type incremental: ``bool``
             """
             logger = logging.getLogger("pyffi.nif.data")
             # read header
@@ -1306,9 +1465,23 @@ class NifFormat(FileFormat):
             # read the blocks
             self._link_stack = [] # list of indices, as they are added to the stack
             self._string_list = [s for s in self.header.strings]
+            self._string_index_dct = None
             self._block_dct = {} # maps block index to actual block
             self.blocks = [] # records all blocks as read from file in order
             block_num = 0 # the current block numner
+            # blocks which are not parsed yet (these fix their own
+            # links when they are parsed)
+            self._raw_blocks = {}
+            self._link_offsets = None
+            self._string_offsets = None
+            defer = ((lazy or block_types is not None)
+                     and self.version >= 0x14020007)
+            parsed_blocks = [] # blocks whose links must be fixed
+            layout = self._get_layout()
+            # keep the bytes of parsed blocks, and the offsets of their
+            # links and strings
+            incremental = incremental and self.version >= 0x0303000D
+            pristine_blocks = []
 
             while True:
                 if self.version < 0x0303000D:
@@ -1333,6 +1506,7 @@ class NifFormat(FileFormat):
                     block_type = self.header.block_types[
                         self.header.block_type_index[block_num] & 0xfff]
                     block_type = block_type.decode("ascii")
+                    header_block_type = block_type
                     # handle data stream classes
                     if block_type.startswith("NiDataStream\x01"):
                         block_type, data_stream_usage, data_stream_access = block_type.split("\x01")
@@ -1351,6 +1525,7 @@ class NifFormat(FileFormat):
                     block_type = NifFormat.SizedString()
                     block_type.read(stream, self)
                     block_type = block_type.get_value().decode("ascii")
+                    header_block_type = block_type
                 # get the block index
                 if self.version >= 0x0303000D:
                     # for these versions the block index is simply the block number
@@ -1372,12 +1547,42 @@ class NifFormat(FileFormat):
                                 %(block_index, stream.tell()))
                 # create the block
                 try:
-                    block = getattr(NifFormat, block_type)()
+                    block_class = getattr(NifFormat, block_type)
                 except AttributeError:
                     raise ValueError(
                         "Unknown block type '%s'." % block_type)
+                if block_type == "NiDataStream":
+                    data_stream = (data_stream_usage, data_stream_access)
+                else:
+                    data_stream = None
+                if defer and (lazy or not issubclass(block_class, block_types)):
+                    # keep the raw bytes, parse on first access
+                    raw_block = self._RawBlock(
+                        raw=stream.read(self.header.block_size[block_num]),
+                        block_type=header_block_type,
+                        data_stream=data_stream,
+                        layout=layout,
+                        string_list=self._string_list,
+                        block_dct=self._block_dct)
+                    block = block_class._deferred(partial(
+                        self._read_deferred_block, raw_block=raw_block))
+                    self._raw_blocks[block] = raw_block
+                    self._block_dct[block_index] = block
+                    self.blocks.append(block)
+                    block_num += 1
+                    if block_num >= self.header.num_blocks:
+                        break
+                    continue
+                # only the attributes which are active for this version
+                # are instantiated
+                block = block_class(data=self)
                 logger.debug("Reading %s block at 0x%08X"
                              % (block_type, stream.tell()))
+                if incremental:
+                    start = stream.tell()
+                    num_links = len(self._link_stack)
+                    self._link_offsets = []
+                    self._string_offsets = []
                 # read the block
                 try:
                     block.read(stream, self)
@@ -1388,12 +1593,13 @@ class NifFormat(FileFormat):
                     #logger.error("%s" % block)
                     raise
                 # complete NiDataStream data
-                if block_type == "NiDataStream":
-                    block.usage = data_stream_usage
-                    block.access.populate_attribute_values(data_stream_access, self)
+                if data_stream:
+                    block.usage = data_stream[0]
+                    block.access.populate_attribute_values(data_stream[1], self)
                 # store block index
                 self._block_dct[block_index] = block
                 self.blocks.append(block)
+                parsed_blocks.append(block)
                 # check block size
                 if self.version >= 0x14020007:
                     logger.debug("Checking block size")
@@ -1407,6 +1613,24 @@ class NifFormat(FileFormat):
                                      % (extra_size, block.__class__.__name__))
                         # skip bytes that were missed
                         stream.seek(extra_size, 1)
+                if incremental:
+                    end = stream.tell()
+                    stream.seek(start)
+                    links = [
+                        (offset - start, index) for offset, index in zip(
+                            self._link_offsets, self._link_stack[num_links:])]
+                    strings = [(offset - start, index)
+                               for offset, index in self._string_offsets]
+                    pristine_blocks.append((block, self._RawBlock(
+                        raw=stream.read(end - start),
+                        block_type=header_block_type,
+                        data_stream=data_stream,
+                        layout=layout,
+                        string_list=self._string_list,
+                        block_dct=self._block_dct,
+                        scan=(None, links, strings))))
+                    self._link_offsets = None
+                    self._string_offsets = None
                 # add block to roots if flagged as such
                 if is_root:
                     self.roots.append(block)
@@ -1426,9 +1650,12 @@ class NifFormat(FileFormat):
                     'End of file not reached: corrupt NIF file?')
 
             # fix links in blocks and footer (header has no links)
-            for block in self.blocks:
+            for block in parsed_blocks:
                 block.fix_links(self)
             ftr.fix_links(self)
+            # from now on, the blocks track whether they are changed
+            for block, raw_block in pristine_blocks:
+                block._pristine = raw_block
             # the link stack should be empty now
             if self._link_stack:
                 raise NifFormat.NifError('not all links have been popped from the stack (bug?)')
@@ -1437,6 +1664,147 @@ class NifFormat(FileFormat):
                 for root in ftr.roots:
                     self.roots.append(root)
 
+        def _parse_raw_block(self, block, raw_block, typed=False):
+            """Parse the bytes of a block that was not parsed whilst
+            reading, and fix its links.
+
+            :param block: The (uninitialized) block to parse into.
+            :param raw_block: The bytes of the block, and the state
+                of the data needed to parse them.
+            :type raw_block: :class:`NifFormat.Data._RawBlock`
+            :param typed: If ``True``, arrays are parsed into typed
+                storage, which is faster, and uses less memory.
+            :type typed: ``bool``
+            :return: The offsets and indices of all links and strings in
+                the bytes.
+            """
+            logger = logging.getLogger("pyffi.nif.data")
+            # the state of a concurrent read or write must be preserved
+            state = (self._link_stack, self._string_list, self._block_dct,
+                     self._link_offsets, self._string_offsets,
+                     self._get_layout(), Array.use_typed_storage)
+            self._link_stack = []
+            self._string_list = raw_block.string_list
+            self._block_dct = raw_block.block_dct
+            self._link_offsets = []
+            self._string_offsets = []
+            (self.version, self.user_version, self.user_version_2,
+             self._byte_order) = raw_block.layout
+            Array.use_typed_storage = typed or Array.use_typed_storage
+            raw = raw_block.raw
+            try:
+                block.__init__(data=self)
+                stream = io.BytesIO(raw)
+                try:
+                    block.read(stream, self)
+                except:
+                    logger.exception("Reading %s failed" % block.__class__)
+                    raise
+                if raw_block.data_stream:
+                    block.usage = raw_block.data_stream[0]
+                    block.access.populate_attribute_values(
+                        raw_block.data_stream[1], self)
+                if stream.tell() != len(raw):
+                    logger.error(
+                        "Block size check failed: corrupt NIF file "
+                        "or bad nif.xml?")
+                    logger.error("Skipping %i bytes in %s"
+                                 % (len(raw) - stream.tell(),
+                                    block.__class__.__name__))
+                links = list(zip(self._link_offsets, self._link_stack))
+                strings = self._string_offsets
+                block.fix_links(self)
+                if self._link_stack:
+                    raise NifFormat.NifError(
+                        'not all links have been popped from the stack (bug?)')
+            finally:
+                (self._link_stack, self._string_list, self._block_dct,
+                 self._link_offsets, self._string_offsets,
+                 (self.version, self.user_version, self.user_version_2,
+                  self._byte_order),
+                 Array.use_typed_storage) = state
+            return links, strings
+
+        def _read_deferred_block(self, block, raw_block):
+            """Parse a block that was deferred by :meth:`read`."""
+            logging.getLogger("pyffi.nif.data").debug(
+                "Reading deferred %s block" % block.__class__.__name__)
+            links, strings = self._parse_raw_block(block, raw_block)
+            # only once it is parsed, the block is no longer written
+            # from its bytes
+            self._raw_blocks.pop(block, None)
+            # until it is changed, the block can still be copied
+            raw_block.scan = None, links, strings
+            block._pristine = raw_block
+
+        def _get_raw_block(self, block):
+            """Return the bytes from which *block* can be written, if it
+            has not been parsed, or has not changed since it was parsed,
+            and if the bytes are in the layout of the data. Otherwise,
+            return ``None``.
+
+            :rtype: :class:`NifFormat.Data._RawBlock`
+            """
+            raw_block = self._raw_blocks.get(block)
+            if raw_block is None:
+                raw_block = block._pristine
+                if raw_block is None:
+                    return None
+            if raw_block.layout != self._get_layout():
+                if block in self._raw_blocks:
+                    # parse it, so it can be written in the new layout
+                    block._complete_deferred()
+                return None
+            if raw_block.scan is None:
+                view = block.__class__.__new__(block.__class__)
+                links, strings = self._parse_raw_block(
+                    view, raw_block, typed=True)
+                raw_block.scan = view, links, strings
+            return raw_block
+
+        def _get_block_view(self, block):
+            """Return *block* itself, or if it has not been parsed yet, a
+            parsed copy of it, from which its links and strings can be
+            obtained without parsing the block itself.
+            """
+            raw_block = self._get_raw_block(block)
+            if raw_block is None or raw_block.scan[0] is None:
+                return block
+            return raw_block.scan[0]
+
+        def _write_raw_block(self, stream, raw_block):
+            """Write the bytes of a block, updating its link and string
+            indices.
+
+            :param raw_block: The bytes, as returned by
+                :meth:`_get_raw_block`.
+            :type raw_block: :class:`NifFormat.Data._RawBlock`
+            """
+            view, links, strings = raw_block.scan
+            raw = bytearray(raw_block.raw)
+            fmt = self._byte_order + 'i'
+            for offset, index in links:
+                if index == -1:
+                    continue
+                target = raw_block.block_dct[index]
+                try:
+                    new_index = self._block_index_dct[target]
+                except KeyError:
+                    logging.getLogger("pyffi.nif.ref").warn(
+                        "%s block is missing from the nif tree:"
+                        " omitting reference"
+                        % target.__class__.__name__)
+                    new_index = -1
+                struct.pack_into(fmt, raw, offset, new_index)
+            for offset, index in strings:
+                if index == -1:
+                    continue
+                value = raw_block.string_list[index]
+                struct.pack_into(
+                    fmt, raw, offset,
+                    self._string_index_dct[value] if value else -1)
+            stream.write(raw)
+
         def write(self, stream):
             """Write a NIF file. The L{header} and the L{blocks} are recalculated
             from the tree at L{roots} (e.g. list of block types, number of blocks,
@@ -1456,10 +1824,18 @@ class NifFormat(FileFormat):
                 self._makeBlockList(root,
                                     self._block_index_dct,
                                     block_type_list, block_type_dct)
-                for block in root.tree():
+            raw_blocks = [self._get_raw_block(block) for block in self.blocks]
+            for block, raw_block in zip(self.blocks, raw_blocks):
+                if raw_block is None:
+                    self._string_list.extend(block.get_strings(self))
+                else:
                     self._string_list.extend(
-                        block.get_strings(self))
+                        raw_block.string_list[index]
+                        for offset, index in raw_block.scan[2]
+                        if index != -1 and raw_block.string_list[index])
             self._string_list = list(set(self._string_list)) # ensure unique elements
+            self._string_index_dct = dict(
+                (s, i) for i, s in enumerate(self._string_list))
             #print(self._string_list) # debug
 
             self.header.user_version = self.user_version # TODO dedicated type for user_version similar to FileVersion
@@ -1482,8 +1858,12 @@ class NifFormat(FileFormat):
             for i, s in enumerate(self._string_list):
                 self.header.strings[i] = s
             self.header.block_size.update_size()
-            for i, block in enumerate(self.blocks):
-                self.header.block_size[i] = block.get_size(data=self)
+            for i, (block, raw_block) in enumerate(zip(self.blocks,
+                                                       raw_blocks)):
+                if raw_block is None:
+                    self.header.block_size[i] = block.get_size(data=self)
+                else:
+                    self.header.block_size[i] = len(raw_block.raw)
             #if verbose >= 2:
             #    print(hdr)
 
@@ -1498,7 +1878,7 @@ class NifFormat(FileFormat):
             logger.debug("Writing header")
             #logger.debug("%s" % self.header)
             self.header.write(stream, self)
-            for block in self.blocks:
+            for block, raw_block in zip(self.blocks, raw_blocks):
                 # signal top level object if block is a root object
                 if self.version < 0x0303000D and block in self.roots:
                     s = NifFormat.SizedString()
@@ -1521,7 +1901,11 @@ class NifFormat(FileFormat):
                     stream.write(struct.pack(self._byte_order + 'i',
                                              self._block_index_dct[block]))
                 # write block
-                block.write(stream, self)
+                if raw_block is None:
+                    block.write(stream, self)
+                else:
+                    # unchanged since it was read: copy it
+                    self._write_raw_block(stream, raw_block)
             if self.version < 0x0303000D:
                 s = NifFormat.SizedString()
                 s.set_value("End Of File")
@@ -1559,50 +1943,64 @@ class NifFormat(FileFormat):
                 return (isinstance(block, NifFormat.bhkRefObject)
                         and not isinstance(block, NifFormat.bhkConstraint))
 
-            # block already listed? if so, return
-            if root in self.blocks:
-                return
-            # add block type to block type dictionary
-            block_type = root.__class__.__name__
-            # special case: NiDataStream stores part of data in block type list
-            if block_type == "NiDataStream":
-                block_type = ("NiDataStream\x01%i\x01%i"
-                              % (root.usage, root.access.get_attributes_values(self)))
-            try:
-                block_type_dct[root] = block_type_list.index(block_type)
-            except ValueError:
-                block_type_dct[root] = len(block_type_list)
-                block_type_list.append(block_type)
-
-            # special case: add bhkConstraint entities before bhkConstraint
-            # (these are actually links, not refs)
-            if isinstance(root, NifFormat.bhkConstraint):
-                for entity in root.entities:
-                    if entity is not None:
-                        self._makeBlockList(
-                            entity, block_index_dct, block_type_list, block_type_dct)
-
-            children_left = []
-            # add children that come before the block
-            # store any remaining children in children_left (processed later)
-            for child in root.get_refs(data=self):
-                if _blockChildBeforeParent(child):
-                    self._makeBlockList(
-                        child, block_index_dct, block_type_list, block_type_dct)
+            # maps block types to their index in block_type_list
+            block_type_index_dct = dict(
+                (block_type, i) for i, block_type in enumerate(block_type_list))
+
+            def _add_block(block):
+                """Add the tree at block to the block list."""
+                # block already listed? if so, return
+                if block in block_index_dct:
+                    return
+                # blocks that have not been parsed are listed through a
+                # parsed copy, which leaves the block itself unparsed
+                view = self._get_block_view(block)
+                raw_block = self._get_raw_block(block)
+                # add block type to block type dictionary
+                block_type = block.__class__.__name__
+                if raw_block is not None:
+                    block_type = raw_block.block_type
+                # special case: NiDataStream stores part of data in block type list
+                elif block_type == "NiDataStream":
+                    block_type = ("NiDataStream\x01%i\x01%i"
+                                  % (block.usage,
+                                     block.access.get_attributes_values(self)))
+                try:
+                    block_type_dct[block] = block_type_index_dct[block_type]
+                except KeyError:
+                    block_type_dct[block] = len(block_type_list)
+                    block_type_index_dct[block_type] = len(block_type_list)
+                    block_type_list.append(block_type)
+
+                # special case: add bhkConstraint entities before bhkConstraint
+                # (these are actually links, not refs)
+                if isinstance(block, NifFormat.bhkConstraint):
+                    # (the entities attribute would mark the block as changed)
+                    for entity in view._entities_value_:
+                        if entity is not None:
+                            _add_block(entity)
+
+                children_left = []
+                # add children that come before the block
+                # store any remaining children in children_left (processed later)
+                for child in view.get_refs(data=self):
+                    if _blockChildBeforeParent(child):
+                        _add_block(child)
+                    else:
+                        children_left.append(child)
+
+                # add the block
+                if self.version >= 0x0303000D:
+                    block_index_dct[block] = len(self.blocks)
                 else:
-                    children_left.append(child)
+                    block_index_dct[block] = id(block)
+                self.blocks.append(block)
 
-            # add the block
-            if self.version >= 0x0303000D:
-                block_index_dct[root] = len(self.blocks)
-            else:
-                block_index_dct[root] = id(root)
-            self.blocks.append(root)
+                # add children that come after the block
+                for child in children_left:
+                    _add_block(child)
 
-            # add children that come after the block
-            for child in children_left:
-                self._makeBlockList(
-                    child, block_index_dct, block_type_list, block_type_dct)
+            _add_block(root)
 
     # extensions of generated structures
 
@@ -5752,25 +6150,79 @@ class NifFormat(FileFormat):
             if isinstance(self, (NifFormat.NiProperty, NifFormat.NiSourceTexture)):
                 # use hash for properties and source textures
                 return ((self.__class__ is other.__class__)
-                        and (self.get_hash() == other.get_hash()))
+                        and (self.get_hash_digest()
+                             == other.get_hash_digest()))
             else:
                 # for blocks with references: quick check only
                 return self is other
 
+        def get_interchangeable_key(self):
+            """Return a key such that interchangeable blocks have equal
+            keys. Blocks with equal keys need not be interchangeable,
+            unless :meth:`is_interchangeable` only compares hashes, as
+            for properties and source textures. This allows duplicates
+            to be found with a dictionary lookup, rather than by
+            comparing every pair of blocks.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> prop1 = NifFormat.NiAlphaProperty()
+            >>> prop2 = NifFormat.NiAlphaProperty()
+            >>> prop1.get_interchangeable_key() == prop2.get_interchangeable_key()
+            True
+            >>> prop2.threshold = 128
+            >>> prop1.get_interchangeable_key() == prop2.get_interchangeable_key()
+            False
+            >>> node = NifFormat.NiNode()
+            >>> node.get_interchangeable_key() is node
+            True
+            """
+            if isinstance(self, (NifFormat.NiProperty, NifFormat.NiSourceTexture)):
+                return (self.__class__, self.get_hash_digest())
+            else:
+                # only interchangeable with itself
+                return self
+
     class NiMaterialProperty:
+        _special_names = (b"envmap2", b"envmap", b"skin", b"hair",
+                          b"dynalpha", b"hidesecret", b"lava")
+        """Material names that are never merged with other names."""
+
         def is_interchangeable(self, other):
             """Are the two material blocks interchangeable?"""
-            specialnames = (b"envmap2", b"envmap", b"skin", b"hair",
-                            b"dynalpha", b"hidesecret", b"lava")
             if self.__class__ is not other.__class__:
                 return False
-            if (self.name.lower() in specialnames
-                or other.name.lower() in specialnames):
+            if (self.name.lower() in self._special_names
+                or other.name.lower() in self._special_names):
                 # do not ignore name
-                return self.get_hash() == other.get_hash()
+                return self.get_hash_digest() == other.get_hash_digest()
             else:
                 # ignore name
-                return self.get_hash()[1:] == other.get_hash()[1:]
+                return (self._get_hash_parts()[0][1:]
+                        == other._get_hash_parts()[0][1:])
+
+        def get_interchangeable_key(self):
+            """Return a key such that two materials are interchangeable
+            if and only if their keys are equal. The name is ignored,
+            unless it is special.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> mat1 = NifFormat.NiMaterialProperty()
+            >>> mat2 = NifFormat.NiMaterialProperty()
+            >>> mat1.name = b"Material1"
+            >>> mat2.name = b"Material2"
+            >>> mat1.get_interchangeable_key() == mat2.get_interchangeable_key()
+            True
+            >>> mat2.name = b"Skin"
+            >>> mat1.get_interchangeable_key() == mat2.get_interchangeable_key()
+            False
+            """
+            if self.name.lower() in self._special_names:
+                # do not ignore name
+                return (self.__class__, self.get_hash_digest())
+            else:
+                # ignore name; the extra item keeps these keys apart
+                # from the keys of materials with a special name
+                return (self.__class__, None, self._get_hash_parts()[0][1:])
 
     class ATextureRenderData:
         def save_as_dds(self, stream):
@@ -5993,6 +6445,14 @@ class NifFormat(FileFormat):
             self.translation.z *= scale
 
     class NiTriBasedGeomData:
+        def get_interchangeable_key(self):
+            """Return a key that is equal for geometries that might be
+            interchangeable. Use :meth:`is_interchangeable` to check
+            blocks with equal keys.
+            """
+            return (self.__class__, self.num_vertices, self.num_uv_sets,
+                    self.has_normals, self.has_vertex_colors)
+
         def is_interchangeable(self, other):
             """Heuristically checks if two NiTriBasedGeomData blocks describe
             the same geometry, that is, if they can be used interchangeably in
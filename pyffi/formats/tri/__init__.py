@@ -224,6 +224,7 @@ class TriFormat(pyffi.object_models.xml.FileFormat):
 
         def set_value(self, value):
             self._value = int(value)
+            pyffi.object_models.xml.basic.touch()
 
         def __str__(self):
             return '%03i' % self._value
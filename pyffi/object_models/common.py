@@ -40,7 +40,7 @@
 import struct
 import logging
 
-from pyffi.object_models.xml.basic import BasicBase
+from pyffi.object_models.xml.basic import BasicBase, touch
 from pyffi.object_models.editable import EditableSpinBox
 from pyffi.object_models.editable import EditableFloatSpinBox
 from pyffi.object_models.editable import EditableLineEdit
@@ -119,6 +119,8 @@ class Int(BasicBase, EditableSpinBox):
     '0x44332211'
     """
 
+    __slots__ = ()
+
     _min = -0x80000000 #: Minimum value.
     _max = 0x7fffffff  #: Maximum value.
     _struct = 'i'      #: Character used to represent type in struct.
@@ -156,6 +158,7 @@ class Int(BasicBase, EditableSpinBox):
         if val < self._min or val > self._max:
             raise ValueError('value out of range (%i)' % val)
         self._value = val
+        touch()
 
     def read(self, stream, data):
         """Read value from stream.
@@ -208,6 +211,9 @@ class Int(BasicBase, EditableSpinBox):
 
 class UInt(Int):
     """Implementation of a 32-bit unsigned integer type."""
+
+    __slots__ = ()
+
     _min = 0
     _max = 0xffffffff
     _struct = 'I'
@@ -215,6 +221,9 @@ class UInt(Int):
 
 class Int64(Int):
     """Implementation of a 64-bit signed integer type."""
+
+    __slots__ = ()
+
     _min = -0x8000000000000000
     _max = 0x7fffffffffffffff
     _struct = 'q'
@@ -222,6 +231,9 @@ class Int64(Int):
 
 class UInt64(Int):
     """Implementation of a 64-bit unsigned integer type."""
+
+    __slots__ = ()
+
     _min = 0
     _max = 0xffffffffffffffff
     _struct = 'Q'
@@ -229,6 +241,9 @@ class UInt64(Int):
 
 class Byte(Int):
     """Implementation of a 8-bit signed integer type."""
+
+    __slots__ = ()
+
     _min = -0x80
     _max = 0x7f
     _struct = 'b'
@@ -236,6 +251,9 @@ class Byte(Int):
 
 class UByte(Int):
     """Implementation of a 8-bit unsigned integer type."""
+
+    __slots__ = ()
+
     _min = 0
     _max = 0xff
     _struct = 'B'
@@ -243,6 +261,9 @@ class UByte(Int):
 
 class Short(Int):
     """Implementation of a 16-bit signed integer type."""
+
+    __slots__ = ()
+
     _min = -0x8000
     _max = 0x7fff
     _struct = 'h'
@@ -250,6 +271,9 @@ class Short(Int):
 
 class UShort(UInt):
     """Implementation of a 16-bit unsigned integer type."""
+
+    __slots__ = ()
+
     _min = 0
     _max = 0xffff
     _struct = 'H'
@@ -259,6 +283,9 @@ class ULittle32(UInt):
     """Little endian 32 bit unsigned integer (ignores specified data
     byte order).
     """
+
+    __slots__ = ()
+
     def read(self, stream, data):
         """Read value from stream.
 
@@ -279,6 +306,8 @@ class ULittle32(UInt):
 class Bool(UByte, EditableBoolComboBox):
     """Simple bool implementation."""
 
+    __slots__ = ()
+
     def get_value(self):
         """Return stored value.
 
@@ -293,10 +322,13 @@ class Bool(UByte, EditableBoolComboBox):
         :type value: bool
         """
         self._value = 1 if value else 0
+        touch()
 
 class Char(BasicBase, EditableLineEdit):
     """Implementation of an (unencoded) 8-bit character."""
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """Initialize the character."""
         super(Char, self).__init__(**kwargs)
@@ -318,6 +350,7 @@ class Char(BasicBase, EditableLineEdit):
         assert(isinstance(value, bytes))
         assert(len(value) == 1)
         self._value = value
+        touch()
 
     def read(self, stream, data):
         """Read value from stream.
@@ -355,6 +388,11 @@ class Char(BasicBase, EditableLineEdit):
 class Float(BasicBase, EditableFloatSpinBox):
     """Implementation of a 32-bit float."""
 
+    __slots__ = ()
+
+    _struct = 'f'      #: Character used to represent type in struct.
+    _size = 4          #: Number of bytes.
+
     def __init__(self, **kwargs):
         """Initialize the float."""
         super(Float, self).__init__(**kwargs)
@@ -374,6 +412,7 @@ class Float(BasicBase, EditableFloatSpinBox):
         :type value: float
         """
         self._value = float(value)
+        touch()
 
     def read(self, stream, data):
         """Read value from stream.
@@ -381,8 +420,8 @@ class Float(BasicBase, EditableFloatSpinBox):
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = struct.unpack(data._byte_order + 'f',
-                                    stream.read(4))[0]
+        self._value = struct.unpack(data._byte_order + self._struct,
+                                    stream.read(self._size))[0]
 
     def write(self, stream, data):
         """Write value to stream.
@@ -391,7 +430,7 @@ class Float(BasicBase, EditableFloatSpinBox):
         :type stream: file
         """
         try:
-            stream.write(struct.pack(data._byte_order + 'f',
+            stream.write(struct.pack(data._byte_order + self._struct,
                                      self._value))
         except OverflowError:
             logger = logging.getLogger("pyffi.object_models")
@@ -404,7 +443,7 @@ class Float(BasicBase, EditableFloatSpinBox):
 
         :return: Number of bytes.
         """
-        return 4
+        return self._size
 
     def get_hash(self, data=None):
         """Return a hash value for this value. Currently implemented
@@ -434,6 +473,9 @@ class ZString(BasicBase, EditableLineEdit):
     >>> str(m)
     'Hi There!'
     """
+
+    __slots__ = ()
+
     _maxlen = 1000 #: The maximum length.
 
     def __init__(self, **kwargs):
@@ -465,6 +507,7 @@ class ZString(BasicBase, EditableLineEdit):
         if len(val) > self._maxlen:
             raise ValueError('string too long')
         self._value = val
+        touch()
 
     def read(self, stream, data=None):
         """Read string from stream.
@@ -529,6 +572,9 @@ class FixedString(BasicBase, EditableLineEdit):
     >>> str(m)
     'Hi There'
     """
+
+    __slots__ = ()
+
     _len = 0
 
     def __init__(self, **kwargs):
@@ -557,6 +603,7 @@ class FixedString(BasicBase, EditableLineEdit):
         if len(val) > self._len:
             raise ValueError("string '%s' too long" % val)
         self._value = val
+        touch()
 
     def read(self, stream, data=None):
         """Read string from stream.
@@ -615,6 +662,8 @@ class SizedString(BasicBase, EditableLineEdit):
     'Hi There'
     """
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """Initialize the string."""
         super(SizedString, self).__init__(**kwargs)
@@ -637,6 +686,7 @@ class SizedString(BasicBase, EditableLineEdit):
         if len(val) > 10000:
             raise ValueError('string too long')
         self._value = val
+        touch()
 
     def __str__(self):
         return _as_str(self._value)
@@ -680,6 +730,9 @@ class SizedString(BasicBase, EditableLineEdit):
 
 class UndecodedData(BasicBase):
     """Basic type for undecoded data trailing at the end of a file."""
+
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         BasicBase.__init__(self, **kwargs)
         self._value = b''
@@ -700,6 +753,7 @@ class UndecodedData(BasicBase):
         if len(value) > 16000000:
             raise ValueError('data too long')
         self._value = value
+        touch()
 
     def __str__(self):
         return '<UNDECODED DATA>'
@@ -725,7 +779,12 @@ class UndecodedData(BasicBase):
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = stream.read(-1)
+        read_view = getattr(stream, "read_view", None)
+        if read_view is not None:
+            # memory mapped stream: refer to the data instead of copying it
+            self._value = read_view(-1)
+        else:
+            self._value = stream.read(-1)
 
     def write(self, stream, data):
         """Write data to stream.
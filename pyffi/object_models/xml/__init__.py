@@ -39,13 +39,19 @@ file, and xml handler for converting the xml description into Python classes.
 #
 # ***** END LICENSE BLOCK *****
 
+import copy
+import hashlib
+import io
 import logging
+import pickle
+import tempfile
 import time # for timing stuff
 import types
 import os.path
 import sys
 import xml.sax
 
+import pyffi
 import pyffi.object_models
 from pyffi.object_models.xml.struct_    import StructBase
 from pyffi.object_models.xml.basic      import BasicBase
@@ -90,24 +96,113 @@ class MetaFileFormat(pyffi.object_models.MetaFileFormat):
         # the hierarchy
         xml_file_name = dct.get('xml_file_name')
         if xml_file_name:
-            # set up XML parser
-            parser = xml.sax.make_parser()
-            parser.setContentHandler(XmlSaxHandler(cls, name, bases, dct))
-
             # open XML file
             xml_file = cls.openfile(xml_file_name, cls.xml_file_path)
-
-            # parse the XML file: control is now passed on to XmlSaxHandler
-            # which takes care of the class creation
-            cls.logger.debug("Parsing %s and generating classes."
-                             % xml_file_name)
-            start = time.clock()
             try:
-                parser.parse(xml_file)
+                xml_content = xml_file.read()
             finally:
                 xml_file.close()
-            cls.logger.debug("Parsing finished in %.3f seconds."
-                             % (time.clock() - start))
+            handler = XmlSaxHandler(cls, name, bases, dct)
+
+            # use the compiled schema, if there is one
+            schema_file_name = _get_schema_file_name(cls, xml_content)
+            schema = _load_schema(schema_file_name)
+            if schema is not None:
+                cls.logger.debug("Loading compiled %s and generating classes."
+                                 % xml_file_name)
+                start = time.clock()
+                handler.replay(schema)
+                cls.logger.debug("Loading finished in %.3f seconds."
+                                 % (time.clock() - start))
+            else:
+                # set up XML parser
+                parser = xml.sax.make_parser()
+                parser.setContentHandler(handler)
+                handler.record = schema_file_name is not None
+
+                # parse the XML file: control is now passed on to
+                # XmlSaxHandler which takes care of the class creation
+                cls.logger.debug("Parsing %s and generating classes."
+                                 % xml_file_name)
+                start = time.clock()
+                parser.parse(io.StringIO(xml_content))
+                cls.logger.debug("Parsing finished in %.3f seconds."
+                                 % (time.clock() - start))
+                if handler.record:
+                    _save_schema(schema_file_name, handler.schema)
+
+            # use the generated code of the struct classes, if there is any
+            # (imported here, so the generator can run as a script)
+            from pyffi.object_models.xml import codegen
+            codegen.bind(cls, xml_content)
+
+
+SCHEMA_VERSION = 1
+"""Version of the layout of compiled schemas. Increase it whenever
+:class:`XmlSaxHandler` records different information, so compiled
+schemas of an older layout are no longer used.
+"""
+
+
+def _get_schema_cache_dir():
+    """Get the folder with compiled schemas: the ``PYFFICACHEDIR``
+    environment variable if it is set (an empty value disables the
+    cache), and the pyffi folder in the user cache folder otherwise.
+    """
+    cache_dir = os.environ.get("PYFFICACHEDIR")
+    if cache_dir is not None:
+        return cache_dir
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME")
+        or os.path.join(os.path.expanduser("~"), ".cache"),
+        "pyffi")
+
+
+def _get_schema_file_name(cls, xml_content):
+    """Get the name of the compiled schema of format *cls*, whose xml
+    description is *xml_content*, or ``None`` if schemas are not cached.
+    The name depends on the pyffi version, and on the content of the
+    xml file, so stale schemas are never used.
+    """
+    cache_dir = _get_schema_cache_dir()
+    if not cache_dir:
+        return None
+    hsh = hashlib.sha1(repr((pyffi.__version__, SCHEMA_VERSION,
+                             cls.__module__, cls.__name__)).encode("utf-8"))
+    hsh.update(xml_content.encode("utf-8"))
+    return os.path.join(
+        cache_dir, "%s-%s.schema" % (cls.__name__, hsh.hexdigest()))
+
+
+def _load_schema(file_name):
+    """Load a compiled schema, or return ``None`` if there is no (valid)
+    schema.
+    """
+    if file_name is None:
+        return None
+    try:
+        with open(file_name, "rb") as stream:
+            return pickle.load(stream)
+    except Exception:
+        # missing, or corrupt: parse the xml file instead
+        return None
+
+
+def _save_schema(file_name, schema):
+    """Save a compiled schema. Failures are ignored: the xml file is
+    simply parsed again next time.
+    """
+    dirname = os.path.dirname(file_name)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        # write to a temporary file and rename it, so other processes
+        # never see a partially written schema
+        with tempfile.NamedTemporaryFile(
+            dir=dirname, suffix=".tmp", delete=False) as stream:
+            stream.write(schema)
+        os.replace(stream.name, file_name)
+    except (IOError, OSError):
+        pass
 
 
 class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
@@ -117,6 +212,13 @@ class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
     xml_file_path = None #: Override.
     logger = logging.getLogger("pyffi.object_models.xml")
 
+    xml_struct_module = None
+    """Name of the module with the code that
+    :mod:`pyffi.object_models.xml.codegen` generated from the xml file,
+    or ``None``. The module is optional, and it is only used if it was
+    generated from the current xml file.
+    """
+
     # We also keep an ordered list of all classes that have been created.
     # The xml_struct list includes all xml generated struct classes,
     # including those that are replaced by a native class in cls (for
@@ -297,7 +399,14 @@ class XmlError(Exception):
 
 class XmlSaxHandler(xml.sax.handler.ContentHandler):
     """This class contains all functions for parsing the xml and converting
-    the xml structure into Python classes."""
+    the xml structure into Python classes.
+
+    If :attr:`record` is set, then the handler also compiles the parsed
+    xml into a schema, that is, a pickled list of all classes to create,
+    with their attributes, and with all expressions parsed. Creating the
+    classes from a compiled schema, with :meth:`replay`, is much faster
+    than parsing the xml file.
+    """
     tag_file = 1
     tag_version = 2
     tag_basic = 3
@@ -376,6 +485,17 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
         # elements for versions
         self.version_string = None
 
+        # compiled schema
+        self.record = False
+        self.schema = None
+        # classes, in order of creation, see endElement
+        self.schema_classes = []
+        # xml type names of attributes, by id, see startElement
+        self.schema_type_names = {}
+        # bases of the class that is being created, as names of classes
+        # of cls, or as the class itself if it is not a class of cls
+        self.class_base_names = ()
+
     def pushTag(self, tag):
         """Push tag C{tag} on the stack and make it the current tag.
 
@@ -452,8 +572,11 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
             # struct -> attribute
             if tag == self.tag_attribute:
                 # add attribute to class dictionary
-                self.class_dict["_attrs"].append(
-                    StructAttribute(self.cls, attrs))
+                attr = StructAttribute(self.cls, attrs)
+                self.class_dict["_attrs"].append(attr)
+                if (self.record and isinstance(attr.type_, type)
+                    and attr.type_ is not type(None)):
+                    self.schema_type_names[id(attr)] = attrs["type"]
             # struct -> version
             elif tag == self.tag_version:
                 # set the version string
@@ -484,8 +607,10 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
                         raise XmlError(
                             "typo, or forward declaration of struct %s"
                             % class_basename)
+                    self.class_base_names += (class_basename,)
                 else:
                     self.class_bases = (StructBase,)
+                    self.class_base_names = (StructBase,)
                 # istemplate attribute is optional
                 # if not set, then the struct is not a template
                 # set attributes (see class StructBase)
@@ -513,6 +638,7 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
             # fileformat -> enum
             elif tag == self.tag_enum:
                 self.class_bases += (EnumBase,)
+                self.class_base_names += (EnumBase,)
                 self.class_name = attrs["name"]
                 try:
                     numbytes = int(attrs["numbytes"])
@@ -541,6 +667,7 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
                 except AttributeError:
                     raise XmlError(
                         "typo, or forward declaration of type %s" % typename)
+                self.class_base_names += (typename,)
                 self.class_dict = {"__doc__": "",
                                   "__module__": self.cls.__module__}
 
@@ -549,6 +676,7 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
             # BitStruct base class later
             elif tag == self.tag_bit_struct:
                 self.class_bases += (BitStructBase,)
+                self.class_base_names += (BitStructBase,)
                 self.class_name = attrs["name"]
                 try:
                     numbytes = int(attrs["numbytes"])
@@ -647,56 +775,20 @@ but got %s instead""" % name)
                      self.tag_enum,
                      self.tag_alias,
                      self.tag_bit_struct):
-            # create class
-            # assign it to cls.<class_name> if it has not been implemented
-            # internally
-            cls_klass = getattr(self.cls, self.class_name, None)
-            if cls_klass and issubclass(cls_klass, BasicBase):
-                # overrides a basic type - not much to do
-                pass
-            else:
-                # check if we have a customizer class
-                if cls_klass:
-                    # exists: create and add to base class of customizer
-                    gen_klass = type(
-                        "_" + str(self.class_name),
-                        self.class_bases, self.class_dict)
-                    setattr(self.cls, "_" + self.class_name, gen_klass)
-                    # recreate the class, to ensure that the
-                    # metaclass is called!!
-                    # (otherwise, cls_klass does not have correct
-                    # _attribute_list, etc.)
-                    cls_klass = type(
-                        cls_klass.__name__,
-                        (gen_klass,) + cls_klass.__bases__,
-                        dict(cls_klass.__dict__))
-                    setattr(self.cls, self.class_name, cls_klass)
-                    # if the class derives from Data, then make an alias
-                    if issubclass(
-                        cls_klass,
-                        pyffi.object_models.FileFormat.Data):
-                        self.cls.Data = cls_klass
-                    # for the stuff below
-                    gen_class = cls_klass
-                else:
-                    # does not yet exist: create it and assign to class dict
-                    gen_klass = type(
-                        str(self.class_name), self.class_bases, self.class_dict)
-                    setattr(self.cls, self.class_name, gen_klass)
-                # append class to the appropriate list
-                if tag == self.tag_struct:
-                    self.cls.xml_struct.append(gen_klass)
-                elif tag == self.tag_enum:
-                    self.cls.xml_enum.append(gen_klass)
-                elif tag == self.tag_alias:
-                    self.cls.xml_alias.append(gen_klass)
-                elif tag == self.tag_bit_struct:
-                    self.cls.xml_bit_struct.append(gen_klass)
+            if self.record:
+                self.schema_classes.append(
+                    (tag, self.class_name, self.class_base_names,
+                     self.class_dict))
+            self._create_class(tag)
             # reset variables
             self.class_name = None
             self.class_dict = None
             self.class_bases = ()
+            self.class_base_names = ()
         elif tag == self.tag_basic:
+            if self.record:
+                self.schema_classes.append(
+                    (tag, self.class_name, None, None))
             # link class cls.<class_name> to self.basic_class
             setattr(self.cls, self.class_name, self.basic_class)
             # reset variable
@@ -705,12 +797,123 @@ but got %s instead""" % name)
             # reset variable
             self.version_string = None
 
+    def _create_class(self, tag):
+        """Create the class described by :attr:`class_name`,
+        :attr:`class_bases`, and :attr:`class_dict`, for a struct, enum,
+        alias, or bitstruct *tag*.
+        """
+        # create class
+        # assign it to cls.<class_name> if it has not been implemented
+        # internally
+        cls_klass = getattr(self.cls, self.class_name, None)
+        if cls_klass and issubclass(cls_klass, BasicBase):
+            # overrides a basic type - not much to do
+            pass
+        else:
+            # check if we have a customizer class
+            if cls_klass:
+                # exists: create and add to base class of customizer
+                gen_klass = type(
+                    "_" + str(self.class_name),
+                    self.class_bases, self.class_dict)
+                setattr(self.cls, "_" + self.class_name, gen_klass)
+                # recreate the class, to ensure that the
+                # metaclass is called!!
+                # (otherwise, cls_klass does not have correct
+                # _attribute_list, etc.)
+                # the __dict__ and __weakref__ descriptors of the
+                # old class do not apply to instances of the new one
+                cls_klass = type(
+                    cls_klass.__name__,
+                    (gen_klass,) + cls_klass.__bases__,
+                    dict((key, value)
+                         for key, value in cls_klass.__dict__.items()
+                         if key not in ("__dict__", "__weakref__")))
+                setattr(self.cls, self.class_name, cls_klass)
+                # if the class derives from Data, then make an alias
+                if issubclass(
+                    cls_klass,
+                    pyffi.object_models.FileFormat.Data):
+                    self.cls.Data = cls_klass
+                # for the stuff below
+                gen_class = cls_klass
+            else:
+                # does not yet exist: create it and assign to class dict
+                gen_klass = type(
+                    str(self.class_name), self.class_bases, self.class_dict)
+                setattr(self.cls, self.class_name, gen_klass)
+            # append class to the appropriate list
+            if tag == self.tag_struct:
+                self.cls.xml_struct.append(gen_klass)
+            elif tag == self.tag_enum:
+                self.cls.xml_enum.append(gen_klass)
+            elif tag == self.tag_alias:
+                self.cls.xml_alias.append(gen_klass)
+            elif tag == self.tag_bit_struct:
+                self.cls.xml_bit_struct.append(gen_klass)
+
+    def _compile_schema(self):
+        """Pickle the versions, games, and classes that were parsed, as
+        they are before :meth:`endDocument` resolves the types and
+        conditions which refer to classes of :attr:`cls`. Such
+        references are replaced by their names, so the classes are
+        recreated by :meth:`replay`, rather than pickled.
+        """
+        classes = []
+        for tag, class_name, base_names, class_dict in self.schema_classes:
+            if class_dict is not None and tag == self.tag_struct:
+                class_dict = dict(class_dict)
+                attrs = []
+                for attr in class_dict["_attrs"]:
+                    type_name = self.schema_type_names.get(id(attr))
+                    if type_name is not None:
+                        attr = copy.copy(attr)
+                        attr.type_ = type_name
+                    attrs.append(attr)
+                class_dict["_attrs"] = attrs
+            classes.append((tag, class_name, base_names, class_dict))
+        return pickle.dumps(
+            dict(versions=self.cls.versions, games=self.cls.games,
+                 classes=classes),
+            pickle.HIGHEST_PROTOCOL)
+
+    def replay(self, schema):
+        """Create all classes from a compiled *schema*, instead of
+        parsing the xml file.
+
+        :param schema: The compiled schema, see :attr:`record`.
+        :type schema: ``dict``
+        """
+        self.cls.versions.update(schema["versions"])
+        self.cls.games.update(schema["games"])
+        for tag, class_name, base_names, class_dict in schema["classes"]:
+            if tag == self.tag_basic:
+                setattr(self.cls, class_name, getattr(self.cls, class_name))
+                continue
+            # types are resolved as far as they are known at this point,
+            # just like when parsing
+            for attr in class_dict.get("_attrs", ()):
+                if isinstance(getattr(attr, "type_", None), str):
+                    attr.type_ = getattr(self.cls, attr.type_, attr.type_)
+            self.class_name = class_name
+            self.class_bases = tuple(
+                getattr(self.cls, base) if isinstance(base, str) else base
+                for base in base_names)
+            self.class_dict = class_dict
+            self._create_class(tag)
+        self.class_name = None
+        self.class_dict = None
+        self.class_bases = ()
+        self.endDocument()
+
     def endDocument(self):
         """Called when the xml is completely parsed.
 
         Searches and adds class customized functions.
         For version tags, adds version to version and game lists.
         """
+        if self.record:
+            self.schema = self._compile_schema()
         # get 'name_attribute' for all classes
         # we need this to fix them in cond="..." later
         klass_filter = {}
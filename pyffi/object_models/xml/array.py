@@ -40,14 +40,212 @@
 # --------------------------------------------------------------------------
 
 # note: some imports are defined at the end to avoid problems with circularity
+import array
 import logging
+import struct
+import sys
 import weakref
 
 from pyffi.utils.graph import DetailNode, EdgeFilter
 
+class _TypedLayout(object):
+    """Layout of an element type whose instances can be stored as plain
+    values in an :class:`array.array`: either a fixed size basic type
+    (see :func:`~pyffi.object_models.xml.struct_._get_bulk_struct`),
+    or a struct whose active attributes form a single bulk run of
+    values which all have the same format.
+
+    :ivar typecode: The :mod:`array` type code of the values.
+    :ivar width: Number of values per element.
+    :ivar size: Number of bytes per element.
+    :ivar value_names: Names of the instance variables holding the
+        values of a struct element, or ``None`` for a basic element.
+    """
+
+    __slots__ = ("typecode", "width", "size", "value_names",
+                 "_element_type", "_scratch")
+
+    #: Candidate :mod:`array` type codes for each :mod:`struct` format
+    #: character; the one whose item size matches the standard size
+    #: of the format character is used.
+    _TYPECODES = {
+        'b': 'bhilq', 'h': 'bhilq', 'i': 'bhilq', 'l': 'bhilq', 'q': 'bhilq',
+        'B': 'BHILQ', 'H': 'BHILQ', 'I': 'BHILQ', 'L': 'BHILQ', 'Q': 'BHILQ',
+        'f': 'f', 'd': 'd',
+        }
+
+    def __init__(self, element_type, typecode, value_names=None):
+        self.typecode = typecode
+        self.value_names = value_names
+        self.width = len(value_names) if value_names else 1
+        self.size = self.width * array.array(typecode).itemsize
+        self._element_type = element_type
+        # instances used to convert and hash values
+        if value_names is None:
+            self._scratch = (element_type(),)
+        else:
+            self._scratch = tuple(
+                getattr(element_type(), value_name)
+                for value_name in value_names)
+
+    @classmethod
+    def get_typecode(cls, format_):
+        """Return the :mod:`array` type code for the given :mod:`struct`
+        format characters, or ``None`` if they cannot be stored in a
+        single :class:`array.array`."""
+        if not format_ or format_.strip(format_[0]):
+            return None
+        size = struct.calcsize("<" + format_[0])
+        for typecode in cls._TYPECODES.get(format_[0], ""):
+            if array.array(typecode).itemsize == size:
+                return typecode
+        return None
+
+    def instance(self, values, index, template, argument, parent):
+        """Create an element instance from the *index*'th element in
+        *values*."""
+        elem = self._element_type(
+            template = template, argument = argument, parent = parent)
+        if self.value_names is None:
+            elem._value = values[index]
+        else:
+            start = index * self.width
+            for value_name, value in zip(
+                self.value_names, values[start:start + self.width]):
+                getattr(elem, value_name)._value = value
+        return elem
+
+    def convert(self, value):
+        """Convert *value* to a raw basic value, as the element type
+        would on :meth:`set_value`."""
+        scratch = self._scratch[0]
+        scratch.set_value(value)
+        return scratch._value
+
+    def get_hashes(self, values, data=None):
+        """Yield the hash of every element stored in *values*, as the
+        element type would calculate it."""
+        if self.value_names is None:
+            scratch = self._scratch[0]
+            for value in values:
+                scratch._value = value
+                yield scratch.get_hash(data)
+        else:
+            width = self.width
+            for start in range(0, len(values), width):
+                hsh = []
+                for scratch, value in zip(
+                    self._scratch, values[start:start + width]):
+                    scratch._value = value
+                    hsh.append(scratch.get_hash(data))
+                yield tuple(hsh)
+
+_typed_layouts = {}
+
+def _get_typed_layout(element_type, data):
+    """Return the :class:`_TypedLayout` of *element_type* for *data*, or
+    ``None`` if its instances cannot be stored as plain values."""
+    if issubclass(element_type, StructBase):
+        plan = element_type._get_plan(data)
+        key = (element_type, plan)
+    else:
+        plan = None
+        key = (element_type, None)
+    try:
+        return _typed_layouts[key]
+    except KeyError:
+        pass
+    layout = None
+    if plan is not None:
+        if (len(plan.io) == 1 and plan.io[0][1] is None
+            and len(plan.io[0][0].value_names) == len(plan.attrs)
+            and element_type.read is StructBase.read
+            and element_type.write is StructBase.write
+            and element_type.get_hash is StructBase.get_hash):
+            run = plan.io[0][0]
+            typecode = _TypedLayout.get_typecode(run.format)
+            if typecode:
+                layout = _TypedLayout(element_type, typecode, run.value_names)
+    elif _get_bulk_struct(element_type):
+        for base in (pyffi.object_models.common.Int,
+                     pyffi.object_models.common.Float):
+            if (issubclass(element_type, base)
+                and element_type.get_value is base.get_value):
+                typecode = _TypedLayout.get_typecode(element_type._struct)
+                if typecode:
+                    layout = _TypedLayout(element_type, typecode)
+                break
+    _typed_layouts[key] = layout
+    return layout
+
+class _TypedBuffer(object):
+    """Compact storage of the elements of a list, as plain values in an
+    :class:`array.array`, in native byte order.
+
+    :ivar layout: The :class:`_TypedLayout` of the elements.
+    :ivar values: The :class:`array.array` holding the values.
+    """
+
+    __slots__ = ("layout", "values", "template", "argument")
+
+    def __init__(self, layout, values, template=None, argument=None):
+        self.layout = layout
+        self.values = values
+        self.template = template
+        self.argument = argument
+
+    @staticmethod
+    def _needs_swap(data):
+        """Whether values in the byte order of *data* must be swapped."""
+        return (data._byte_order in "<>"
+                and (data._byte_order == ">") != (sys.byteorder == "big"))
+
+    @classmethod
+    def read(cls, layout, count, stream, data, template=None, argument=None):
+        """Read *count* elements from *stream* in one go."""
+        size = count * layout.size
+        values = array.array(layout.typecode, bytes(size))
+        if stream.readinto(values) != size:
+            raise struct.error("unpack requires a buffer of %i bytes" % size)
+        if cls._needs_swap(data):
+            values.byteswap()
+        return cls(layout, values, template, argument)
+
+    def write(self, stream, data):
+        """Write all elements to *stream* in one go."""
+        values = self.values
+        if self._needs_swap(data):
+            values = array.array(values.typecode, values)
+            values.byteswap()
+        stream.write(values.tobytes())
+
+    def __len__(self):
+        return len(self.values) // self.layout.width
+
+    def get_size(self):
+        """Number of bytes of all elements."""
+        return len(self) * self.layout.size
+
+    def instances(self, parent):
+        """Yield element instances for all values."""
+        for index in range(len(self)):
+            yield self.layout.instance(
+                self.values, index, self.template, self.argument, parent)
+
 class _ListWrap(list, DetailNode):
     """A wrapper for list, which uses get_value and set_value for
-    getting and setting items of the basic type."""
+    getting and setting items of the basic type.
+
+    The elements may also be held in a :class:`_TypedBuffer` rather than
+    in the list itself, see :attr:`Array.use_typed_storage`. Basic values
+    are then get and set directly in the buffer; element instances are
+    only created (and the buffer discarded) when needed, for instance on
+    access to a struct element, or when the list is modified.
+    """
+
+    #: The :class:`_TypedBuffer` holding the elements, or ``None`` if the
+    #: elements are stored in the list.
+    _typed = None
 
     def __init__(self, element_type, parent = None):
         self._parent = weakref.ref(parent) if parent else None
@@ -63,15 +261,45 @@ class _ListWrap(list, DetailNode):
             self._set_item_hook = self.__class__._not_implemented_hook
             self._iter_item_hook = self.__class__.iter_item
 
+    def _materialize(self):
+        """Replace the typed buffer, if any, by element instances."""
+        typed = self._typed
+        if typed is not None:
+            self._typed = None
+            list.extend(self, typed.instances(self))
+
     def __getitem__(self, index):
+        typed = self._typed
+        if typed is not None:
+            if typed.layout.value_names is None and isinstance(index, int):
+                return typed.values[index]
+            self._materialize()
         return self._get_item_hook(self, index)
 
     def __setitem__(self, index, value):
+        basic.touch()
+        typed = self._typed
+        if typed is not None:
+            if typed.layout.value_names is None and isinstance(index, int):
+                typed.values[index] = typed.layout.convert(value)
+                return
+            self._materialize()
         return self._set_item_hook(self, index, value)
 
     def __iter__(self):
+        typed = self._typed
+        if typed is not None:
+            if typed.layout.value_names is None:
+                return iter(typed.values)
+            self._materialize()
         return self._iter_item_hook(self)
 
+    def __len__(self):
+        typed = self._typed
+        if typed is not None:
+            return len(typed)
+        return list.__len__(self)
+
     def __contains__(self, value):
         # ensure that the "in" operator uses self.__iter__() rather than
         # list.__iter__()
@@ -113,11 +341,48 @@ class _ListWrap(list, DetailNode):
 
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Yield children."""
+        self._materialize()
         return (item for item in list.__iter__(self))
 
     def get_detail_child_names(self, edge_filter=EdgeFilter()):
         """Yield child names."""
-        return ("[%i]" % row for row in range(list.__len__(self)))
+        return ("[%i]" % row for row in range(self.__len__()))
+
+def _materializing(name, other=False, changing=False):
+    """Wrap the list method *name* so it first replaces the typed buffer
+    of the list, and if *other* is true also that of the other operand,
+    by element instances. If *changing* is true, then the method changes
+    the list, so cached hash digests are invalidated."""
+    method = getattr(list, name)
+    if other:
+        def wrapper(self, value):
+            self._materialize()
+            if isinstance(value, _ListWrap):
+                value._materialize()
+            return method(self, value)
+    elif changing:
+        def wrapper(self, *args, **kwargs):
+            basic.touch()
+            self._materialize()
+            return method(self, *args, **kwargs)
+    else:
+        def wrapper(self, *args, **kwargs):
+            self._materialize()
+            return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+for _name in ("__add__", "__eq__", "__ge__", "__gt__", "__le__", "__lt__",
+              "__ne__"):
+    setattr(_ListWrap, _name, _materializing(_name, other=True))
+for _name in ("__mul__", "__repr__", "__reversed__", "__rmul__", "copy",
+              "count", "index"):
+    setattr(_ListWrap, _name, _materializing(_name))
+for _name in ("__delitem__", "__iadd__", "__imul__", "append", "clear",
+              "extend", "insert", "pop", "remove", "reverse", "sort"):
+    setattr(_ListWrap, _name, _materializing(_name, changing=True))
+del _name
 
 class Array(_ListWrap):
     """A general purpose class for 1 or 2 dimensional arrays consisting of
@@ -126,6 +391,21 @@ class Array(_ListWrap):
     logger = logging.getLogger("pyffi.nif.data.array")
     arg = None # default argument
 
+    #: Whether to read arrays of fixed size basic elements, and of
+    #: structs consisting only of such elements of a single type (such as
+    #: vertices, normals, uv coordinates, colors, and triangles), into a
+    #: compact :class:`array.array` buffer in one read, rather than
+    #: creating an instance for every element. Such arrays are also
+    #: written in one go. The list interface is unchanged: basic values
+    #: are get and set directly in the buffer, whilst element instances
+    #: are created from the buffer on first access to a struct element,
+    #: or when the array is resized. Note that float values are then
+    #: stored with single precision as soon as they are set.
+    use_typed_storage = False
+
+    #: Minimum number of elements for using typed storage.
+    typed_storage_min_length = 16
+
     def __init__(
         self,
         element_type = None,
@@ -225,6 +505,7 @@ class Array(_ListWrap):
 
     # string of the array
     def __str__(self):
+        self._materialize_rows()
         text = '%s instance at 0x%08X\n' % (self.__class__, id(self))
         if self._count2 is None:
             for i, element in enumerate(list.__iter__(self)):
@@ -253,6 +534,7 @@ class Array(_ListWrap):
         """Update the array size. Call this function whenever the size
         parameters change in C{parent}."""
         ## TODO also update row numbers
+        basic.touch()
         old_size = len(self)
         new_size = self._len1()
         if self._count2 is None:
@@ -284,6 +566,7 @@ class Array(_ListWrap):
 
     def read(self, stream, data):
         """Read array from stream."""
+        basic.touch()
         # parse arguments
         self._elementTypeArgument = self.arg
 
@@ -292,31 +575,52 @@ class Array(_ListWrap):
         self.logger.debug("Reading array of size " + str(len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
+        self._typed = None
         del self[0:self.__len__()]
+        layout = (_get_typed_layout(self._elementType, data)
+                  if self.use_typed_storage else None)
+        # struct elements only instantiate their attributes which are
+        # active for this version
+        if issubclass(self._elementType, StructBase):
+            kwargs = dict(data = data)
+        else:
+            kwargs = {}
 
         # read array
         if self._count2 is None:
+            if layout is not None and len1 >= self.typed_storage_min_length:
+                self._typed = _TypedBuffer.read(
+                    layout, len1, stream, data,
+                    self._elementTypeTemplate, self._elementTypeArgument)
+                return
             for i in range(len1):
                 elem = self._elementType(
                     template = self._elementTypeTemplate,
                     argument = self._elementTypeArgument,
-                    parent = self)
+                    parent = self, **kwargs)
                 elem.read(stream, data)
-                self.append(elem)
+                list.append(self, elem)
         else:
             for i in range(len1):
                 len2i = self._len2(i)
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
                 elemlist = _ListWrap(self._elementType, parent = self)
+                if (layout is not None
+                    and len2i >= self.typed_storage_min_length):
+                    elemlist._typed = _TypedBuffer.read(
+                        layout, len2i, stream, data,
+                        self._elementTypeTemplate, self._elementTypeArgument)
+                    list.append(self, elemlist)
+                    continue
                 for j in range(len2i):
                     elem = self._elementType(
                         template = self._elementTypeTemplate,
                         argument = self._elementTypeArgument,
-                        parent = elemlist)
+                        parent = elemlist, **kwargs)
                     elem.read(stream, data)
-                    elemlist.append(elem)
-                self.append(elemlist)
+                    list.append(elemlist, elem)
+                list.append(self, elemlist)
 
     def write(self, stream, data):
         """Write array to stream."""
@@ -328,6 +632,9 @@ describing number of elements (%i)'%(self.__len__(),len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
         if self._count2 is None:
+            if self._typed is not None:
+                self._typed.write(stream, data)
+                return
             for elem in list.__iter__(self):
                 elem.write(stream, data)
         else:
@@ -338,6 +645,9 @@ describing number of elements (%i)'%(self.__len__(),len1))
 describing number of elements (%i)"%(elemlist.__len__(),len2i))
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
+                if elemlist._typed is not None:
+                    elemlist._typed.write(stream, data)
+                    continue
                 for elem in list.__iter__(elemlist):
                     elem.write(stream, data)
 
@@ -381,23 +691,60 @@ describing number of elements (%i)"%(elemlist.__len__(),len2i))
 
     def get_size(self, data=None):
         """Calculate the sum of the size of all elements in the array."""
-        return sum(
-            (elem.get_size(data) for elem in self._elementList()), 0)
+        size = 0
+        for row in self._rows():
+            if row._typed is not None:
+                size += row._typed.get_size()
+            else:
+                size += sum(
+                    (elem.get_size(data) for elem in list.__iter__(row)), 0)
+        return size
 
     def get_hash(self, data=None):
         """Calculate a hash value for the array, as a tuple."""
         hsh = []
-        for elem in self._elementList():
-            hsh.append(elem.get_hash(data))
+        for row in self._rows():
+            if row._typed is not None:
+                hsh.extend(row._typed.layout.get_hashes(
+                    row._typed.values, data))
+            else:
+                for elem in list.__iter__(row):
+                    hsh.append(elem.get_hash(data))
         return tuple(hsh)
 
+    def get_hash_digest(self, data=None):
+        """Calculate a compact hash value for the array, as a 64 bit
+        integer. It is not cached, as arrays are cached as part of the
+        structure they belong to.
+        """
+        return basic.get_digest(self.get_hash(data))
+
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
         """Calculate a hash value for the array, as a tuple."""
         for elem in self._elementList():
             elem.replace_global_node(oldbranch, newbranch, **kwargs)
 
+    def replace_global_nodes(self, replacements, **kwargs):
+        """Replace given branches in all elements of the array."""
+        for elem in self._elementList():
+            elem.replace_global_nodes(replacements, **kwargs)
+
+    def _rows(self):
+        """The lists holding the elements: the array itself if it is one
+        dimensional, or its rows if it is two dimensional."""
+        if self._count2 is None:
+            return (self,)
+        else:
+            return list.__iter__(self)
+
+    def _materialize_rows(self):
+        """Replace all typed buffers by element instances."""
+        for row in self._rows():
+            row._materialize()
+
     def _elementList(self, **kwargs):
         """Generator for listing all elements."""
+        self._materialize_rows()
         if self._count2 is None:
             for elem in list.__iter__(self):
                 yield elem
@@ -406,5 +753,7 @@ describing number of elements (%i)"%(elemlist.__len__(),len2i))
                 for elem in list.__iter__(elemlist):
                     yield elem
 
+import pyffi.object_models.common
+from pyffi.object_models.xml import basic
 from pyffi.object_models.xml.basic import BasicBase
-from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml.struct_ import StructBase, _get_bulk_struct
@@ -39,8 +39,46 @@
 # ***** END LICENSE BLOCK *****
 # --------------------------------------------------------------------------
 
+import hashlib
+
 from pyffi.utils.graph import DetailNode
 
+_generation = 0
+"""Number of changes so far, see :func:`touch`."""
+
+def touch():
+    """Record that some value has changed, which invalidates all cached
+    hash digests (see
+    :meth:`~pyffi.object_models.xml.struct_.StructBase.get_hash_digest`).
+    Structures do not know their parents, nor the blocks that link to
+    them, so no digest can be trusted after any change. This is called
+    by the :meth:`BasicBase.set_value` implementations, by the attribute
+    setters and :meth:`~pyffi.object_models.xml.struct_.StructBase.read`
+    of structures, and by the item setters,
+    :meth:`~pyffi.object_models.xml.array.Array.update_size`, and
+    :meth:`~pyffi.object_models.xml.array.Array.read` of arrays. Call it
+    after changing a value in any other way, for instance after reading
+    a basic value directly, or when implementing
+    :meth:`BasicBase.set_value`.
+    """
+    global _generation
+    _generation += 1
+
+def get_digest(hsh):
+    """Calculate a 64 bit digest of a hash value, as returned by
+    :meth:`BasicBase.get_hash`. Hash values consisting of equal
+    numbers, strings, and tuples have equal digests, also across
+    different Python sessions.
+
+    >>> get_digest((1, 2.5, b"abc", (None, -1))) == get_digest(
+    ...     (1, 2.5, b"abc", (None, -1)))
+    True
+    >>> get_digest((-1,)) == get_digest((-2,))
+    False
+    """
+    return int.from_bytes(
+        hashlib.sha1(repr(hsh).encode("utf-8")).digest()[:8], "little")
+
 class BasicBase(DetailNode):
     """Base class from which all basic types are derived.
 
@@ -76,6 +114,11 @@ class BasicBase(DetailNode):
     NotImplementedError
     """
 
+    # instances only hold their value, so large meshes with many basic
+    # instances take as little memory as possible; subclasses which
+    # need more must declare their own __slots__ (or get a __dict__)
+    __slots__ = ("_value",)
+
     _is_template = False # is it a template type?
     _has_links = False # does the type contain a Ref or a Ptr?
     _has_refs = False # does the type contain a Ref?
@@ -146,6 +189,10 @@ class BasicBase(DetailNode):
         """Replace a given branch."""
         pass
 
+    def replace_global_nodes(self, replacements, **kwargs):
+        """Replace given branches."""
+        pass
+
     #
     # user interface functions come next
     # these functions are named after similar ones in the TreeItem example
@@ -46,6 +46,7 @@ from functools import partial
 import struct
 
 from pyffi.object_models.editable import EditableSpinBox  # for Bits
+from pyffi.object_models.xml.basic import touch
 from pyffi.utils.graph import DetailNode, EdgeFilter
 
 
@@ -114,6 +115,7 @@ class Bits(DetailNode, EditableSpinBox):
         if value >> self._numbits:
             raise ValueError('value out of range (%i)' % value)
         self._value = value
+        touch()
 
     def __str__(self):
         return str(self.get_value())
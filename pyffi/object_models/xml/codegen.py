@@ -0,0 +1,565 @@
+"""Generate Python source for the struct classes of an xml file format.
+
+The :meth:`~pyffi.object_models.xml.struct_.StructBase.read`,
+:meth:`~pyffi.object_models.xml.struct_.StructBase.write`, and
+:meth:`~pyffi.object_models.xml.struct_.StructBase.get_size` methods of
+struct classes interpret the attribute list of the class on every call.
+This module writes a module with straight-line versions of these
+methods instead, one for every range of versions for which the same
+attributes are present. User version checks and conditions are still
+evaluated, but everything else is resolved ahead of time.
+
+A format uses the generated module if its
+:attr:`~pyffi.object_models.xml.FileFormat.xml_struct_module` names it,
+and if the module was generated from the same xml file. To (re)generate
+the modules of the nif, kf, and cgf formats, run::
+
+    python -m pyffi.object_models.xml.codegen
+
+or pass the formats to generate, as ``module:class``, for instance
+``pyffi.formats.nif:NifFormat``.
+"""
+
+# --------------------------------------------------------------------------
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+# --------------------------------------------------------------------------
+
+import bisect
+import hashlib
+import importlib
+import importlib.util
+import keyword
+import os.path
+import struct
+import sys
+import tempfile
+
+from pyffi.object_models.xml.struct_ import StructBase, _get_bulk_struct
+
+CODEGEN_VERSION = 2
+"""Version of the generated code. Increase it whenever the generated
+code changes, so modules generated by an older version are no longer
+used.
+"""
+
+FORMATS = ["pyffi.formats.nif:NifFormat", "pyffi.formats.kfm:KfmFormat",
+           "pyffi.formats.cgf:CgfFormat"]
+"""The formats that are generated by default."""
+
+
+def get_xml_hash(xml_content):
+    """Get the hash which identifies the xml file, and the code
+    generator, of a generated module.
+
+    :param xml_content: The content of the xml file.
+    :type xml_content: ``str``
+    :rtype: ``str``
+    """
+    hsh = hashlib.sha1(("%i\n" % CODEGEN_VERSION).encode("utf-8"))
+    hsh.update(xml_content.encode("utf-8"))
+    return hsh.hexdigest()
+
+
+def get_struct_classes(fmt):
+    """Get the struct classes of format *fmt* for which code is
+    generated, sorted by name. Generated classes which are the base of
+    a customized class of the format are skipped, as only the
+    customized class is used.
+
+    :return: List of ``(name, class)`` tuples.
+    """
+    classes = dict(
+        (name, klass) for name, klass in fmt.__dict__.items()
+        if isinstance(klass, type) and issubclass(klass, StructBase)
+        and klass.__name__ == name and klass._attribute_list)
+    return sorted(
+        (name, klass) for name, klass in classes.items()
+        if not (name.startswith("_") and name[1:] in classes
+                and issubclass(classes[name[1:]], klass)))
+
+
+class StructModule(object):
+    """Gives access to the code of a generated module, which is only
+    imported when the code of a class is first needed.
+
+    :ivar name: The name of the module.
+    :ivar xml_hash: The hash of the xml file (see :func:`get_xml_hash`).
+    :ivar logger: The logger to report an outdated module to.
+    """
+
+    def __init__(self, name, xml_hash, logger):
+        self.name = name
+        self.xml_hash = xml_hash
+        self.logger = logger
+        self._structs = None
+        self._code = {}
+
+    def _get_structs(self):
+        """Import the module, and return its struct dictionary, or an
+        empty dictionary if the module is missing or outdated.
+        """
+        if self._structs is None:
+            self._structs = {}
+            try:
+                module = importlib.import_module(self.name)
+            except ImportError:
+                return self._structs
+            if getattr(module, "XML_HASH", None) != self.xml_hash:
+                self.logger.warning(
+                    "%s was not generated from the current xml file,"
+                    " and is not used: regenerate it with"
+                    " python -m pyffi.object_models.xml.codegen"
+                    % self.name)
+                return self._structs
+            self._structs = module.STRUCTS
+        return self._structs
+
+    def get_code(self, klass, version):
+        """Get the generated code of *klass* for *version*.
+
+        :return: Tuple ``(guards, read, write, get_size)``, where
+            ``guards`` are the indices of the attributes whose user
+            version and version condition must be checked for the
+            ``active`` argument of the functions, or ``None`` if there
+            is no code.
+        """
+        try:
+            code = self._code[klass]
+        except KeyError:
+            code = None
+            try:
+                num_attrs, factory = self._get_structs()[klass.__name__]
+            except KeyError:
+                pass
+            else:
+                # the class should not have changed, but check anyway
+                if num_attrs == len(klass._attribute_list):
+                    code = factory(klass._attribute_list)
+            self._code[klass] = code
+        if code is None:
+            return None
+        starts, ranges = code
+        return ranges[bisect.bisect_right(starts, version)]
+
+
+def bind(fmt, xml_content):
+    """Let the struct classes of *fmt* use its generated module, if
+    there is one, and if it matches *xml_content*.
+    """
+    if not fmt.xml_struct_module:
+        return
+    struct_module = StructModule(
+        fmt.xml_struct_module, get_xml_hash(xml_content), fmt.logger)
+    for name, klass in get_struct_classes(fmt):
+        klass._struct_module = struct_module
+        klass._plans = {}
+
+
+def _get_ranges(attrs, versions):
+    """Get the version ranges in which the same attributes of *attrs*
+    are present.
+
+    :return: The first version of every range but the first, and for
+        every range, one of *versions* in the range, or ``None`` if
+        the range contains none of *versions*.
+    """
+    starts = set()
+    for attr in attrs:
+        if attr.ver1 is not None:
+            starts.add(attr.ver1)
+        if attr.ver2 is not None:
+            starts.add(attr.ver2 + 1)
+    starts = sorted(starts)
+    ranges = []
+    for index in range(len(starts) + 1):
+        start = starts[index - 1] if index else None
+        end = starts[index] if index < len(starts) else None
+        present = [version for version in versions
+                   if (start is None or version >= start)
+                   and (end is None or version < end)]
+        ranges.append(present[0] if present else None)
+    return starts, ranges
+
+
+class _Generator(object):
+    """Generates the factory of a single struct class. The factory
+    takes the attribute list of the class, and returns the version
+    range starts and the code of every range (see
+    :meth:`StructModule.get_code`).
+    """
+
+    def __init__(self, factory_name, attrs, versions):
+        self.factory_name = factory_name
+        self.attrs = attrs
+        self.versions = versions
+        self.conds = set()
+        self.runs = []
+
+    def generate(self):
+        """Generate the factory, and return its lines."""
+        body = []
+        starts, versions = _get_ranges(self.attrs, self.versions)
+        ranges = []
+        for index, version in enumerate(versions):
+            if version is None:
+                # no code for versions which the format does not know
+                ranges.append("None")
+                continue
+            guards = self._generate_range(body, index, version)
+            ranges.append("(%r, read_%i, write_%i, get_size_%i)"
+                          % (guards, index, index, index))
+        if not body:
+            return []
+        lines = ["def %s(attrs):" % self.factory_name]
+        for index in sorted(self.conds):
+            lines.append("    cond_%i = attrs[%i].cond.compile()" % (index, index))
+        for name, indices in self.runs:
+            lines.append("    %s = _BulkRun([%s])" % (
+                name, ", ".join("attrs[%i]" % index for index in indices)))
+        lines.extend(body)
+        lines.append("    return %r, [" % starts)
+        for range_ in ranges:
+            lines.append("        %s," % range_)
+        lines.append("        ]")
+        lines.append("")
+        return lines
+
+    def _get_present(self, version):
+        """Get the indices of the attributes present in *version*, with
+        a guard index for those that have a user version check or a
+        version condition, and a flag index for those that can be
+        skipped because an earlier attribute with the same name is
+        present.
+
+        :return: List of ``(index, guard, flag)`` tuples, where
+            ``guard`` and ``flag`` are ``None`` if not needed, and the
+            attribute indices of all guards.
+        """
+        present = []
+        guards = []
+        # names that are certainly present, and names that may be present
+        unconditional_names = set()
+        names = {}
+        for index, attr in enumerate(self.attrs):
+            if attr.ver1 is not None and version < attr.ver1:
+                continue
+            if attr.ver2 is not None and version > attr.ver2:
+                continue
+            if attr.name in unconditional_names:
+                continue
+            guard = None
+            if attr.userver is not None or attr.vercond is not None:
+                guard = len(guards)
+                guards.append(index)
+            elif attr.cond is None:
+                unconditional_names.add(attr.name)
+            names[attr.name] = names.get(attr.name, 0) + 1
+            present.append((index, guard, attr.name))
+        flags = {}
+        result = []
+        for index, guard, name in present:
+            if names[name] > 1:
+                flag = flags.setdefault(name, len(flags))
+            else:
+                flag = None
+            result.append((index, guard, flag))
+        return result, tuple(guards)
+
+    def _is_bulk(self, attr, guard, flag):
+        """Can the attribute be part of a bulk run?"""
+        return (guard is None and flag is None and attr.cond is None
+                and attr.arr1 is None and attr.arg is None
+                and not attr.is_abstract
+                and _get_bulk_struct(attr.type_) is not None)
+
+    def _generate_range(self, body, range_index, version):
+        """Generate the functions of a version range."""
+        present, guards = self._get_present(version)
+        # split into runs of bulk attributes and single attributes
+        items = []
+        run = []
+        for index, guard, flag in present:
+            attr = self.attrs[index]
+            if self._is_bulk(attr, guard, flag):
+                run.append(index)
+                continue
+            self._add_run(items, range_index, run)
+            run = []
+            items.append((index, guard, flag))
+        self._add_run(items, range_index, run)
+        num_flags = len(set(flag for index, guard, flag in present
+                            if flag is not None))
+        for method in ("read", "write", "get_size"):
+            body.append("")
+            if method == "get_size":
+                body.append("    def get_size_%i(active, self, data):"
+                            % range_index)
+            else:
+                body.append("    def %s_%i(active, self, stream, data):"
+                            % (method, range_index))
+            lines = []
+            for flag in range(num_flags):
+                lines.append("done_%i = False" % flag)
+            if method != "get_size" and any(
+                    isinstance(index, str) for index, guard, flag in items):
+                lines.append("byte_order = data._byte_order")
+            if method == "get_size":
+                self._generate_get_size(lines, items)
+            else:
+                for item in items:
+                    self._generate_item(lines, method, item)
+            if not lines:
+                lines.append("pass")
+            body.extend("        " + line for line in lines)
+        return guards
+
+    def _add_run(self, items, range_index, run):
+        """Add *run* to *items* as a single bulk run item if it has at
+        least two attributes, and as separate items otherwise.
+        """
+        if len(run) >= 2:
+            name = "run_%i_%i" % (range_index, len(self.runs))
+            self.runs.append((name, run))
+            items.append((name, run, None))
+        else:
+            for index in run:
+                items.append((index, None, None))
+
+    def _get_value(self, index):
+        """Get the expression for the value of an attribute."""
+        return "self._%s_value_" % self.attrs[index].name
+
+    def _get_guard(self, index, guard, flag):
+        """Get the condition for an attribute to be processed, or
+        ``None`` if it is always processed.
+        """
+        attr = self.attrs[index]
+        conditions = []
+        if flag is not None:
+            conditions.append("not done_%i" % flag)
+        if guard is not None:
+            conditions.append("active[%i]" % guard)
+        if attr.cond is not None:
+            self.conds.add(index)
+            conditions.append("cond_%i(self)" % index)
+        return " and ".join(conditions) if conditions else None
+
+    def _generate_item(self, lines, method, item):
+        """Generate the code to read or write an item."""
+        index, guard, flag = item
+        if isinstance(index, str):
+            # bulk run
+            values = ", ".join("%s._value" % self._get_value(run_index)
+                               for run_index in guard)
+            if method == "read":
+                size = struct.calcsize("<" + "".join(
+                    _get_bulk_struct(self.attrs[run_index].type_)
+                    for run_index in guard))
+                lines.append("%s = %s._get_struct(byte_order).unpack("
+                             % (values, index))
+                lines.append("    stream.read(%i))" % size)
+            else:
+                lines.append("try:")
+                lines.append("    stream.write(%s._get_struct(byte_order).pack("
+                             % index)
+                lines.append("        %s))" % values)
+                lines.append("except (struct.error, OverflowError):")
+                lines.append("    %s.write(self, stream, data)" % index)
+            return
+        attr = self.attrs[index]
+        if attr.is_abstract and flag is None:
+            return
+        condition = self._get_guard(index, guard, flag)
+        indent = ""
+        if condition is not None:
+            lines.append("if %s:" % condition)
+            indent = "    "
+        if flag is not None:
+            lines.append(indent + "done_%i = True" % flag)
+        if attr.is_abstract:
+            return
+        if attr.arg is None:
+            lines.append(indent + "%s.%s(stream, data)"
+                         % (self._get_value(index), method))
+        else:
+            lines.append(indent + "value = %s" % self._get_value(index))
+            if isinstance(attr.arg, str):
+                lines.append(indent + "value.arg = self.%s" % attr.arg)
+            else:
+                lines.append(indent + "value.arg = %r" % attr.arg)
+            lines.append(indent + "value.%s(stream, data)" % method)
+
+    def _generate_get_size(self, lines, items):
+        """Generate the code to calculate the size of all items."""
+        size = 0
+        sizes = []
+        for index, guard, flag in items:
+            if isinstance(index, str):
+                size += struct.calcsize("<" + "".join(
+                    _get_bulk_struct(self.attrs[run_index].type_)
+                    for run_index in guard))
+                continue
+            attr = self.attrs[index]
+            if attr.is_abstract and flag is None:
+                continue
+            # the size of fixed size basic types is known in advance
+            fmt = (_get_bulk_struct(attr.type_) if attr.arr1 is None
+                   else None)
+            if fmt is not None:
+                attr_size = "%i" % struct.calcsize("<" + fmt)
+            else:
+                attr_size = "%s.get_size(data)" % self._get_value(index)
+            condition = self._get_guard(index, guard, flag)
+            if condition is None:
+                if fmt is not None:
+                    size += struct.calcsize("<" + fmt)
+                else:
+                    sizes.append("size += %s" % attr_size)
+                continue
+            sizes.append("if %s:" % condition)
+            if flag is not None:
+                sizes.append("    done_%i = True" % flag)
+            if not attr.is_abstract:
+                sizes.append("    size += %s" % attr_size)
+        lines.append("size = %i" % size)
+        lines.extend(sizes)
+        lines.append("return size")
+
+
+def _check_names(klass):
+    """Check that the names of all attributes can be used in the
+    generated code.
+    """
+    return all(("_%s_value_" % attr.name).isidentifier()
+               and (not isinstance(attr.arg, str)
+                    or (attr.arg.isidentifier()
+                        and not keyword.iskeyword(attr.arg)))
+               for attr in klass._attribute_list)
+
+
+def generate(fmt):
+    """Generate the module source for format *fmt*.
+
+    :param fmt: The format.
+    :type fmt: subclass of :class:`pyffi.object_models.xml.FileFormat`
+    :return: The source.
+    :rtype: ``str``
+    """
+    xml_file = fmt.openfile(fmt.xml_file_name, fmt.xml_file_path)
+    try:
+        xml_content = xml_file.read()
+    finally:
+        xml_file.close()
+    versions = sorted(set(fmt.versions.values()))
+    lines = [
+        '"""Code generated from %s by pyffi.object_models.xml.codegen.'
+        % fmt.xml_file_name,
+        "",
+        "Do not edit: regenerate it with",
+        "python -m pyffi.object_models.xml.codegen instead.",
+        '"""',
+        "",
+        "import struct",
+        "",
+        "from pyffi.object_models.xml.struct_ import _BulkRun",
+        "",
+        "XML_HASH = %r" % get_xml_hash(xml_content),
+        "",
+        ]
+    structs = []
+    for index, (name, klass) in enumerate(get_struct_classes(fmt)):
+        if not _check_names(klass):
+            continue
+        factory_name = "_struct_%i" % index
+        factory = _Generator(
+            factory_name, klass._attribute_list, versions).generate()
+        if factory:
+            lines.append("")
+            lines.extend(factory)
+            structs.append((name, len(klass._attribute_list), factory_name))
+    lines.append("")
+    lines.append("STRUCTS = {")
+    for name, num_attrs, factory_name in structs:
+        lines.append("    %r: (%i, %s)," % (name, num_attrs, factory_name))
+    lines.append("    }")
+    return "\n".join(lines) + "\n"
+
+
+def get_module_file_name(fmt):
+    """Get the file name of the generated module of *fmt*."""
+    package, _, name = fmt.xml_struct_module.rpartition(".")
+    spec = importlib.util.find_spec(package)
+    return os.path.join(
+        list(spec.submodule_search_locations)[0], name + ".py")
+
+
+def write_module(fmt, file_name=None):
+    """Generate the module for format *fmt*, and write it.
+
+    :param file_name: The file to write, by default the file of the
+        module named by the
+        :attr:`~pyffi.object_models.xml.FileFormat.xml_struct_module`
+        attribute of the format.
+    :return: The file name.
+    """
+    if file_name is None:
+        file_name = get_module_file_name(fmt)
+    source = generate(fmt)
+    # write to a temporary file and rename it, so the module is never
+    # imported while it is partially written
+    with tempfile.NamedTemporaryFile(
+            "w", dir=os.path.dirname(os.path.abspath(file_name)),
+            suffix=".tmp", delete=False) as stream:
+        stream.write(source)
+    os.chmod(stream.name, 0o644)
+    os.replace(stream.name, file_name)
+    return file_name
+
+
+def main(args=None):
+    """Generate the modules of the formats in *args*, as
+    ``module:class``, or of :data:`FORMATS` by default.
+    """
+    for format_name in (args or FORMATS):
+        module_name, _, class_name = format_name.partition(":")
+        fmt = getattr(importlib.import_module(module_name), class_name)
+        print("%s: %s" % (format_name, write_module(fmt)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
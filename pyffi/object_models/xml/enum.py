@@ -41,7 +41,7 @@ import logging
 import struct
 
 from pyffi.object_models import FileFormat as snakeCase
-from pyffi.object_models.xml.basic import BasicBase
+from pyffi.object_models.xml.basic import BasicBase, touch
 from pyffi.object_models.editable import EditableComboBox
 
 class _MetaEnumBase(type):
@@ -49,6 +49,12 @@ class _MetaEnumBase(type):
     and _numbytes attributes. It also adds enum class attributes.
 
     Used as metaclass of EnumBase."""
+    def __new__(metacls, name, bases, dct):
+        # instances only hold their value (see BasicBase)
+        dct.setdefault("__slots__", ())
+        return super(_MetaEnumBase, metacls).__new__(
+            metacls, name, bases, dct)
+
     def __init__(cls, name, bases, dct):
         super(_MetaEnumBase, cls).__init__(name, bases, dct)
         # consistency checks
@@ -158,6 +164,7 @@ class EnumBase(BasicBase, EditableComboBox, metaclass=_MetaEnumBase):
                          % (val, self.__class__.__name__))
         else:
             self._value = val
+            touch()
 
     def read(self, stream, data):
         """Read value from stream."""
@@ -40,6 +40,7 @@
 # ***** END LICENSE BLOCK *****
 # --------------------------------------------------------------------------
 
+import keyword
 import re
 import sys  # stderr (for debugging)
 
@@ -78,6 +79,12 @@ class Expression(object):
     operators = set(('==', '!=', '>=', '<=', '&&', '||', '&', '|', '-', '!',
                      '<', '>', '/', '*', '+'))
 
+    #: Python operator for each operator, used when compiling.
+    _python_operators = {
+        '==': '==', '!=': '!=', '>=': '>=', '<=': '<=', '&&': 'and',
+        '||': 'or', '&': '&', '|': '|', '-': '-', '<': '<', '>': '>',
+        '/': '/', '*': '*', '+': '+'}
+
     def __init__(self, expr_str, name_filter=None):
         try:
             left, self._op, right = self._partition(expr_str)
@@ -88,75 +95,82 @@ class Expression(object):
             raise
 
     def eval(self, data=None):
-        """Evaluate the expression to an integer."""
+        """Evaluate the expression to an integer.
 
-        if isinstance(self._left, Expression):
-            left = self._left.eval(data)
-        elif isinstance(self._left, str):
-            if self._left == '""':
-                left = ""
-            else:
-                left = data
-                for part in self._left.split("."):
-                    left = getattr(left, part)
-        elif isinstance(self._left, type):
-            left = isinstance(data, self._left)
-        elif self._left is None:
-            pass
-        else:
-            assert (isinstance(self._left, int))  # debug
-            left = self._left
+        The expression is compiled on first evaluation (see
+        :meth:`compile`), and the compiled function then replaces this
+        method on the instance, so further evaluations call it directly.
+        """
+        return self.compile()(data)
+
+    def compile(self):
+        """Return a function which evaluates the expression, taking the
+        data as (optional) argument. All operators are resolved, and
+        attribute paths are split, when the function is compiled, on
+        first call. The right hand side of ``&&`` and ``||`` is only
+        evaluated if needed.
+
+        >>> class A(object):
+        ...     x = 2
+        >>> Expression('(x + 1) * 3').compile()(A())
+        9
+        """
+        function = self.__dict__.get("eval")
+        if function is None:
+            namespace = {"_getattr": getattr, "_isinstance": isinstance}
+            function = self.eval = eval(
+                "lambda data=None: " + self._get_source(namespace),
+                namespace)
+        return function
 
+    def _get_source(self, namespace):
+        """Python source of the expression, for :meth:`compile`.
+        Objects which cannot be written as literals are added to
+        *namespace*."""
+        if self._op == '!':
+            return "(not %s)" % self._get_operand_source(
+                self._right, namespace, split=False)
+        left = self._get_operand_source(self._left, namespace, split=True)
         if not self._op:
             return left
+        try:
+            op = self._python_operators[self._op]
+        except KeyError:
+            raise NotImplementedError("expression syntax error: operator '" + self._op + "' not implemented")
+        right = self._get_operand_source(self._right, namespace, split=False)
+        return "(%s %s %s)" % (left, op, right)
 
-        if isinstance(self._right, Expression):
-            right = self._right.eval(data)
-        elif isinstance(self._right, str):
-            if (not self._right) or self._right == '""':
-                right = ""
-            else:
-                right = getattr(data, self._right)
-        elif isinstance(self._right, type):
-            right = isinstance(data, self._right)
-        elif self._right is None:
-            pass
+    @staticmethod
+    def _get_operand_source(operand, namespace, split):
+        """Python source of an operand. Attribute paths are only split
+        on dots if *split* is ``True`` (as for the left hand side)."""
+        if isinstance(operand, Expression):
+            return operand._get_source(namespace)
+        elif isinstance(operand, str):
+            if (not operand) or operand == '""':
+                return '""'
+            source = "data"
+            for part in (operand.split(".") if split else [operand]):
+                if part.isidentifier() and not keyword.iskeyword(part):
+                    source += "." + part
+                else:
+                    source = "_getattr(%s, %r)" % (source, part)
+            return source
+        elif isinstance(operand, type):
+            name = "_type_%i" % len(namespace)
+            namespace[name] = operand
+            return "_isinstance(data, %s)" % name
+        elif operand is None:
+            return "None"
         else:
-            assert (isinstance(self._right, int))  # debug
-            right = self._right
+            assert (isinstance(operand, int))  # debug
+            return repr(operand)
 
-        if self._op == '==':
-            return left == right
-        elif self._op == '!=':
-            return left != right
-        elif self._op == '>=':
-            return left >= right
-        elif self._op == '<=':
-            return left <= right
-        elif self._op == '&&':
-            return left and right
-        elif self._op == '||':
-            return left or right
-        elif self._op == '&':
-            return left & right
-        elif self._op == '|':
-            return left | right
-        elif self._op == '-':
-            return left - right
-        elif self._op == '!':
-            return not (right)
-        elif self._op == '>':
-            return left > right
-        elif self._op == '<':
-            return left < right
-        elif self._op == '/':
-            return left / right
-        elif self._op == '*':
-            return left * right
-        elif self._op == '+':
-            return left + right
-        else:
-            raise NotImplementedError("expression syntax error: operator '" + self._op + "' not implemented")
+    def __getstate__(self):
+        # the compiled function cannot be pickled
+        state = self.__dict__.copy()
+        state.pop("eval", None)
+        return state
 
     def __str__(self):
         """Reconstruct the expression to a string."""
@@ -339,6 +353,8 @@ class Expression(object):
         return start_pos, end_pos
 
     def map_(self, func):
+        # the expression must be compiled again
+        self.__dict__.pop("eval", None)
         if isinstance(self._left, Expression):
             self._left.map_(func)
         else:
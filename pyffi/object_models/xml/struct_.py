@@ -42,6 +42,7 @@
 # note: some imports are defined at the end to avoid problems with circularity
 import logging
 from functools import partial
+import struct
 
 
 from pyffi.utils.graph import DetailNode, GlobalNode, EdgeFilter
@@ -53,6 +54,24 @@ class _MetaStructBase(type):
     <attrname> property is generated which gets and sets basic types,
     and gets other types (struct and array). Used as metaclass of
     StructBase."""
+    def __new__(metacls, name, bases, dct):
+        # store attribute values in slots, rather than in the instance
+        # dictionary, as this takes much less memory
+        if "__slots__" not in dct:
+            value_names = set()
+            for base in bases:
+                for attr in getattr(base, "_attribute_list", ()):
+                    value_names.add("_%s_value_" % attr.name)
+            slots = []
+            for attr in dct.get("_attrs", ()):
+                value_name = "_%s_value_" % attr.name
+                if value_name not in value_names:
+                    value_names.add(value_name)
+                    slots.append(value_name)
+            dct["__slots__"] = tuple(slots)
+        return super(_MetaStructBase, metacls).__new__(
+            metacls, name, bases, dct)
+
     def __init__(cls, name, bases, dct):
         super(_MetaStructBase, cls).__init__(name, bases, dct)
         # does the type contain a Ref or a Ptr?
@@ -134,9 +153,237 @@ class _MetaStructBase(type):
         # precalculate the attribute name list
         cls._names = cls._get_names()
 
+        # attribute for each instance variable holding an attribute
+        # value, for instantiating values on first access
+        # (see StructBase.__getattr__)
+        cls._value_attributes = {}
+        for attr in cls._attribute_list:
+            cls._value_attributes.setdefault("_%s_value_" % attr.name, attr)
+
+        # compiled attribute plans, one per version (see StructBase._get_plan)
+        # note: must be reset for every class, as the xml handler recreates
+        # customized classes from the dictionary of the original class
+        cls._plans = {}
+
+        # generated code is only bound to the classes of the format
+        # (see pyffi.object_models.xml.codegen), not to their subclasses
+        cls._struct_module = None
+
     def __repr__(cls):
         return "<struct '%s'>"%(cls.__name__)
 
+def _get_bulk_struct(attr_type):
+    """Return the :mod:`struct` format character of *attr_type* if its
+    instances can be read and written in bulk, that is, if *attr_type*
+    is a fixed size basic type which simply packs and unpacks its
+    ``_value``, without any custom read or write method. Return
+    ``None`` otherwise.
+    """
+    if isinstance(attr_type, str) or not issubclass(attr_type, BasicBase):
+        return None
+    for base in (pyffi.object_models.common.Int,
+                 pyffi.object_models.common.Float,
+                 EnumBase):
+        if (issubclass(attr_type, base)
+            and attr_type.read is base.read
+            and attr_type.write is base.write):
+            return attr_type._struct
+    return None
+
+class _BulkRun(object):
+    """A run of consecutive unconditional fixed size basic attributes,
+    which are read and written with a single precompiled
+    :class:`struct.Struct` call.
+
+    :ivar value_names: Names of the instance variables holding the
+        attribute values.
+    :ivar format: The :mod:`struct` format characters of the run,
+        without byte order.
+    :ivar size: Number of bytes of the run.
+    """
+
+    __slots__ = ("value_names", "format", "size", "_structs")
+
+    def __init__(self, attrs):
+        self.value_names = tuple("_%s_value_" % attr.name for attr in attrs)
+        self.format = "".join(_get_bulk_struct(attr.type_) for attr in attrs)
+        self._structs = {}
+        self.size = self._get_struct("<").size
+
+    def _get_struct(self, byte_order):
+        """Get precompiled struct for the given byte order."""
+        try:
+            return self._structs[byte_order]
+        except KeyError:
+            result = self._structs[byte_order] = struct.Struct(
+                byte_order + self.format)
+            return result
+
+    def read(self, instance, stream, data):
+        """Read all attributes of the run into *instance*."""
+        values = self._get_struct(data._byte_order).unpack(
+            stream.read(self.size))
+        for value_name, value in zip(self.value_names, values):
+            getattr(instance, value_name)._value = value
+
+    def write(self, instance, stream, data):
+        """Write all attributes of the run from *instance*."""
+        try:
+            stream.write(self._get_struct(data._byte_order).pack(
+                *[getattr(instance, value_name)._value
+                  for value_name in self.value_names]))
+        except (struct.error, OverflowError):
+            # let the basic types deal with (or report) the error
+            for value_name in self.value_names:
+                getattr(instance, value_name).write(stream, data)
+
+def _check_user_version(attr, data):
+    """Check the user version and the version condition of *attr* for
+    the version of *data*."""
+    if (attr.userver is not None and data.user_version is not None
+        and data.user_version != attr.userver):
+        return False
+    if (data.version is not None and data.user_version is not None
+        and attr.vercond is not None):
+        if not attr.vercond.eval(data):
+            return False
+    return True
+
+class _AttributePlan(object):
+    """The attributes of a struct class that are active for a
+    particular version. All ver1, ver2, userver, and vercond checks
+    have been resolved when the plan is compiled, so only the
+    conditions that depend on runtime fields (cond and arg) remain
+    to be evaluated.
+
+    :ivar attrs: The active attributes, in order.
+    :ivar dups: Names of active attributes that occur more than once,
+        and whose duplicates must still be skipped at runtime (this is
+        only needed when an earlier attribute with the same name has a
+        condition).
+    :ivar io: Tuple of ``(attr, value_name, arg_name, dup)`` for all
+        active attributes that are read and written, where
+        ``value_name`` is the name of the instance variable holding the
+        attribute value, ``arg_name`` is the name of the attribute
+        holding the argument (or ``None`` if the argument is constant),
+        and ``dup`` flags names in :attr:`dups`. Abstract attributes
+        are only listed if their name is in :attr:`dups`. Runs of
+        consecutive unconditional fixed size basic attributes are
+        replaced by a single ``(run, None, None, False)`` entry, where
+        ``run`` is a :class:`_BulkRun`.
+    :ivar refs: The active attributes which can hold references, for
+        :meth:`StructBase.get_refs`, or ``None`` if duplicate names must
+        be resolved first.
+    :ivar init: Tuple of ``(attr, value_name)`` for the attributes whose
+        value is instantiated by :meth:`StructBase.__init__`, one per
+        name. Inactive attributes are left out if their value can be
+        instantiated in the same way on first access, that is, if it
+        does not depend on the other attributes.
+    :ivar init_arrays: Tuple of ``(attr, value_name)`` for the inactive
+        arrays, which are only instantiated by
+        :meth:`StructBase.__init__` if they are not empty.
+    :ivar read: Generated function which reads the structure, taking
+        the structure, stream, and data as arguments, or ``None`` if
+        there is no generated code for the class and version (see
+        :mod:`pyffi.object_models.xml.codegen`).
+    :ivar write: Generated function which writes the structure, or
+        ``None``.
+    :ivar get_size: Generated function which calculates the size of the
+        structure, taking the structure and data as arguments, or
+        ``None``.
+    """
+
+    __slots__ = ("attrs", "dups", "io", "refs", "init", "init_arrays",
+                 "read", "write", "get_size")
+
+    def __init__(self, klass, data=None):
+        if data is not None:
+            version = data.version
+            user_version = data.user_version
+        else:
+            version = None
+            user_version = None
+        # names of attributes which are always active
+        # (later attributes with the same name can be dropped)
+        unconditional_names = set()
+        # names of attributes which may be active
+        names = set()
+        self.dups = set()
+        self.attrs = []
+        for attr in klass._attribute_list:
+            if version is not None:
+                if attr.ver1 is not None and version < attr.ver1:
+                    continue
+                if attr.ver2 is not None and version > attr.ver2:
+                    continue
+            if data is not None and not _check_user_version(attr, data):
+                continue
+            if attr.name in unconditional_names:
+                continue
+            if attr.name in names:
+                self.dups.add(attr.name)
+            names.add(attr.name)
+            if attr.cond is None:
+                unconditional_names.add(attr.name)
+            self.attrs.append(attr)
+        init = []
+        init_arrays = []
+        for value_name, attr in klass._value_attributes.items():
+            if (attr.name in names or attr.type_ is type(None)
+                or attr.template is type(None)
+                or isinstance(attr.arg, str)):
+                init.append((attr, value_name))
+            elif attr.arr1 is not None:
+                init_arrays.append((attr, value_name))
+        self.init = tuple(init)
+        self.init_arrays = tuple(init_arrays)
+        io = []
+        run = []
+        for attr in self.attrs:
+            if attr.is_abstract and attr.name not in self.dups:
+                continue
+            if (attr.cond is None and attr.arr1 is None
+                and attr.arg is None and not attr.is_abstract
+                and attr.name not in self.dups
+                and _get_bulk_struct(attr.type_)):
+                run.append(attr)
+                continue
+            self._add_run(io, run)
+            run = []
+            io.append((attr, "_%s_value_" % attr.name,
+                       attr.arg if isinstance(attr.arg, str) else None,
+                       attr.name in self.dups))
+        self._add_run(io, run)
+        self.io = tuple(io)
+        refs = [attr for attr in self.attrs
+                if attr.type_ is type(None) or attr.type_._has_links]
+        if any(attr.name in self.dups for attr in refs):
+            self.refs = None
+        else:
+            self.refs = tuple(refs)
+        self.read = self.write = self.get_size = None
+        if (version is not None and user_version is not None
+            and klass._struct_module is not None):
+            code = klass._struct_module.get_code(klass, version)
+            if code is not None:
+                guards, read, write, get_size = code
+                active = tuple(
+                    _check_user_version(klass._attribute_list[index], data)
+                    for index in guards)
+                self.read = partial(read, active)
+                self.write = partial(write, active)
+                self.get_size = partial(get_size, active)
+
+    @staticmethod
+    def _add_run(io, run):
+        """Append the attributes in *run* to *io*, as a single
+        :class:`_BulkRun` if there are at least two of them."""
+        if len(run) >= 2:
+            io.append((_BulkRun(run), None, None, False))
+        else:
+            for attr in run:
+                io.append((attr, "_%s_value_" % attr.name, None, False))
+
 class StructBase(GlobalNode, metaclass=_MetaStructBase):
     """Base class from which all file struct types are derived.
 
@@ -222,13 +469,50 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
     """
 
     _is_template = False
+    # the values of the attributes are stored in slots, which the
+    # metaclass adds to every derived class; the instance dictionary is
+    # only created when needed, for instance for _pristine
+    __slots__ = ("arg", "__dict__", "__weakref__")
+
     _attrs = []
     _games = {}
-    arg = None
     logger = logging.getLogger("pyffi.nif.data.struct")
 
+    _use_plans = True
+    """If ``True``, the active attributes are taken from a plan that is
+    compiled once per class and version (see :meth:`_get_plan`). Set to
+    ``False`` to use the reference implementation, which checks all
+    version conditions of every attribute on every call. The reference
+    implementation is also used for reading and writing when the logger
+    is set to debug level, so every attribute is logged.
+    """
+
+    _struct_module = None
+    """The :class:`~pyffi.object_models.xml.codegen.StructModule` with
+    the generated code of this class, if any. The generated code is used
+    instead of the plans for reading, writing, and calculating the size.
+    """
+
+    _pristine = None
+    """Set by file formats that keep the bytes from which the structure
+    was read, so it can be written back by copying these bytes. It is
+    removed as soon as the structure might change: when any attribute
+    is set, when any attribute that is not of a basic type is accessed
+    (as it could be changed in place), and when
+    :meth:`replace_global_node` replaces one of its links.
+    """
+
+    _deferred_complete = None
+    """Set on instances whose initialization is deferred (see
+    :meth:`_deferred`), until they are completed."""
+
+    _hash_cache = None
+    """Cached result of :meth:`_get_hash_parts`, along with the
+    generation and plan for which it was calculated."""
+
     # initialize all attributes
-    def __init__(self, template = None, argument = None, parent = None):
+    def __init__(self, template = None, argument = None, parent = None,
+                 data = None):
         """The constructor takes a tempate: any attribute whose type,
         or template type, is type(None) - which corresponds to
         TEMPLATE in the xml description - will be replaced by this
@@ -239,62 +523,130 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         :param argument: If the class takes a type argument, then
             it is described here.
         :param parent: The parent of this instance, that is, the instance this
-            array is an attribute of."""
-        # used to track names of attributes that have already been added
-        # is faster than self.__dict__.has_key(...)
-        names = set()
+            array is an attribute of.
+        :param data: If given, then attributes which are not active for
+            the version of *data* are only instantiated on first access
+            (see :meth:`__getattr__`)."""
         # initialize argument
         self.arg = argument
         # save parent (note: disabled for performance)
         #self._parent = weakref.ref(parent) if parent else None
-        # initialize item list
-        # this list is used for instance by qskope to display the structure
-        # in a tree view
-        self._items = []
         # initialize attributes
-        for attr in self._attribute_list:
-            # skip attributes with dupiclate names
-            # (for this to work properly, duplicates must have the same
-            # type, template, argument, arr1, and arr2)
-            if attr.name in names:
-                continue
-            names.add(attr.name)
-
-            # things that can only be determined at runtime (rt_xxx)
-            rt_type = attr.type_ if attr.type_ != type(None) \
+        # (attributes with duplicate names are only instantiated once:
+        # for this to work properly, duplicates must have the same type,
+        # template, argument, arr1, and arr2)
+        plan = self._get_plan(data)
+        for attr, value_name in plan.init:
+            setattr(self, value_name,
+                    self._create_attribute_value(attr, template, data))
+        for attr, value_name in plan.init_arrays:
+            if attr.arr1.eval(self):
+                setattr(self, value_name,
+                        self._create_attribute_value(attr, template, data))
+
+    def _create_attribute_value(self, attr, template = None, data = None):
+        """Instantiate the value of an attribute.
+
+        :param attr: The attribute.
+        :param template: The template type of this instance.
+        :param data: If given, struct values only instantiate their
+            attributes which are active for the version of *data*.
+        """
+        # things that can only be determined at runtime (rt_xxx)
+        rt_type = attr.type_ if attr.type_ != type(None) \
+                  else template
+        rt_template = attr.template if attr.template != type(None) \
                       else template
-            rt_template = attr.template if attr.template != type(None) \
-                          else template
-            rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
-                     else getattr(self, attr.arg)
+        rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
+                 else getattr(self, attr.arg)
 
-            # instantiate the class, handling arrays at the same time
-            if attr.arr1 == None:
+        # instantiate the class, handling arrays at the same time
+        if attr.arr1 == None:
+            if data is not None and issubclass(rt_type, StructBase):
                 attr_instance = rt_type(
                     template = rt_template, argument = rt_arg,
-                    parent = self)
-                if attr.default != None:
-                    attr_instance.set_value(attr.default)
-            elif attr.arr2 == None:
-                attr_instance = Array(
-                    element_type = rt_type,
-                    element_type_template = rt_template,
-                    element_type_argument = rt_arg,
-                    count1 = attr.arr1,
-                    parent = self)
+                    parent = self, data = data)
             else:
-                attr_instance = Array(
-                    element_type = rt_type,
-                    element_type_template = rt_template,
-                    element_type_argument = rt_arg,
-                    count1 = attr.arr1, count2 = attr.arr2,
+                attr_instance = rt_type(
+                    template = rt_template, argument = rt_arg,
                     parent = self)
+            if attr.default != None:
+                attr_instance.set_value(attr.default)
+        elif attr.arr2 == None:
+            attr_instance = Array(
+                element_type = rt_type,
+                element_type_template = rt_template,
+                element_type_argument = rt_arg,
+                count1 = attr.arr1,
+                parent = self)
+        else:
+            attr_instance = Array(
+                element_type = rt_type,
+                element_type_template = rt_template,
+                element_type_argument = rt_arg,
+                count1 = attr.arr1, count2 = attr.arr2,
+                parent = self)
+        return attr_instance
+
+    @classmethod
+    def _deferred(cls, complete):
+        """Create an instance whose initialization is deferred until any
+        of its instance attributes is first accessed. Until then, only
+        class attributes (such as methods, and the class itself for
+        ``isinstance`` checks) are available.
+
+        :param complete: Function which takes the instance as argument,
+            and which must initialize it (and typically also read it).
+        """
+        instance = cls.__new__(cls)
+        instance._deferred_complete = complete
+        return instance
 
-            # assign attribute value
-            setattr(self, "_%s_value_" % attr.name, attr_instance)
+    def _complete_deferred(self):
+        """Complete the instance if it was deferred (see
+        :meth:`_deferred`). If completing fails, then the instance is
+        left deferred, so it is never mistaken for a completed one.
 
-            # add instance to item list
-            self._items.append(attr_instance)
+        :return: ``True`` if the instance was deferred.
+        :rtype: ``bool``
+        """
+        complete = self.__dict__.pop("_deferred_complete", None)
+        if complete is None:
+            return False
+        try:
+            complete(self)
+        except:
+            # forget the values of the partial initialization
+            for cls in self.__class__.__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    if slot not in ("__dict__", "__weakref__"):
+                        try:
+                            object.__delattr__(self, slot)
+                        except AttributeError:
+                            pass
+            self.__dict__.clear()
+            self._deferred_complete = complete
+            raise
+        return True
+
+    def __getattr__(self, name):
+        # only called if normal attribute lookup fails:
+        # complete the instance if it was deferred, and try again
+        if self._complete_deferred():
+            return getattr(self, name)
+        # instantiate attribute values which were skipped on
+        # initialization because they were not active (see __init__)
+        attr = self._value_attributes.get(name)
+        if attr is None:
+            raise AttributeError(
+                "'%s' object has no attribute '%s'"
+                % (self.__class__.__name__, name))
+        value = self._create_attribute_value(attr)
+        if attr.arr1 is not None:
+            # arrays were empty when they were skipped
+            del value[:]
+        setattr(self, name, value)
+        return value
 
     def deepcopy(self, block):
         """Copy attributes from a given block (one block class must be a
@@ -317,7 +669,8 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 attrvalue.deepcopy(getattr(block, attr.name))
             else:
                 setattr(self, attr.name, getattr(block, attr.name))
-
+        if self._pristine is not None:
+            del self._pristine
         return self
 
     # string of all attributes
@@ -356,6 +709,32 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def read(self, stream, data):
         """Read structure from stream."""
+        # cached digests of the old values no longer apply
+        basic.touch()
+        if self._use_plans and not self.logger.isEnabledFor(logging.DEBUG):
+            plan = self._get_plan(data)
+            if plan.read is not None:
+                plan.read(self, stream, data)
+                return
+            names = set()
+            for attr, value_name, arg_name, dup in plan.io:
+                if value_name is None:
+                    attr.read(self, stream, data)
+                    continue
+                if attr.cond is not None and not attr.cond.eval(self):
+                    continue
+                if dup:
+                    if attr.name in names:
+                        continue
+                    names.add(attr.name)
+                    if attr.is_abstract:
+                        continue
+                attr_value = getattr(self, value_name)
+                if attr.arg is not None:
+                    attr_value.arg = (attr.arg if arg_name is None
+                                      else getattr(self, arg_name))
+                attr_value.read(stream, data)
+            return
         # read all attributes
         for attr in self._get_filtered_attribute_list(data):
             # skip abstract attributes
@@ -366,7 +745,8 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 else getattr(self, attr.arg)
             # read the attribute
             attr_value = getattr(self, "_%s_value_" % attr.name)
-            attr_value.arg = rt_arg
+            if rt_arg is not None:
+                attr_value.arg = rt_arg
             # if hasattr(attr, "type_"):
             #     attr_value._elementType = attr.type_
             self._log_struct(stream, attr)
@@ -375,6 +755,30 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def write(self, stream, data):
         """Write structure to stream."""
+        if self._use_plans and not self.logger.isEnabledFor(logging.DEBUG):
+            plan = self._get_plan(data)
+            if plan.write is not None:
+                plan.write(self, stream, data)
+                return
+            names = set()
+            for attr, value_name, arg_name, dup in plan.io:
+                if value_name is None:
+                    attr.write(self, stream, data)
+                    continue
+                if attr.cond is not None and not attr.cond.eval(self):
+                    continue
+                if dup:
+                    if attr.name in names:
+                        continue
+                    names.add(attr.name)
+                    if attr.is_abstract:
+                        continue
+                attr_value = getattr(self, value_name)
+                if attr.arg is not None:
+                    attr_value.arg = (attr.arg if arg_name is None
+                                      else getattr(self, arg_name))
+                attr_value.write(stream, data)
+            return
         # write all attributes
         for attr in self._get_filtered_attribute_list(data):
             # skip abstract attributes
@@ -385,7 +789,8 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                      else getattr(self, attr.arg)
             # write the attribute
             attr_value = getattr(self, "_%s_value_" % attr.name)
-            attr_value.arg = rt_arg
+            if rt_arg is not None:
+                attr_value.arg = rt_arg
             getattr(self, "_%s_value_" % attr.name).write(stream, data)
             self._log_struct(stream, attr)
 
@@ -436,6 +841,15 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         get_links, as get_links could result in infinite recursion."""
         # get all refs
         refs = []
+        if self._use_plans:
+            plan = self._get_plan(data)
+            if plan.refs is not None:
+                # only check the conditions of attributes with links
+                for attr in plan.refs:
+                    if attr.cond is None or attr.cond.eval(self):
+                        refs.extend(getattr(
+                            self, "_%s_value_" % attr.name).get_refs(data))
+                return refs
         for attr in self._get_filtered_attribute_list(data):
             # check if there are any links at all
             # (this speeds things up considerably)
@@ -449,6 +863,26 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def get_size(self, data=None):
         """Calculate the structure size in bytes."""
+        if self._use_plans:
+            plan = self._get_plan(data)
+            if plan.get_size is not None:
+                return plan.get_size(self, data)
+            size = 0
+            names = set()
+            for attr, value_name, arg_name, dup in plan.io:
+                if value_name is None:
+                    size += attr.size
+                    continue
+                if attr.cond is not None and not attr.cond.eval(self):
+                    continue
+                if dup:
+                    if attr.name in names:
+                        continue
+                    names.add(attr.name)
+                    if attr.is_abstract:
+                        continue
+                size += getattr(self, value_name).get_size(data)
+            return size
         # calculate size
         size = 0
         for attr in self._get_filtered_attribute_list(data):
@@ -467,7 +901,49 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 getattr(self, "_%s_value_" % attr.name).get_hash(data))
         return tuple(hsh)
 
+    def get_hash_digest(self, data=None):
+        """Calculate a compact hash for the structure, as a 64 bit
+        integer. Structures with equal hashes (see :meth:`get_hash`)
+        have equal digests. The digest is calculated only once, and is
+        cached until any value is changed (see
+        :func:`~pyffi.object_models.xml.basic.touch`).
+        """
+        return self._get_hash_parts(data)[1]
+
+    def _get_hash_parts(self, data=None):
+        """Return the hash of every attribute, with the digest of structure
+        and array attributes rather than their full hash, along with the
+        digest of these parts. The result is cached.
+        """
+        plan = self._get_plan(data)
+        cache = self._hash_cache
+        if (cache is not None and cache[0] == basic._generation
+            and cache[1] is plan):
+            return cache[2]
+        if self.__class__.get_hash is not StructBase.get_hash:
+            # custom hash
+            parts = (self.get_hash(data),)
+        else:
+            parts = []
+            for attr in self._get_filtered_attribute_list(data):
+                value = getattr(self, "_%s_value_" % attr.name)
+                if isinstance(value, (StructBase, Array)):
+                    parts.append(value.get_hash_digest(data))
+                else:
+                    parts.append(value.get_hash(data))
+            parts = tuple(parts)
+        result = (parts, basic.get_digest(parts))
+        self._hash_cache = (basic._generation, plan, result)
+        return result
+
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
+        # note: get_links parses a deferred structure, which may then
+        # become pristine
+        if (self._deferred_complete is not None
+            or self._pristine is not None) and any(
+                link is oldbranch for link in self.get_links()):
+            if self._pristine is not None:
+                del self._pristine
         for attr in self._get_filtered_attribute_list():
             # check if there are any links at all
             # (this speeds things up considerably)
@@ -476,6 +952,19 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
             getattr(self, "_%s_value_" % attr.name).replace_global_node(
                 oldbranch, newbranch, **kwargs)
 
+    def replace_global_nodes(self, replacements, **kwargs):
+        # see replace_global_node
+        if (self._deferred_complete is not None
+            or self._pristine is not None) and any(
+                link in replacements for link in self.get_links()):
+            if self._pristine is not None:
+                del self._pristine
+        for attr in self._get_filtered_attribute_list():
+            if not attr.type_._has_links:
+                continue
+            getattr(self, "_%s_value_" % attr.name).replace_global_nodes(
+                replacements, **kwargs)
+
     @classmethod
     def get_games(cls):
         """Get games for which this block is supported."""
@@ -490,10 +979,11 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
     def _get_attribute_list(cls):
         """Calculate the list of all attributes of this structure."""
         # string of attributes of base classes of cls
+        # (which are precalculated when the base classes are created)
         attrs = []
         for base in cls.__bases__:
             try:
-                attrs.extend(base._get_attribute_list())
+                attrs.extend(base._attribute_list)
             except AttributeError: # when base class is "object"
                 pass
         attrs.extend(cls._attrs)
@@ -507,7 +997,7 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         names = []
         for base in cls.__bases__:
             try:
-                names.extend(base._get_names())
+                names.extend(base._names)
             except AttributeError: # when base class is "object"
                 pass
         for attr in cls._attrs:
@@ -517,6 +1007,29 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 names.append(attr.name)
         return names
 
+    @classmethod
+    def _get_plan(cls, data=None):
+        """Get the compiled attribute plan of this class for the version
+        of *data*. The plan is compiled on first use, and cached for all
+        further calls with the same version, user version, and user
+        version 2 (vercond expressions must only depend on these).
+
+        :param data: The data whose version is used, or ``None`` to
+            skip all version checks.
+        :return: The plan.
+        :rtype: :class:`_AttributePlan`
+        """
+        if data is None:
+            key = None
+        else:
+            key = (data.version, data.user_version,
+                   getattr(data, "user_version_2", None))
+        try:
+            return cls._plans[key]
+        except KeyError:
+            plan = cls._plans[key] = _AttributePlan(cls, data)
+            return plan
+
     def _get_filtered_attribute_list(self, data=None):
         """Generator for listing all 'active' attributes, that is,
         attributes whose condition evaluates ``True``, whose version
@@ -528,6 +1041,32 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         Note: version and user_version arguments are deprecated, use
         the data argument instead.
         """
+        if not self._use_plans:
+            return self._get_reference_attribute_list(data)
+        plan = self._get_plan(data)
+        if plan.dups:
+            return self._get_plan_attribute_list(plan)
+        return (attr for attr in plan.attrs
+                if attr.cond is None or attr.cond.eval(self))
+
+    def _get_plan_attribute_list(self, plan):
+        """Generator for listing the active attributes of *plan*, also
+        skipping duplicate names."""
+        names = set()
+        for attr in plan.attrs:
+            if attr.cond is not None and not attr.cond.eval(self):
+                continue
+            if attr.name in plan.dups:
+                if attr.name in names:
+                    continue
+                names.add(attr.name)
+            yield attr
+
+    def _get_reference_attribute_list(self, data=None):
+        """Reference implementation of :meth:`_get_filtered_attribute_list`,
+        which checks all conditions of every attribute, without using the
+        compiled plans.
+        """
         if data is not None:
             version = data.version
             user_version = data.user_version
@@ -576,7 +1115,10 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def get_attribute(self, name):
         """Get a (non-basic) attribute."""
-        return getattr(self, "_" + name + "_value_")
+        value = getattr(self, "_" + name + "_value_")
+        if self._pristine is not None:
+            del self._pristine
+        return value
 
     # important note: to apply partial(set_attribute, name = 'xyz') the
     # name argument must be last
@@ -590,16 +1132,28 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                                value.__class__.__name__))
         # set it
         setattr(self, "_" + name + "_value_", value)
+        if self._pristine is not None:
+            del self._pristine
+        basic.touch()
 
     def get_basic_attribute(self, name):
         """Get a basic attribute."""
-        return getattr(self, "_" + name + "_value_").get_value()
+        value = getattr(self, "_" + name + "_value_").get_value()
+        if isinstance(value, list):
+            # for instance a byte matrix, which can be changed in place
+            if self._pristine is not None:
+                del self._pristine
+            basic.touch()
+        return value
 
     # important note: to apply partial(set_attribute, name = 'xyz') the
     # name argument must be last
     def set_basic_attribute(self, value, name):
         """Set the value of a basic attribute."""
         getattr(self, "_" + name + "_value_").set_value(value)
+        if self._pristine is not None:
+            del self._pristine
+        basic.touch()
 
     def get_template_attribute(self, name):
         """Get a template attribute."""
@@ -628,7 +1182,10 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Yield children of this structure."""
-        return (item for item in self._items)
+        items = [getattr(self, "_%s_value_" % name) for name in self._names]
+        if self._pristine is not None:
+            del self._pristine
+        return (item for item in items)
 
     def get_detail_child_names(self, edge_filter=EdgeFilter()):
         """Yield names of the children of this structure."""
@@ -647,5 +1204,7 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         for branch in self.get_refs():
             yield branch
 
+from pyffi.object_models.xml import basic
 from pyffi.object_models.xml.basic import BasicBase
+from pyffi.object_models.xml.enum import EnumBase
 from pyffi.object_models.xml.array import Array
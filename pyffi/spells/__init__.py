@@ -47,10 +47,11 @@ toaster.
 
 .. autoclass:: Spell
    :show-inheritance:
-   :members: READONLY, SPELLNAME, data, stream, toaster,
+   :members: READONLY, SPELLNAME, BLOCKTYPES, CACHEABLE, data, stream,
+             toaster,
              __init__, recurse, _datainspect, datainspect, _branchinspect,
              branchinspect, dataentry, dataexit, branchentry,
-             branchexit, toastentry, toastexit
+             branchexit, toastentry, toastexit, toastmap, toastreduce
 
 Grouping spells together
 ------------------------
@@ -80,6 +81,14 @@ be used for this purpose.
    :members:
    :undoc-members:
 
+Spells with different options can be run in a pipeline, through
+:meth:`Toaster.add_stage`.
+
+.. autoclass:: SpellPipelineBase
+   :show-inheritance:
+   :members:
+   :undoc-members:
+
 Creating toaster scripts
 ------------------------
 
@@ -135,23 +144,42 @@ the file format class of the files it can toast.
 # --------------------------------------------------------------------------
 
 
+import collections  # deque
 from configparser import ConfigParser
 from copy import deepcopy
+import csv
 import gc
-
+import hashlib  # sha1
+import heapq
+import io  # BytesIO
+import json
 import logging  # Logger
-import concurrent.futures  # ProcessPoolExecutor
-import multiprocessing  # current_process, cpu_count
+import multiprocessing  # current_process, cpu_count, Process, Pipe
+import multiprocessing.connection  # wait
 import optparse
 import os  # remove
 import os.path  # getsize, split, join
+import pickle
+import queue  # Empty
 import re  # for regex parsing (--skip, --only)
 import shlex  # shlex.split for parsing option lists in ini files
 import subprocess
+import sys  # platform
 import tempfile
+import threading
+import time  # time, perf_counter, process_time
+import tracemalloc  # start, stop, get_traced_memory
+
+try:
+    import resource  # getrusage
+except ImportError:
+    # not available on windows
+    resource = None
 
 import pyffi  # for pyffi.__version__
 import pyffi.object_models  # pyffi.object_models.FileFormat
+from pyffi.utils.atomicfile import AtomicFile
+from pyffi.utils.mmapstream import MmapStream
 
 
 class Spell(object):
@@ -194,6 +222,23 @@ class Spell(object):
     Override this class attribute when subclassing.
     """
 
+    CACHEABLE = True
+    """A ``bool`` which determines whether the toaster may reuse the
+    result of the spell on a file from its cache (see the ``cache``
+    option), instead of casting the spell again, if the file did not
+    change. Set to ``False`` when subclassing a spell which gathers
+    statistics over all files, or which reads or writes files other
+    than the toasted file and its toast stream.
+    """
+
+    BLOCKTYPES = None
+    """A ``tuple`` of the block types that the spell needs, or ``None``
+    if it needs the full file (the default). If set, then only blocks of
+    these types are parsed when the file is read; any other block is
+    only parsed when the spell accesses it, and is otherwise written
+    back unchanged. Only supported for nif files.
+    """
+
     def __init__(self, toaster=None, data=None, stream=None):
         """Initialize the spell data.
 
@@ -278,31 +323,53 @@ class Spell(object):
         # when called without arguments, recurse over the whole tree
         if branch is None:
             branch = self.data
+        # messages are only formatted if they are logged
+        verbose = self.toaster.logger.isEnabledFor(logging.INFO)
         # the root data element: datainspect has already been called
         if branch is self.data:
-            self.toaster.msgblockbegin(
-                "--- %s ---" % self.SPELLNAME)
+            if verbose:
+                self.toaster.msgblockbegin(
+                    "--- %s ---" % self.SPELLNAME)
             if self.dataentry():
                 # spell returned True so recurse to children
                 # we use the abstract tree functions to parse the tree
                 # these are format independent!
                 for child in branch.get_global_child_nodes():
-                    self.recurse(child)
+                    self._recurse(child, verbose)
                 self.dataexit()
-            self.toaster.msgblockend()
-        elif self._branchinspect(branch) and self.branchinspect(branch):
+            if verbose:
+                self.toaster.msgblockend()
+        else:
+            self._recurse(branch, verbose)
+
+    def _recurse(self, branch, verbose):
+        """Helper function for :meth:`recurse`, for every branch except
+        :attr:`data`.
+        """
+        if not (self._branchinspect(branch) and self.branchinspect(branch)):
+            return
+        if verbose:
             self.toaster.msgblockbegin(
                 """~~~ %s [%s] ~~~"""
                 % (branch.__class__.__name__,
                    branch.get_global_display()))
-            # cast the spell on the branch
-            if self.branchentry(branch):
-                # spell returned True so recurse to children
-                # we use the abstract tree functions to parse the tree
-                # these are format independent!
-                for child in branch.get_global_child_nodes():
-                    self.recurse(child)
-                self.branchexit(branch)
+        # cast the spell on the branch
+        profiler = self.toaster.profiler
+        if profiler is None:
+            entered = self.branchentry(branch)
+        else:
+            start = time.perf_counter()
+            entered = self.branchentry(branch)
+            profiler.add_branch(self.SPELLNAME, branch.__class__.__name__,
+                                time.perf_counter() - start)
+        if entered:
+            # spell returned True so recurse to children
+            # we use the abstract tree functions to parse the tree
+            # these are format independent!
+            for child in branch.get_global_child_nodes():
+                self._recurse(child, verbose)
+            self.branchexit(branch)
+        if verbose:
             self.toaster.msgblockend()
 
     def dataentry(self):
@@ -388,6 +455,40 @@ class Spell(object):
         """
         pass
 
+    @classmethod
+    def toastmap(cls, toaster):
+        """Called instead of :meth:`toastexit` in every worker process,
+        when the toaster runs more than one job, and the process has
+        finished processing its files. It returns the statistics that
+        the spell aggregated in this process, which are passed to
+        :meth:`toastreduce` in the main process, before
+        :meth:`toastexit` is called there.
+
+        The default implementation calls :meth:`toastexit`, so the
+        process reports its own statistics, and returns ``None``.
+        Spells that aggregate statistics from files should override
+        this method and :meth:`toastreduce`.
+
+        :param toaster: The toaster of the worker process.
+        :type toaster: :class:`Toaster`
+        :return: Anything that can be pickled.
+        """
+        cls.toastexit(toaster)
+        return None
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        """Called in the main process, for the result of
+        :meth:`toastmap` in each worker process. Merge the result into
+        the statistics of *toaster*, as they were initialized by
+        :meth:`toastentry`. The default implementation does nothing.
+
+        :param toaster: The toaster of the main process.
+        :type toaster: :class:`Toaster`
+        :param result: The result of :meth:`toastmap`.
+        """
+        pass
+
     @classmethod
     def get_toast_stream(cls, toaster, filename, test_exists=False):
         """Returns the stream that the toaster will write to. The
@@ -455,6 +556,16 @@ class SpellGroupBase(Spell):
         for spellclass in cls.ACTIVESPELLCLASSES:
             spellclass.toastexit(toaster)
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return [spellclass.toastmap(toaster)
+                for spellclass in cls.ACTIVESPELLCLASSES]
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        for spellclass, spellresult in zip(cls.ACTIVESPELLCLASSES, result):
+            spellclass.toastreduce(toaster, spellresult)
+
 
 class SpellGroupSeriesBase(SpellGroupBase):
     """Base class for running spells in series."""
@@ -521,6 +632,19 @@ class SpellGroupParallelBase(SpellGroupBase):
         return any(spell.changed for spell in self.spells)
 
 
+def _merge_block_types(spellclasses):
+    """Combine the :attr:`Spell.BLOCKTYPES` of a group of spells: the
+    group needs every block type that any of its spells need.
+    """
+    block_types = []
+    for spellclass in spellclasses:
+        if spellclass.BLOCKTYPES is None:
+            return None
+        for block_type in spellclass.BLOCKTYPES:
+            if block_type not in block_types:
+                block_types.append(block_type)
+    return tuple(block_types)
+
 def SpellGroupSeries(*args):
     """Class factory for grouping spells in series."""
     return type("".join(spellclass.__name__ for spellclass in args),
@@ -529,7 +653,10 @@ def SpellGroupSeries(*args):
                  "SPELLNAME":
                      " | ".join(spellclass.SPELLNAME for spellclass in args),
                  "READONLY": 
-                      all(spellclass.READONLY for spellclass in args)})
+                      all(spellclass.READONLY for spellclass in args),
+                 "CACHEABLE":
+                      all(spellclass.CACHEABLE for spellclass in args),
+                 "BLOCKTYPES": _merge_block_types(args)})
 
 
 def SpellGroupParallel(*args):
@@ -540,12 +667,84 @@ def SpellGroupParallel(*args):
                  "SPELLNAME":
                      " & ".join(spellclass.SPELLNAME for spellclass in args),
                  "READONLY": 
-                      all(spellclass.READONLY for spellclass in args)})
+                      all(spellclass.READONLY for spellclass in args),
+                 "CACHEABLE":
+                      all(spellclass.CACHEABLE for spellclass in args),
+                 "BLOCKTYPES": _merge_block_types(args)})
+
+class SpellPipelineBase(Spell):
+    """Base class for pipelines of spells, see :meth:`Toaster.add_stage`.
+    The spells of all stages are cast in turn on the same data, each
+    with the toaster of its stage, so with the options of its stage.
+    For every stage, a ``dict`` with the ``spellname``, the ``time``
+    it took, whether the spell ``changed`` the data, and the
+    ``reports`` of the spell, is appended to :attr:`Spell.reports`.
+    """
+
+    ACTIVESTAGES = []
+    """List of the toasters of the stages whose spells apply.
+    This list is automatically built when :meth:`toastentry` is called.
+    """
+
+    def datainspect(self):
+        # the spell of every stage inspects the data when it is cast
+        return any(stage.inspect_filename(self.stream.name)
+                   for stage in self.ACTIVESTAGES)
+
+    def recurse(self, branch=None):
+        """Cast the spells of all stages in turn."""
+        for stage in self.ACTIVESTAGES:
+            if not stage.inspect_filename(self.stream.name):
+                continue
+            spellname = stage.spellclass.SPELLNAME
+            self.toaster.msgblockbegin("stage %s" % spellname)
+            start = time.time()
+            try:
+                stage.indent = self.toaster.indent
+                spell = stage.spellclass(
+                    toaster=stage, data=self.data, stream=self.stream)
+                if spell._datainspect() and spell.datainspect():
+                    spell.recurse(branch)
+            finally:
+                elapsed = time.time() - start
+                self.toaster.msgblockend()
+            self.toaster.msg(
+                "stage %s took %.3f seconds (%s)"
+                % (spellname, elapsed,
+                   "changed" if spell.changed else "unchanged"))
+            self.changed = self.changed or spell.changed
+            self.append_report(dict(spellname=spellname, time=elapsed,
+                                    changed=spell.changed,
+                                    reports=spell.reports))
+
+    @classmethod
+    def toastentry(cls, toaster):
+        cls.ACTIVESTAGES = [
+            stage for stage in toaster.stages
+            if stage.spellclass.toastentry(stage)]
+        return bool(cls.ACTIVESTAGES)
+
+    @classmethod
+    def toastexit(cls, toaster):
+        for stage in cls.ACTIVESTAGES:
+            stage.spellclass.toastexit(stage)
+
+    @classmethod
+    def toastmap(cls, toaster):
+        return [stage.spellclass.toastmap(stage)
+                for stage in cls.ACTIVESTAGES]
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        for stage, stageresult in zip(cls.ACTIVESTAGES, result):
+            stage.spellclass.toastreduce(stage, stageresult)
+
 
 class SpellApplyPatch(Spell):
     """A spell for applying a patch on files."""
 
     SPELLNAME = "applypatch"
+    CACHEABLE = False
 
     def datainspect(self):
         """There is no need to read the whole file, so we apply the patch
@@ -603,37 +802,718 @@ class fake_logger:
     def setLevel(cls, level):
         cls.level = level
 
+    @classmethod
+    def isEnabledFor(cls, level):
+        return level >= cls.level
 
-def _toaster_job(args):
-    """For multiprocessing. This function creates a new toaster, with the
-    given options and spells, and calls the toaster on filename.
+
+class ToastResult(object):
+    """The result of toasting a single file."""
+
+    name = None
+    """The name of the file."""
+
+    status = None
+    """``"done"`` if the spell was cast on the file (or if it did not
+    apply), ``"failed"`` if an exception occurred, ``"skipped"`` if the
+    file name was excluded, ``"exists"`` if the file was already
+    toasted when resuming, and, when toasting with more than one
+    process, ``"timeout"`` if the process was stopped because it took
+    too long, and ``"crashed"`` if the process died.
     """
 
-    class multiprocessing_fake_logger(fake_logger):
-        """Simple logger which works well along with multiprocessing on all platforms."""
-        @classmethod
-        def _log(cls, level, level_str, msg):
-            # do not actually log, just print
-            if level >= cls.level:
-                print("pyffi.toaster:%i:%s:%s"
-                      % (multiprocessing.current_process().pid,
-                         level_str, msg))
-
-    toasterclass, filename, options, spellnames = args
+    time = 0.0
+    """The time it took to toast the file, in seconds."""
+
+    reports = None
+    """The :attr:`Spell.reports` of the spell."""
+
+    changed = False
+    """The :attr:`Spell.changed` flag of the spell."""
+
+    profile = None
+    """If the toaster profiles, a ``dict`` with the wall clock ``time``
+    and the ``cpu`` time it took to toast the file, the ``peak_allocated``
+    memory, that is, the largest number of bytes allocated by Python
+    while toasting the file, the wall clock and cpu time
+    of the ``inspect``, ``read``, ``cast``, and ``write`` ``phases``,
+    and, in ``spells``, the time and number of calls of
+    :meth:`Spell.branchentry` per spell and per block type.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+
+def _get_peak_memory():
+    """The peak resident memory of the process, in bytes, or ``None``
+    if unknown.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on mac os x
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class _ProfilePhase(object):
+    """Context manager which adds the time it takes to a phase of the
+    file that is being profiled.
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add_phase(self.name,
+                                time.perf_counter() - self.start,
+                                time.process_time() - self.start_cpu)
+
+
+class _NoProfilePhase(object):
+    """Context manager which does nothing, used if not profiling."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class _ToastProfiler(object):
+    """Records the time and memory it takes to toast files, see the
+    ``profile`` option and :attr:`ToastResult.profile`. Memory is traced
+    with :mod:`tracemalloc` while a file is toasted, which slows down
+    toasting.
+    """
+
+    num_slowest = 10
+    """Number of slowest files in the summary."""
+
+    PHASES = ("inspect", "read", "cast", "write")
+    """The phases of toasting a file."""
+
+    def __init__(self):
+        # profiles of all toasted files
+        self.files = []
+        # profile of the file being toasted
+        self.record = None
+
+    def begin_file(self, name):
+        """Start profiling a file."""
+        self.record = dict(name=name, time=0.0, cpu=0.0,
+                           peak_allocated=None, phases={}, spells={})
+        # stopping tracemalloc resets its peak, so trace every file
+        # separately, unless something else is tracing already
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def end_file(self):
+        """Stop profiling the file, and return its profile."""
+        record, self.record = self.record, None
+        record["time"] = time.perf_counter() - self.start
+        record["cpu"] = time.process_time() - self.start_cpu
+        peak = tracemalloc.get_traced_memory()[1]
+        if self.tracing:
+            tracemalloc.stop()
+        record["peak_allocated"] = max(peak - self.start_memory, 0)
+        return record
+
+    def phase(self, name):
+        return _ProfilePhase(self, name)
+
+    def add_phase(self, name, wall, cpu):
+        if self.record is not None:
+            totals = self.record["phases"].setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+
+    def add_branch(self, spellname, block_type, wall):
+        if self.record is not None:
+            totals = self.record["spells"].setdefault(
+                spellname, {}).setdefault(block_type, [0.0, 0])
+            totals[0] += wall
+            totals[1] += 1
+
+    def add_file(self, record):
+        """Add the profile of a toasted file."""
+        self.files.append(record)
+
+    def get_totals(self):
+        """Get the wall clock and cpu time per phase, and the time and
+        number of calls per spell and block type, over all files.
+        """
+        phases = {}
+        spells = {}
+        for record in self.files:
+            for name, (wall, cpu) in record["phases"].items():
+                totals = phases.setdefault(name, [0.0, 0.0])
+                totals[0] += wall
+                totals[1] += cpu
+            for spellname, block_types in record["spells"].items():
+                spell_totals = spells.setdefault(spellname, {})
+                for block_type, (wall, calls) in block_types.items():
+                    totals = spell_totals.setdefault(block_type, [0.0, 0])
+                    totals[0] += wall
+                    totals[1] += calls
+        return phases, spells
+
+    def get_slowest(self):
+        """Get the profiles of the slowest files."""
+        return sorted(self.files, key=lambda record: record["time"],
+                      reverse=True)[:self.num_slowest]
+
+    def save(self, filename):
+        """Write all profiles to *filename*, as a csv table with a row
+        per file if *filename* ends with ``.csv``, and as json otherwise.
+        """
+        if filename.lower().endswith(".csv"):
+            with open(filename, "w", newline="") as stream:
+                writer = csv.writer(stream)
+                writer.writerow(
+                    ["name", "time", "cpu", "peak_allocated"]
+                    + ["%s_%s" % (phase, kind) for phase in self.PHASES
+                       for kind in ("time", "cpu")])
+                for record in self.files:
+                    writer.writerow(
+                        [record["name"], record["time"], record["cpu"],
+                         record["peak_allocated"]]
+                        + [value for phase in self.PHASES
+                           for value in record["phases"].get(
+                               phase, [0.0, 0.0])])
+        else:
+            phases, spells = self.get_totals()
+            with open(filename, "w") as stream:
+                json.dump(dict(files=self.files, phases=phases,
+                               spells=spells),
+                          stream, indent=1, sort_keys=True)
+
+    def log_summary(self, toaster):
+        """Report the totals and the slowest files."""
+        phases, spells = self.get_totals()
+        toaster.msgblockbegin("profile")
+        for name in self.PHASES:
+            if name in phases:
+                toaster.msg("%-8s %10.3fs wall %10.3fs cpu"
+                            % ((name,) + tuple(phases[name])))
+        for spellname, block_types in sorted(spells.items()):
+            toaster.msgblockbegin(spellname)
+            for block_type, (wall, calls) in sorted(
+                    block_types.items(), key=lambda item: -item[1][0]):
+                toaster.msg("%-40s %10.3fs %8i calls"
+                            % (block_type, wall, calls))
+            toaster.msgblockend()
+        toaster.msgblockbegin("slowest files")
+        for record in self.get_slowest():
+            toaster.msg("%10.3fs %s" % (record["time"], record["name"]))
+        toaster.msgblockend()
+        toaster.msgblockend()
+
+
+class _multiprocessing_fake_logger(fake_logger):
+    """Simple logger which works well along with multiprocessing on all platforms."""
+    @classmethod
+    def _log(cls, level, level_str, msg):
+        # do not actually log, just print
+        if level >= cls.level:
+            print("pyffi.toaster:%i:%s:%s"
+                  % (multiprocessing.current_process().pid,
+                     level_str, msg))
+
+
+def _toaster_worker(toasterclass, options, spellnames, stages, tasks, results,
+                    max_files, max_memory):
+    """For multiprocessing. This function creates a new toaster, with the
+    given options and spells, and with a stage for every
+    ``(spellnames, options)`` pair in *stages*, and calls the toaster
+    on every file name
+    received from the *tasks* connection, until it gets ``None``, until it
+    has toasted *max_files* files (if not zero), or until the peak
+    resident memory of the process exceeds *max_memory* bytes (if not
+    zero). Before toasting a file, ``("start", filename)`` is sent over
+    the *results* connection.
+    For every toasted file,
+    ``("file", result)`` is sent, where ``result``
+    is the :class:`ToastResult`, followed by ``("exit", result)``
+    when the worker is done, where ``result`` is the result of
+    :meth:`Spell.toastmap`. Messages are sent synchronously, so they
+    reach the pool even if the process dies right after sending them.
+    """
     toaster = toasterclass(options=options, spellnames=spellnames,
-                           logger=multiprocessing_fake_logger)
+                           logger=_multiprocessing_fake_logger)
+    for stage_spellnames, stage_options in stages:
+        toaster.add_stage(stage_spellnames, stage_options)
 
     # toast entry code
-    if not toaster.spellclass.toastentry(toaster):
+    applies = toaster.spellclass.toastentry(toaster)
+    if not applies:
         print("pyffi.toaster:%s" % "Spell does not apply! quiting early...")
-        return
 
-    # toast single file
-    stream = open(filename, mode='rb' if toaster.spellclass.READONLY else 'r+b')
-    toaster._toast(stream)
+    num_files = 0
+    for filename in iter(tasks.recv, None):
+        results.send(("start", filename))
+        if applies:
+            # toast single file
+            stream = open(
+                filename, mode='rb' if toaster.spellclass.READONLY else 'r+b')
+            with stream:
+                result = toaster._toast(stream)
+            if toaster.options["gccollect"]:
+                gc.collect()
+        else:
+            result = ToastResult(filename)
+        results.send(("file", result))
+        num_files += 1
+        if num_files == max_files:
+            break
+        if max_memory and (_get_peak_memory() or 0) > max_memory:
+            # memory is rarely given back to the operating system, so
+            # leave it to a fresh process to toast the next files
+            break
 
     # toast exit code
-    toaster.spellclass.toastexit(toaster)
+    result = toaster.spellclass.toastmap(toaster) if applies else None
+    results.send(("exit", result))
+
+
+def _discard_stream(stream):
+    """Close *stream*, and remove the file if it was incompletely
+    written.
+    """
+    if isinstance(stream, AtomicFile):
+        stream.discard()
+        return
+    name = stream.name
+    stream.close()
+    # temporary streams are removed on close
+    # so check if it exists before removing
+    if isinstance(name, str) and os.path.exists(name):
+        os.remove(name)
+
+
+class _ReadAhead(object):
+    """Iterate over in-memory copies of files, which a background thread
+    reads up to *num_files* files ahead.
+    """
+
+    def __init__(self, filenames, num_files):
+        self.buffers = queue.Queue(num_files)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read, args=(filenames,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read(self, filenames):
+        try:
+            for filename in filenames:
+                if self.stopped.is_set():
+                    return
+                try:
+                    with open(filename, "rb") as stream:
+                        self._put((filename, stream.read(), None))
+                except IOError as expt:
+                    self._put((filename, None, expt))
+        except Exception as expt:
+            self._put((None, None, expt))
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.buffers.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return
+
+    def __iter__(self):
+        for filename, raw, expt in iter(self.buffers.get, None):
+            if expt is not None:
+                raise expt
+            stream = io.BytesIO(raw)
+            stream.name = filename
+            yield stream
+
+    def close(self):
+        """Stop reading files."""
+        self.stopped.set()
+        self.thread.join()
+
+
+class _WriteBehind(object):
+    """Write data to streams, and close them, in a background thread,
+    at most *num_files* files behind.
+    """
+
+    def __init__(self, num_files):
+        self.tasks = queue.Queue(num_files)
+        self.failures = queue.Queue()
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write(self):
+        for name, stream, raw in iter(self.tasks.get, None):
+            try:
+                stream.write(raw)
+                stream.close()
+            except Exception as expt:
+                _discard_stream(stream)
+                self.failures.put((name, expt))
+
+    def submit(self, name, stream, raw):
+        """Write *raw* to *stream*, and close it. The *name* of the
+        toasted file is reported by :meth:`get_failures` if this fails.
+        """
+        self.tasks.put((name, stream, raw))
+
+    def get_failures(self):
+        """Generator for the ``(name, exception)`` pairs of all writes
+        that failed since the last call.
+        """
+        while True:
+            try:
+                yield self.failures.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """Wait until all streams are written."""
+        self.tasks.put(None)
+        self.thread.join()
+
+
+class _LargestFirst(object):
+    """Iterate over *files*, an iterable of ``(filename, size)`` pairs
+    such as :func:`pyffi.utils.scan`, which is consumed by a background
+    thread. Every next pair is the one of the largest file among those
+    that are found so far, and not yet returned. So,
+    while the files are toasted, the largest files are scheduled first,
+    and the workers do not end up waiting for a single large file at
+    the end.
+    """
+
+    def __init__(self, files):
+        self.heap = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._collect, args=(files,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _collect(self, files):
+        try:
+            for index, (filename, size) in enumerate(files):
+                with self.condition:
+                    heapq.heappush(self.heap, (-size, index, filename))
+                    self.condition.notify()
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify()
+
+    def __iter__(self):
+        while True:
+            with self.condition:
+                while not self.heap and not self.done:
+                    self.condition.wait()
+                if not self.heap:
+                    return
+                size, index, filename = heapq.heappop(self.heap)
+            yield filename, -size
+
+
+class _ToasterPool(object):
+    """Long lived worker processes, which toast the files that are
+    submitted to the pool, as soon as they are ready for them. This
+    way, there is no need to wait for the slowest file of a batch, and
+    toasters are not recreated for every file.
+
+    If the pool has a memory budget, then workers are replaced once
+    they use more memory than the budget, and files are only handed out
+    to the workers as long as the memory that the files being toasted
+    are expected to need fits in the budget of all workers together.
+    So, many small files are toasted at once, while a huge file is
+    toasted alone.
+
+    A worker which takes longer than the timeout of the pool to toast a
+    file is stopped, and a worker which dies while toasting a file is
+    detected. In both cases, the file is marked in its result, and
+    a new worker takes over. The pool keeps track of the files that it
+    gave to each worker, so files which the worker did not get to are
+    given to other workers. Workers which die before they toast any
+    file are replaced as well, unless so many die in a row that workers
+    apparently cannot start at all.
+    """
+
+    max_failed_starts = 3
+    """Number of workers per job which may die in a row before they
+    toast any file, before the pool gives up.
+    """
+
+    def __init__(self, toaster, jobs, max_files=0, max_memory=0,
+                 timeout=0):
+        """Start the worker processes.
+
+        :param toaster: The toaster whose class, options, and spells are
+            used by the workers.
+        :type toaster: :class:`Toaster`
+        :param jobs: Number of worker processes.
+        :type jobs: ``int``
+        :param max_files: Number of files after which a worker is
+            replaced by a new one, or zero to never replace workers.
+        :type max_files: ``int``
+        :param max_memory: Memory budget of each worker, in bytes, or
+            zero for no budget.
+        :type max_memory: ``int``
+        :param timeout: Number of seconds after which a worker that is
+            still toasting the same file is stopped, or zero for no
+            timeout.
+        :type timeout: ``float``
+        """
+        self.toaster = toaster
+        self.jobs = jobs
+        self.max_files = max_files
+        self.max_memory = max_memory
+        # expected memory of the files that are queued or being toasted
+        self.memory = {}
+        self.memory_used = 0
+        self.timeout = timeout
+        # files which are waiting for a worker
+        self.queued = collections.deque()
+        self.workers = []
+        # number of files which are queued or being toasted
+        self.pending = 0
+        # number of workers in a row which died before toasting any file
+        self.failed_starts = 0
+        for i in range(jobs):
+            self._start_worker()
+
+    def _start_worker(self):
+        """Start a new worker process."""
+        task_reader, task_writer = multiprocessing.Pipe(duplex=False)
+        result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_toaster_worker,
+            args=(self.toaster.__class__, self.toaster.options,
+                  self.toaster.spellnames,
+                  [(stage.spellnames, stage.options)
+                   for stage in self.toaster.stages],
+                  task_reader, result_writer, self.max_files,
+                  self.max_memory))
+        process.daemon = True
+        process.start()
+        # the worker holds the only writing end of its results, so the
+        # pool gets end of file as soon as the worker dies
+        task_reader.close()
+        result_writer.close()
+        self.workers.append(_PoolWorker(process, task_writer, result_reader))
+
+    def _dispatch(self):
+        """Give the queued files to the workers, up to two files per
+        worker (one that it is toasting, and the next one).
+        """
+        while self.queued:
+            workers = [worker for worker in self.workers
+                       if len(worker.assigned) < 2
+                       and not (self.max_files
+                                and worker.num_files >= self.max_files)]
+            if not workers:
+                return
+            worker = min(workers, key=lambda worker: len(worker.assigned))
+            filename = self.queued.popleft()
+            worker.assigned.append(filename)
+            worker.num_files += 1
+            try:
+                worker.tasks.send(filename)
+            except OSError:
+                # the worker already stopped: the file is given to
+                # another worker once the pool handles this
+                pass
+
+    def _get_result(self, closing=False):
+        """Wait for the next message of the workers, and handle it, or
+        until a worker times out or dies. A worker which stopped is
+        replaced, unless the pool is *closing* and no more files are
+        pending.
+        """
+        while True:
+            if self._check_timeouts(closing):
+                break
+            ready = multiprocessing.connection.wait(
+                [worker.results for worker in self.workers], timeout=1)
+            if ready:
+                worker, = [worker for worker in self.workers
+                           if worker.results is ready[0]]
+                try:
+                    kind, value = worker.results.recv()
+                except EOFError:
+                    # all messages of the worker were handled
+                    self._lost_worker(worker, "crashed", closing)
+                else:
+                    self._handle(worker, kind, value, closing)
+                break
+        self._dispatch()
+
+    def _handle(self, worker, kind, value, closing):
+        """Handle a message of a worker."""
+        if kind == "start":
+            worker.start = time.monotonic()
+            worker.started = True
+            self.failed_starts = 0
+        elif kind == "file":
+            # workers toast their files in the order they got them
+            filename = worker.assigned.pop(0)
+            worker.start = None
+            self.pending -= 1
+            self.memory_used -= self.memory.pop(filename, 0)
+            self.toaster.add_result(value)
+        elif kind == "exit":
+            self.toaster.spellclass.toastreduce(self.toaster, value)
+            self._remove_worker(worker, closing)
+
+    def _remove_worker(self, worker, closing):
+        """Remove a worker which stopped, queue the files it did not get
+        to again, and replace it.
+        """
+        self.workers.remove(worker)
+        worker.tasks.close()
+        worker.results.close()
+        worker.process.join()
+        self.queued.extendleft(reversed(worker.assigned))
+        worker.assigned = []
+        if not closing or self.pending:
+            self._start_worker()
+
+    def _check_timeouts(self, closing):
+        """Stop the workers that are toasting a file for longer than
+        the timeout. Returns ``True`` if any worker was stopped.
+        """
+        if not self.timeout:
+            return False
+        now = time.monotonic()
+        stopped = [worker for worker in self.workers
+                   if worker.start is not None
+                   and now - worker.start > self.timeout]
+        for worker in stopped:
+            worker.process.terminate()
+            worker.process.join()
+            # handle the messages sent before the worker was stopped
+            try:
+                while worker.results.poll():
+                    kind, value = worker.results.recv()
+                    if kind != "exit":
+                        self._handle(worker, kind, value, closing)
+            except EOFError:
+                pass
+            self._lost_worker(worker, "timeout", closing)
+        return bool(stopped)
+
+    def _lost_worker(self, worker, status, closing):
+        """Mark the file that the *worker* was toasting with *status*,
+        and replace the worker.
+        """
+        worker.process.join()
+        if not worker.started:
+            self.failed_starts += 1
+            if self.failed_starts >= self.max_failed_starts * self.jobs:
+                # new workers would not fare any better
+                raise RuntimeError(
+                    "%i worker processes in a row died before toasting any"
+                    " file, the last one with exit code %i"
+                    % (self.failed_starts, worker.process.exitcode))
+            self.toaster.logger.warn(
+                "process %i died with exit code %i before toasting any file"
+                % (worker.process.pid, worker.process.exitcode))
+            self._remove_worker(worker, closing)
+            return
+        if worker.start is not None:
+            now = time.monotonic()
+            filename = worker.assigned.pop(0)
+            self.pending -= 1
+            self.memory_used -= self.memory.pop(filename, 0)
+            if status == "timeout":
+                self.toaster.logger.error(
+                    "TIMED OUT ON {0} after {1:.0f} seconds".format(
+                        filename, now - worker.start))
+            else:
+                self.toaster.logger.error(
+                    "CRASHED ON {0} - process died with exit code {1}"
+                    .format(filename, worker.process.exitcode))
+            result = ToastResult(filename)
+            result.status = status
+            result.time = now - worker.start
+            self.toaster.add_result(result)
+        self.toaster.logger.warn(
+            "results of spells which gather statistics (such as checks)"
+            " are lost for all files toasted by process %i"
+            % worker.process.pid)
+        self._remove_worker(worker, closing)
+
+    def submit(self, filename, memory=0):
+        """Queue a file for toasting. Blocks until there is room in the
+        queue, and, if the pool has a memory budget, until the *memory*
+        that the file is expected to need, in bytes, fits in it.
+        """
+        while (self.pending >= 2 * self.jobs
+               or (self.pending and self.max_memory and
+                   self.memory_used + memory > self.jobs * self.max_memory)):
+            self._get_result()
+        self.queued.append(filename)
+        self.pending += 1
+        self.memory[filename] = memory
+        self.memory_used += memory
+        self._dispatch()
+
+    def close(self):
+        """Wait until all files are toasted, and stop the workers."""
+        while self.pending:
+            self._get_result()
+        for worker in self.workers:
+            try:
+                worker.tasks.send(None)
+            except OSError:
+                # the worker already stopped
+                pass
+        while self.workers:
+            self._get_result(closing=True)
+
+
+class _PoolWorker(object):
+    """A worker process of a :class:`_ToasterPool`, along with the files
+    that the pool gave to it.
+
+    :ivar process: The :class:`multiprocessing.Process`.
+    :ivar tasks: Connection over which file names are sent to the worker.
+    :ivar results: Connection over which the worker sends its messages.
+    :ivar assigned: The files given to the worker which it did not
+        finish yet, in the order in which it toasts them.
+    :ivar num_files: Number of files given to the worker.
+    :ivar start: Time at which the worker started toasting the first
+        file in :attr:`assigned`, or ``None`` if it did not start it.
+    :ivar started: Whether the worker started toasting any file.
+    """
+
+    def __init__(self, process, tasks, results):
+        self.process = process
+        self.tasks = tasks
+        self.results = results
+        self.assigned = []
+        self.num_files = 0
+        self.start = None
+        self.started = False
 
 # CPU_COUNT is used for default number of jobs
 if multiprocessing:
@@ -672,11 +1552,17 @@ class Toaster(object):
         createpatch=False, applypatch=False, diffcmd="", patchcmd="",
         series=False,
         skip=[], only=[],
-        jobs=CPU_COUNT, refresh=32,
+        jobs=CPU_COUNT, refresh=32, maxmemory=0, timeout=0,
         sourcedir="", destdir="",
         archives=False,
         resume=False,
         gccollect=False,
+        lazy=False,
+        mmap=False,
+        cache="",
+        readahead=0,
+        profile="",
+        stage=[],
         inifile="")
     """List of spell classes of the particular :class:`Toaster` instance."""
 
@@ -707,6 +1593,31 @@ class Toaster(object):
     skip_regexs = []
     """Tuple of regular expressions corresponding to the skip key of :attr:`options`."""
 
+    stages = []
+    """List of toasters, one for every stage of the pipeline, see
+    :meth:`add_stage`.
+    """
+
+    profiler = None
+    """Records the time it takes to toast files if the ``profile``
+    option is set, ``None`` otherwise.
+    """
+
+    MEMORY_PER_BYTE = 64
+    """Rough number of bytes of memory needed per byte of a file to
+    toast it, see :meth:`estimate_memory`.
+    """
+
+    _PIPELINE_OPTIONS = frozenset((
+        "verbose", "pause", "interactive", "dryrun", "prefix", "suffix",
+        "createpatch", "applypatch", "diffcmd", "patchcmd", "jobs",
+        "refresh", "maxmemory", "timeout", "sourcedir", "destdir",
+        "archives", "resume", "gccollect", "lazy", "mmap", "cache", "readahead", "profile",
+        "raisetesterror"))
+    """Options of the toaster that also apply to all stages of its
+    pipeline.
+    """
+
     def __init__(self, spellclass=None, options=None, spellnames=None,
                  logger=None):
         """Initialize the toaster.
@@ -737,6 +1648,13 @@ class Toaster(object):
         self.files_done = {}
         self.files_skipped = set()
         self.files_failed = set()
+        # maps every file name to its ToastResult
+        self.file_results = {}
+        # hash of everything besides the file that determines its result
+        self._cache_salt = None
+        # writes files in the background, see _toast_read_ahead
+        self._writer = None
+        self.stages = []
 
     def _update_options(self):
         """Synchronize some fields with given options."""
@@ -772,11 +1690,15 @@ class Toaster(object):
         self.exclude_types = tuple(
             getattr(self.FILEFORMAT, block_type)
             for block_type in self.options["exclude"])
+        # admissible branch types depend on include and exclude types
+        self._admissible_branch_classes = {}
         # update skip and only regular expressions
         self.skip_regexs = tuple(
             re.compile(regex) for regex in self.options["skip"])
         self.only_regexs = tuple(
             re.compile(regex) for regex in self.options["only"])
+        # profile?
+        self.profiler = _ToastProfiler() if self.options["profile"] else None
 
     def _update_spellclass(self):
         """Update spell class from given list of spell names."""
@@ -863,6 +1785,16 @@ class Toaster(object):
         >>> toaster.is_admissible_branch_class(NifFormat.NiAlphaProperty)
         True
         """
+        # the answer is the same for all branches of the same type
+        try:
+            return self._admissible_branch_classes[branchtype]
+        except KeyError:
+            admissible = self._is_admissible_branch_class(branchtype)
+            self._admissible_branch_classes[branchtype] = admissible
+            return admissible
+
+    def _is_admissible_branch_class(self, branchtype):
+        """Helper function for :meth:`is_admissible_branch_class`."""
         # print("checking %s" % branchtype.__name__) # debug
         # check that block is not in exclude...
         if not issubclass(branchtype, self.exclude_types):
@@ -923,6 +1855,13 @@ class Toaster(object):
             type="string",
             metavar="ARG",
             help="pass argument ARG to each spell")
+        parser.add_option(
+            "--cache", dest="cache",
+            type="string",
+            metavar="CACHEDIR",
+            help="store the result of toasting each file in CACHEDIR,"
+            " and reuse it instead of toasting the file again"
+            " if neither the file, nor the spells and options changed")
         parser.add_option(
             "--dest-dir", dest="destdir",
             type="string",
@@ -982,6 +1921,17 @@ class Toaster(object):
             type="int",
             metavar="JOBS",
             help="allow JOBS jobs at once [default: %default]")
+        parser.add_option(
+            "--lazy", dest="lazy",
+            action="store_true",
+            help="only parse the blocks that the spells need"
+                 " (only supported for nif files;"
+                 " effective from nif version 20.2.0.7 onwards)")
+        parser.add_option(
+            "--mmap", dest="mmap",
+            action="store_true",
+            help="read files through a memory map"
+                 " (only used for spells which do not write files)")
         parser.add_option(
             "--noninteractive", dest="interactive",
             action="store_false",
@@ -1023,14 +1973,47 @@ class Toaster(object):
             "-r", "--raise", dest="raisetesterror",
             action="store_true",
             help="raise exception on errors during the spell (for debugging)")
+        parser.add_option(
+            "--profile", dest="profile",
+            type="string",
+            metavar="FILE",
+            help="record the time and memory it takes to toast every file,"
+                 " per phase (inspect, read, cast, write), and per spell"
+                 " and block type, report the totals and the slowest files,"
+                 " and write all records to FILE, as json, or as csv with a"
+                 " row per file if FILE ends with .csv")
+        parser.add_option(
+            "--read-ahead", dest="readahead",
+            type="int",
+            metavar="N",
+            help="read up to N files ahead, and write files, in background"
+                 " threads, so reading and writing overlaps with toasting,"
+                 " if JOBS is 1 [default: %default]")
         parser.add_option(
             "--refresh", dest="refresh",
             type="int",
             metavar="REFRESH",
-            help="start new process pool every JOBS * REFRESH files"
-                 " if JOBS is 2 or more"
+            help="start a new process after every REFRESH files"
+                 " that a process toasted, if JOBS is 2 or more"
                  " (when processing a large number of files, this prevents"
                  " leaking memory on some operating systems) [default: %default]")
+        parser.add_option(
+            "--max-memory", dest="maxmemory",
+            type="int",
+            metavar="MB",
+            help="start a new process once a process used more than MB"
+                 " megabytes of memory, and only toast as many files at"
+                 " once as are expected to fit in MB megabytes per"
+                 " process, if JOBS is 2 or more"
+                 " (so huge files do not run out of memory)")
+        parser.add_option(
+            "--timeout", dest="timeout",
+            type="float",
+            metavar="SECONDS",
+            help="stop a process which takes longer than SECONDS seconds"
+                 " to toast a file, and mark the file as timed out,"
+                 " if JOBS is 2 or more (processes that crash are always"
+                 " replaced, and their file is marked as crashed)")
         parser.add_option(
             "--resume", dest="resume",
             action="store_true",
@@ -1056,6 +2039,17 @@ class Toaster(object):
             "--spells", dest="spells",
             action="store_true",
             help="list all spells and exit")
+        parser.add_option(
+            "--stage", dest="stage",
+            type="string",
+            action="append",
+            metavar="INIFILES",
+            help="add a stage, with the spells and options from the space"
+                 " separated list of ini files INIFILES; the spells and"
+                 " options from the command line form the first stage;"
+                 " every file is read once, the stages are run in turn,"
+                 " and every file is written once; specify more than once"
+                 " for multiple stages")
         parser.add_option(
             "--suffix", dest="suffix",
             type="string",
@@ -1083,11 +2077,7 @@ class Toaster(object):
         (options, args) = parser.parse_args()
 
         # convert options to dictionary
-        self.options = {}
-        for optionname in dir(options):
-            # skip default attributes of optparse.Values
-            if optionname not in dir(optparse.Values):
-                self.options[optionname] = getattr(options, optionname)
+        self.options = self._get_options_dict(options)
 
         # update options
         self._update_options()
@@ -1136,6 +2126,11 @@ class Toaster(object):
                 self.top = args[-1]
             # update the spell class
             self._update_spellclass()
+            # set up the pipeline
+            if self.options["stage"]:
+                self.add_stage(self.spellnames, self.options)
+                for inifiles in self.options["stage"]:
+                    self._add_stage_from_inifiles(parser, inifiles)
 
         if not self.options["archives"]:
             self.toast(self.top)
@@ -1147,10 +2142,84 @@ class Toaster(object):
         if options.pause and options.interactive:
             input("Press enter...")
 
+    def add_stage(self, spellnames, options=None):
+        """Add a stage to the pipeline of the toaster. Once the toaster
+        has stages, it no longer casts its own spells: every file is
+        read once, the spells of all stages are cast in turn on the
+        data, and the file is written once, if any of the spells
+        changed it.
+
+        The spells of a stage are cast with their own toaster, whose
+        options are *options*, except for those options which concern
+        reading and writing files, such as ``jobs``, ``destdir``, or
+        ``dryrun``, which are taken from this toaster. So, each stage
+        can for instance have its own ``arg``, ``exclude``, and
+        ``skip`` options. A file is only toasted if at least one stage
+        does not skip it.
+
+        :param spellnames: List of names of the spells of the stage.
+        :type spellnames: ``list`` of ``str``
+        :param options: The options of the stage.
+        :type options: ``dict``
+        :return: The toaster of the stage.
+        :rtype: :class:`Toaster`
+        """
+        stage_options = dict(options) if options else {}
+        stage_options.update(
+            (name, value) for name, value in self.options.items()
+            if name in self._PIPELINE_OPTIONS)
+        stage = self.__class__(spellnames=spellnames, options=stage_options,
+                               logger=self.logger)
+        # stages record their spells in the profile of this toaster
+        stage.profiler = self.profiler
+        self.stages.append(stage)
+        spellclasses = [stage.spellclass for stage in self.stages]
+        self.spellclass = type(
+            "SpellPipeline", (SpellPipelineBase,),
+            {"SPELLNAME":
+                 " ; ".join(spellclass.SPELLNAME
+                            for spellclass in spellclasses),
+             "READONLY":
+                 all(spellclass.READONLY for spellclass in spellclasses),
+             "CACHEABLE":
+                 all(spellclass.CACHEABLE for spellclass in spellclasses),
+             "BLOCKTYPES": _merge_block_types(spellclasses)})
+        return stage
+
+    @staticmethod
+    def _get_options_dict(values):
+        """Convert parsed command line options to a ``dict``."""
+        options = {}
+        for optionname in dir(values):
+            # skip default attributes of optparse.Values
+            if optionname not in dir(optparse.Values):
+                options[optionname] = getattr(values, optionname)
+        return options
+
+    def _add_stage_from_inifiles(self, parser, inifiles):
+        """Add a stage to the pipeline, with the spells and options
+        from a space separated list of ini files.
+        """
+        values = parser.values
+        # a fresh copy, as optparse appends to the default lists
+        parser.values = optparse.Values(deepcopy(self.DEFAULT_OPTIONS))
+        stage = self.__class__(logger=self.logger)
+        try:
+            for inifile in shlex.split(inifiles):
+                self.parse_inifile(None, None, inifile, parser, toaster=stage)
+            options = self._get_options_dict(parser.values)
+        finally:
+            parser.values = values
+        self.add_stage(stage.spellnames, options)
+
     def inspect_filename(self, filename):
         """Returns whether to toast a filename or not, based on
-        skip_regexs and only_regexs.
+        skip_regexs and only_regexs, or, for a pipeline, whether any
+        of its stages toasts it.
         """
+        if self.stages:
+            return any(stage.inspect_filename(filename)
+                       for stage in self.stages)
         if any(regex.search(filename) for regex in self.skip_regexs):
             # found some --skip regex, so do not toast
             return False
@@ -1172,25 +2241,6 @@ class Toaster(object):
         :type top: str
         """
 
-        def file_pools(chunksize):
-            """Helper function which generates list of files, sorted by size,
-            in chunks of given size.
-            """
-            all_files = pyffi.utils.walk(
-                top, onerror=None,
-                re_filename=self.FILEFORMAT.RE_FILENAME)
-            while True:
-                # fetch chunksize files from all files
-                file_pool = [
-                    filename for i, filename in zip(
-                        range(chunksize), all_files)]
-                if not file_pool:
-                    # done!
-                    break
-                # sort files by size
-                file_pool.sort(key=os.path.getsize, reverse=True)
-                yield file_pool
-
         # toast entry code
         if not self.spellclass.toastentry(self):
             self.msg("spell does not apply! quiting early...")
@@ -1248,29 +2298,73 @@ class Toaster(object):
 
         # walk over all streams, and create a data instance for each of them
         # inspect the file but do not yet read in full
-        if jobs == 1:
+        if jobs == 1 and self.options["readahead"] and not self.options["mmap"]:
+            self._toast_read_ahead(top)
+        elif jobs == 1:
             for stream in self.FILEFORMAT.walk(top, mode='rb' if self.spellclass.READONLY else 'r+b'):
                 self._toast(stream)
                 if self.options["gccollect"]:
                     # force free memory (helps when parsing many files)
                     gc.collect()
         else:
-            chunksize = self.options["refresh"] * self.options["jobs"]
-            self.msg("toasting with %i threads in chunks of %i files"
-                     % (jobs, chunksize))
-            for file_pool in file_pools(chunksize):
-                self.logger.debug("process file pool:")
-                for filename in file_pool:
-                    self.logger.debug("  " + filename)
-                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
-                    list(executor.map(
-                        _toaster_job,
-                        ((self.__class__, filename, self.options, self.spellnames)
-                         for filename in file_pool)))
+            self.msg("toasting with %i processes" % jobs)
+            max_memory = self.options["maxmemory"] * 0x100000
+            pool = _ToasterPool(self, jobs, max_files=self.options["refresh"],
+                                max_memory=max_memory,
+                                timeout=self.options["timeout"])
+            files = pyffi.utils.scan(
+                top, re_filename=self.FILEFORMAT.RE_FILENAME)
+            if max_memory:
+                # schedule by expected memory rather than by size
+                files = ((filename, self.estimate_memory(filename, size))
+                         for filename, size in files)
+            for filename, size in _LargestFirst(files):
+                self.logger.debug("queue " + filename)
+                pool.submit(filename, size if max_memory else 0)
+            pool.close()
 
         # toast exit code
         self.spellclass.toastexit(self)
 
+        if self.profiler is not None:
+            self.profiler.log_summary(self)
+            self.profiler.save(self.options["profile"])
+
+    def _toast_read_ahead(self, top):
+        """Toast all files in a directory tree, while a background thread
+        reads the next files in memory, and another one writes the
+        toasted files.
+        """
+        num_files = self.options["readahead"]
+        reader = _ReadAhead(
+            pyffi.utils.walk(top, onerror=None,
+                             re_filename=self.FILEFORMAT.RE_FILENAME),
+            num_files)
+        self._writer = _WriteBehind(num_files)
+        try:
+            for stream in reader:
+                self._toast(stream)
+                self._check_writes()
+                if self.options["gccollect"]:
+                    gc.collect()
+        finally:
+            reader.close()
+            self._writer.close()
+            self._check_writes()
+            self._writer = None
+
+    def _check_writes(self):
+        """Mark the files which failed to be written in the background."""
+        for name, expt in self._writer.get_failures():
+            self.logger.error("FAILED TO WRITE {0}".format(name))
+            self.logger.error("EXPT MSG : " + str(expt))
+            result = self.file_results[name]
+            result.status = "failed"
+            self.files_done.pop(name, None)
+            self.files_failed.add(name)
+            if self.options["raisetesterror"]:
+                raise expt
+
     def toast_archives(self, top):
         """Toast all files in all archives."""
         if not self.FILEFORMAT.ARCHIVE_CLASSES:
@@ -1304,48 +2398,116 @@ class Toaster(object):
     def _toast(self, stream):
         """Run toaster on particular stream and data.
         Used as helper function.
+
+        :return: The result.
+        :rtype: :class:`ToastResult`
+        """
+        result = ToastResult(stream.name)
+        if self.profiler is not None:
+            self.profiler.begin_file(stream.name)
+        start = time.time()
+        try:
+            self._toast_stream(stream, result)
+        finally:
+            result.time = time.time() - start
+            if self.profiler is not None:
+                result.profile = self.profiler.end_file()
+            self.add_result(result)
+        return result
+
+    def _profile_phase(self, name):
+        """Context manager which records the time spent in the *name*
+        phase of toasting the current file, if profiling.
+        """
+        if self.profiler is None:
+            return _NoProfilePhase()
+        return self.profiler.phase(name)
+
+    def _toast_stream(self, stream, result):
+        """Helper function for :meth:`_toast`, which stores the outcome
+        in *result*.
         """
         # inspect the file name
         if not self.inspect_filename(stream.name):
             self.msg("=== %s (skipped) ===" % stream.name)
-            self.files_skipped.add(stream.name)
+            result.status = "skipped"
             return
 
         # check if file exists
         if self.options["resume"]:
             if self.spellclass.get_toast_stream(self, stream.name, test_exists=True):
                 self.msg("=== %s (already done) ===" % stream.name)
+                result.status = "exists"
+                return
+
+        # check if the result is cached
+        cache_key = self._get_cache_key(stream)
+        if cache_key is not None:
+            entry = self._load_cache(cache_key)
+            if entry is not None:
+                self.msg("=== %s (cached) ===" % stream.name)
+                result.changed, result.reports, output = entry
+                if output is not None:
+                    with self._profile_phase("write"):
+                        self._write(
+                            stream, lambda outstream: outstream.write(output))
+                result.status = "done"
                 return
 
         data = self.FILEFORMAT.Data()
 
+        # files are only mapped if they are not written back, as writing
+        # would change the data under the map
+        instream = stream
+        if self.options["mmap"] and self.spellclass.READONLY:
+            instream = MmapStream.from_stream(stream) or stream
+
         self.msgblockbegin("=== %s ===" % stream.name)
         try:
-            # inspect the file (reads only the header)
-            data.inspect(stream)
-
-            # create spell instance
-            spell = self.spellclass(toaster=self, data=data, stream=stream)
-            
-            # inspect the spell instance
-            if spell._datainspect() and spell.datainspect():
-                # read the full file
-                data.read(stream)
+            with self._profile_phase("inspect"):
+                # inspect the file (reads only the header)
+                data.inspect(instream)
+
+                # create spell instance
+                spell = self.spellclass(toaster=self, data=data, stream=stream)
+                output = None
+
+                # inspect the spell instance
+                inspected = spell._datainspect() and spell.datainspect()
+            if inspected:
+                # read the full file, or as much of it as the spell needs
+                with self._profile_phase("read"):
+                    data.read(instream, **self.get_read_options())
                 
                 # cast the spell on the data tree
-                spell.recurse()
+                with self._profile_phase("cast"):
+                    spell.recurse()
 
                 # save file back to disk if not readonly and the spell
                 # changed the file
                 if (not self.spellclass.READONLY) and spell.changed:
-                    if self.options["createpatch"]:
-                        self.writepatch(stream, data)
-                    else:
-                        self.write(stream, data)
-            self.files_done[stream.name] = spell.reports
+                    with self._profile_phase("write"):
+                        if self.options["createpatch"]:
+                            self.writepatch(stream, data)
+                        elif cache_key is None or self.options["dryrun"]:
+                            self.write(stream, data)
+                        else:
+                            # keep the written file for the cache
+                            outstream = io.BytesIO()
+                            data.write(outstream)
+                            output = outstream.getvalue()
+                            self._write(
+                                stream,
+                                lambda outstream: outstream.write(output))
+            if cache_key is not None:
+                self._save_cache(
+                    cache_key, (spell.changed, spell.reports, output))
+            result.status = "done"
+            result.reports = spell.reports
+            result.changed = spell.changed
 
         except Exception as expt:
-            self.files_failed.add(stream.name)
+            result.status = "failed"
             self.logger.error("FAILED ON {0} - with the follow exception".format(stream.name))
             self.logger.error("EXPT MSG : " + str(expt))
             self.logger.error("If you were running a spell that came with PyFFI")
@@ -1354,8 +2516,140 @@ class Toaster(object):
             if self.options["raisetesterror"]:
                 raise
         finally:
+            if instream is not stream:
+                instream.close()
             self.msgblockend()
 
+    def _get_cache_key(self, stream):
+        """Get the key under which the result of toasting *stream* is
+        cached, or ``None`` if results are not cached.
+
+        :param stream: The file to toast.
+        :type stream: ``file``
+        :return: The key.
+        :rtype: ``str``
+        """
+        if (not self.options["cache"] or not self.spellclass.CACHEABLE
+            or self.options["createpatch"]):
+            return None
+        if self._cache_salt is None:
+            self._cache_salt = self._get_cache_salt()
+        hsh = hashlib.sha1(self._cache_salt)
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(0x100000), b""):
+            hsh.update(chunk)
+        stream.seek(0)
+        return hsh.hexdigest()
+
+    _CACHE_IGNORED_OPTIONS = frozenset((
+        "verbose", "pause", "examples", "spells", "interactive", "helpspell",
+        "jobs", "refresh", "maxmemory", "timeout", "sourcedir", "destdir", "prefix", "suffix",
+        "raisetesterror", "resume", "gccollect", "lazy", "mmap", "cache",
+        "readahead", "profile", "stage", "inifile"))
+    """Options which do not affect the result of toasting a file, nor
+    the written file (the location of the written file is not cached).
+    """
+
+    def _get_cache_salt(self):
+        """Hash of the pyffi version, the file format description, the
+        spells, and the options.
+        """
+        hsh = hashlib.sha1()
+        spells = [
+            (toaster.spellclass.SPELLNAME,
+             sorted((name, value) for name, value in toaster.options.items()
+                    if name not in self._CACHE_IGNORED_OPTIONS))
+            for toaster in [self] + self.stages]
+        hsh.update(repr((pyffi.__version__, spells)).encode("utf-8"))
+        xml_file_name = getattr(self.FILEFORMAT, "xml_file_name", None)
+        if xml_file_name:
+            with self.FILEFORMAT.openfile(
+                xml_file_name, self.FILEFORMAT.xml_file_path) as xml_file:
+                hsh.update(xml_file.read().encode("utf-8"))
+        return hsh.digest()
+
+    def _get_cache_file_name(self, key):
+        return os.path.join(self.options["cache"], key[:2], key)
+
+    def _load_cache(self, key):
+        """Get the cached ``(changed, reports, output)`` entry, where
+        output is the written file, or ``None`` if no file was written.
+        Returns ``None`` if there is no (valid) entry.
+        """
+        try:
+            with open(self._get_cache_file_name(key), "rb") as stream:
+                changed, reports, output = pickle.load(stream)
+        except Exception:
+            # missing or corrupt entry: the file is simply toasted
+            return None
+        return changed, reports, output
+
+    def _save_cache(self, key, entry):
+        """Store a ``(changed, reports, output)`` entry. Failures are
+        only logged: the file is simply toasted again next time.
+        """
+        filename = self._get_cache_file_name(key)
+        dirname = os.path.dirname(filename)
+        stream = None
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            # write to a temporary file and rename it, so other processes
+            # never see a partially written entry
+            with tempfile.NamedTemporaryFile(
+                dir=dirname, suffix=".tmp", delete=False) as stream:
+                pickle.dump(entry, stream, pickle.HIGHEST_PROTOCOL)
+            os.replace(stream.name, filename)
+        except Exception as err:
+            self.logger.warn(
+                "could not save cache entry %s: %s" % (filename, err))
+            if stream is not None:
+                try:
+                    os.remove(stream.name)
+                except OSError:
+                    pass
+
+    def add_result(self, result):
+        """Record the result of toasting a file, either in this process,
+        or in a worker process.
+
+        :param result: The result.
+        :type result: :class:`ToastResult`
+        """
+        self.file_results[result.name] = result
+        if self.profiler is not None and result.profile is not None:
+            self.profiler.add_file(result.profile)
+        if result.status == "done":
+            self.files_done[result.name] = result.reports
+        elif result.status == "skipped":
+            self.files_skipped.add(result.name)
+        elif result.status in ("failed", "timeout", "crashed"):
+            self.files_failed.add(result.name)
+
+    def estimate_memory(self, filename, size):
+        """Estimate the memory needed to toast a file. This is used to
+        schedule files when the toaster has a memory budget (see the
+        ``maxmemory`` option), and is called from a background thread.
+
+        :param filename: The name of the file.
+        :type filename: ``str``
+        :param size: The size of the file, in bytes.
+        :type size: ``int``
+        :return: The memory, in bytes.
+        :rtype: ``int``
+        """
+        return size * self.MEMORY_PER_BYTE
+
+    def get_read_options(self):
+        """Get the keyword arguments with which the toaster reads the
+        data of a file, for the current spell and options. Override
+        this for formats whose data can be read with extra arguments,
+        such as ``lazy``. By default, no extra arguments are passed.
+
+        :return: The keyword arguments.
+        :rtype: ``dict``
+        """
+        return {}
+
     def get_toast_head_root_ext(self, filename):
         """Get the name of where the input file *filename* would
         be written to by the toaster: head, root, and extension.
@@ -1422,41 +2716,36 @@ class Toaster(object):
                 self.msg("overwriting %s" % filename)
             else:
                 self.msg("writing %s" % filename)
-            return open(filename, "wb")
+            return AtomicFile(filename)
 
     def write(self, stream, data):
         """Writes the data to data and raises an exception if the
-        write fails, but restores file if fails on overwrite.
+        write fails. The file is written to a temporary file first,
+        which replaces the original only if writing succeeds.
+        """
+        self._write(stream, data.write)
+
+    def _write(self, stream, write):
+        """Helper function for :meth:`write`, which calls *write* with
+        the output stream as argument.
         """
         outstream = self.spellclass.get_toast_stream(self, stream.name)
-        if stream is outstream:
-            # make backup
-            stream.seek(0)
-            backup = stream.read(-1)
-            stream.seek(0)
         try:
-            try:
-                data.write(outstream)
-            except:  # not just Exception, also CTRL-C
-                self.msg("write failed!!!")
-                if stream is outstream:
-                    self.msg("attempting to restore original file...")
-                    stream.seek(0)
-                    stream.write(backup)
-                    stream.truncate()
-                else:
-                    outstream_name = outstream.name
-                    self.msg("removing incompletely written file...")
-                    outstream.close()
-                    # temporary streams are removed on close
-                    # so check if it exists before removing
-                    if os.path.exists(outstream_name):
-                        os.remove(outstream_name)
-                raise
-            if stream is outstream:
-                stream.truncate()
-        finally:
+            if self._writer is None:
+                write(outstream)
+            else:
+                # write in the background
+                buffer_ = io.BytesIO()
+                write(buffer_)
+        except:  # not just Exception, also CTRL-C
+            self.msg("write failed!!!")
+            self.msg("removing incompletely written file...")
+            _discard_stream(outstream)
+            raise
+        if self._writer is None:
             outstream.close()
+        else:
+            self._writer.submit(stream.name, outstream, buffer_.getvalue())
 
     def writepatch(self, stream, data):
         """Creates a binary patch for the updated file."""
@@ -146,3 +146,31 @@ class SpellVisitSkeletonRoots(NifSpell):
 
 class NifToaster(pyffi.spells.Toaster):
     FILEFORMAT = NifFormat
+
+    MEMORY_PER_BLOCK = 16384
+    """Rough number of bytes of memory needed per block of a nif file,
+    on top of :attr:`~pyffi.spells.Toaster.MEMORY_PER_BYTE`.
+    """
+
+    def estimate_memory(self, filename, size):
+        memory = pyffi.spells.Toaster.estimate_memory(self, filename, size)
+        # the header lists the number of blocks
+        data = NifFormat.Data()
+        try:
+            with open(filename, "rb") as stream:
+                data.inspect(stream)
+        except Exception:
+            # not a valid nif: the error is reported when it is toasted
+            return memory
+        return memory + data.header.num_blocks * self.MEMORY_PER_BLOCK
+
+    def get_read_options(self):
+        kwargs = pyffi.spells.Toaster.get_read_options(self)
+        if self.options["lazy"]:
+            kwargs["lazy"] = True
+        if self.spellclass.BLOCKTYPES is not None:
+            kwargs["block_types"] = self.spellclass.BLOCKTYPES
+        if not self.spellclass.READONLY:
+            # blocks which the spell does not change are copied on write
+            kwargs["incremental"] = True
+        return kwargs
@@ -102,12 +102,23 @@ class SpellNodeNamesByFlag(pyffi.spells.nif.NifSpell):
     of which node names where used with particular flags."""
 
     SPELLNAME = "check_nodenamesbyflag"
+    CACHEABLE = False
 
     @classmethod
     def toastentry(cls, toaster):
         toaster.flagdict = {}
         return True
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return toaster.flagdict
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        for flag, names in result.items():
+            flagnames = toaster.flagdict.setdefault(flag, [])
+            flagnames.extend(name for name in names if name not in flagnames)
+
     @classmethod
     def toastexit(cls, toaster):
         for flag, names in toaster.flagdict.items():
@@ -134,6 +145,7 @@ class SpellCompareSkinData(pyffi.spells.nif.NifSpell):
     """This spell compares skinning data with a reference nif."""
 
     SPELLNAME = "check_compareskindata"
+    CACHEABLE = False
 
     # helper functions (to compare with custom tolerance)
 
@@ -528,14 +540,15 @@ class SpellCheckMopp(pyffi.spells.nif.NifSpell):
     Mainly useful to check the heuristic parser and for debugging mopp codes.
     """
     SPELLNAME = "check_mopp"
+    BLOCKTYPES = (NifFormat.NiAVObject,
+                  NifFormat.bhkNiCollisionObject,
+                  NifFormat.bhkRefObject)
 
     def datainspect(self):
         return self.inspectblocktype(NifFormat.bhkMoppBvTreeShape)
 
     def branchinspect(self, branch):
-        return isinstance(branch, (NifFormat.NiAVObject,
-                                   NifFormat.bhkNiCollisionObject,
-                                   NifFormat.bhkRefObject))
+        return isinstance(branch, self.BLOCKTYPES)
 
     def branchentry(self, branch):
         if not isinstance(branch, NifFormat.bhkMoppBvTreeShape):
@@ -690,12 +703,21 @@ class SpellCheckTriStrip(pyffi.spells.nif.NifSpell):
     various stripification algorithms over a large collection of geometries).
     """
     SPELLNAME = 'check_tristrip'
+    CACHEABLE = False
 
     @classmethod
     def toastentry(cls, toaster):
         toaster.striplengths = []
         return True
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return toaster.striplengths
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        toaster.striplengths.extend(result)
+
     @classmethod
     def toastexit(cls, toaster):
         toaster.msg("average strip length = %.6f"
@@ -797,6 +819,7 @@ class SpellCheckVersion(pyffi.spells.nif.NifSpell):
     """Checks all versions used by the files (without reading the full files).
     """
     SPELLNAME = 'check_version'
+    CACHEABLE = False
 
     @classmethod
     def toastentry(cls, toaster):
@@ -805,6 +828,27 @@ class SpellCheckVersion(pyffi.spells.nif.NifSpell):
         toaster.user_version_2s = {} # tracks used user version2's per version
         return True
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return (toaster.versions, toaster.user_versions,
+                toaster.user_version_2s)
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        versions, user_versions, user_version_2s = result
+        for version, num_nifs in versions.items():
+            if version not in toaster.versions:
+                toaster.versions[version] = 0
+                toaster.user_versions[version] = []
+                toaster.user_version_2s[version] = []
+            toaster.versions[version] += num_nifs
+            for user_version in user_versions[version]:
+                if user_version not in toaster.user_versions[version]:
+                    toaster.user_versions[version].append(user_version)
+            for user_version_2 in user_version_2s[version]:
+                if user_version_2 not in toaster.user_version_2s[version]:
+                    toaster.user_version_2s[version].append(user_version_2)
+
     @classmethod
     def toastexit(cls, toaster):
         for version in toaster.versions:
@@ -880,6 +924,7 @@ class SpellCheckTriangles(pyffi.spells.nif.NifSpell):
     """Base class for spells which need to check all triangles."""
 
     SPELLNAME = "check_triangles"
+    CACHEABLE = False
 
     def datainspect(self):
         # only run the spell if there are geometries
@@ -904,6 +949,14 @@ class SpellCheckTriangles(pyffi.spells.nif.NifSpell):
             # keep recursing into children
             return True
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return toaster.geometries
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        toaster.geometries.extend(result)
+
     @classmethod
     def toastexit(cls, toaster):
         toaster.msg("found {0} geometries".format(len(toaster.geometries)))
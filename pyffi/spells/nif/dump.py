@@ -66,15 +66,15 @@ def dumpArray(arr):
     """
     text = ""
     if arr._count2 == None:
-        for i, element in enumerate(list.__iter__(arr)):
+        for i, element in enumerate(arr.get_detail_child_nodes()):
             if i > 16:
                 text += "etc...\n"
                 break
             text += "%i: %s\n" % (i, dumpAttr(element))
     else:
         k = 0
-        for i, elemlist in enumerate(list.__iter__(arr)):
-            for j, elem in enumerate(list.__iter__(elemlist)):
+        for i, elemlist in enumerate(arr.get_detail_child_nodes()):
+            for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                 if k > 16:
                     text += "etc...\n"
                     break
@@ -207,6 +207,7 @@ class SpellHtmlReport(NifSpell):
     """Make a html report of selected blocks."""
 
     SPELLNAME = "dump_htmlreport"
+    CACHEABLE = False
     ENTITIES = { "\n": "<br/>" }
 
     @classmethod
@@ -252,6 +253,19 @@ class SpellHtmlReport(NifSpell):
         # keep looking for blocks of interest
         return True
 
+    @classmethod
+    def toastmap(cls, toaster):
+        return toaster.reports_per_blocktype
+
+    @classmethod
+    def toastreduce(cls, toaster, result):
+        for blocktype, reports in result.items():
+            if blocktype in toaster.reports_per_blocktype:
+                # skip the header row
+                toaster.reports_per_blocktype[blocktype].extend(reports[1:])
+            else:
+                toaster.reports_per_blocktype[blocktype] = reports
+
     @classmethod
     def toastexit(cls, toaster):
         if toaster.reports_per_blocktype:
@@ -307,6 +321,7 @@ class SpellExportPixelData(NifSpell):
     """
 
     SPELLNAME = "dump_pixeldata"
+    CACHEABLE = False
 
     def __init__(self, *args, **kwargs):
         NifSpell.__init__(self, *args, **kwargs)
@@ -420,6 +435,7 @@ class SpellDumpPython(NifSpell):
     """Convert a nif into python code."""
 
     SPELLNAME = "dump_python"
+    CACHEABLE = False
 
     def print_(self, line=None):
         if line:
@@ -443,14 +459,14 @@ class SpellDumpPython(NifSpell):
             if _value:
                 self.print_("%s.update_size()" % name)
                 if _value._count2 is None:
-                    for i, elem in enumerate(list.__iter__(_value)):
+                    for i, elem in enumerate(_value.get_detail_child_nodes()):
                         if self.print_instance(
                             "%s[%i]" % (name, i), elem):
 
                             result = True
                 else:
-                    for i, elemlist in enumerate(list.__iter__(_value)):
-                        for j, elem in enumerate(list.__iter__(elemlist)):
+                    for i, elemlist in enumerate(_value.get_detail_child_nodes()):
+                        for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                             if self.print_instance(
                                 "%s[%i][%i]" % (name, i, j), elem):
 
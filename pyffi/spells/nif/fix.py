@@ -224,6 +224,11 @@ class SpellParseTexturePath(NifSpell):
 
     # abstract spell, so no spell name
     READONLY = False
+    BLOCKTYPES = (NifFormat.NiAVObject,
+                  NifFormat.NiTexturingProperty,
+                  NifFormat.NiSourceTexture,
+                  NifFormat.BSLightingShaderProperty,
+                  NifFormat.BSShaderTextureSet)
 
     def substitute(self, old_path):
         """Helper function to allow subclasses of this spell to
@@ -246,11 +251,7 @@ class SpellParseTexturePath(NifSpell):
     def branchinspect(self, branch):
         # only inspect the NiAVObject branch, texturing properties and source
         # textures
-        return isinstance(branch, (NifFormat.NiAVObject,
-                                   NifFormat.NiTexturingProperty,
-                                   NifFormat.NiSourceTexture,
-                                   NifFormat.BSLightingShaderProperty,
-                                   NifFormat.BSShaderTextureSet))
+        return isinstance(branch, self.BLOCKTYPES)
     
     def branchentry(self, branch):
         if isinstance(branch, NifFormat.NiSourceTexture):
@@ -915,6 +915,7 @@ class SpellGetBonePriorities(NifSpell):
     """
 
     SPELLNAME = "modify_getbonepriorities"
+    CACHEABLE = False
 
     def datainspect(self):
         # continue only if nif/kf contains NiSequence
@@ -978,6 +979,7 @@ class SpellSetBonePriorities(NifSpell):
     """
 
     SPELLNAME = "modify_setbonepriorities"
+    CACHEABLE = False
     READONLY = False
 
     def datainspect(self):
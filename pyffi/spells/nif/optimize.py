@@ -164,8 +164,10 @@ class SpellMergeDuplicates(pyffi.spells.nif.NifSpell):
 
     def __init__(self, *args, **kwargs):
         pyffi.spells.nif.NifSpell.__init__(self, *args, **kwargs)
-        # list of all branches visited so far
-        self.branches = []
+        # branches visited so far, indexed by their interchangeable key
+        self.branches = {}
+        # duplicate branches found so far, with their replacement
+        self.replacements = {}
 
     def datainspect(self):
         # see MadCat221's metstaff.nif:
@@ -186,29 +188,36 @@ class SpellMergeDuplicates(pyffi.spells.nif.NifSpell):
                                    NifFormat.NiGeometryData))
 
     def branchentry(self, branch):
-        for otherbranch in self.branches:
-            if (branch is not otherbranch and
-                branch.is_interchangeable(otherbranch)):
-                # skip properties that have controllers (the
-                # controller data cannot always be reliably checked,
-                # see also issue #2106668)
-                if (isinstance(branch, NifFormat.NiProperty)
-                    and branch.controller):
-                    continue
-                # skip BSShaderProperty blocks (see niftools issue #3009832)
-                if isinstance(branch, NifFormat.BSShaderProperty):
-                    continue
-                # interchangeable branch found!
-                self.toaster.msg("removing duplicate branch")
-                self.data.replace_global_node(branch, otherbranch)
-                self.changed = True
-                # branch has been replaced, so no need to recurse further
-                return False
-        else:
-            # no duplicate found, add to list of visited branches
-            self.branches.append(branch)
-            # continue recursion
-            return True
+        # the key is computed only once for every branch, and only
+        # branches with the same key are compared
+        candidates = self.branches.setdefault(
+            branch.get_interchangeable_key(), [])
+        # skip properties that have controllers (the
+        # controller data cannot always be reliably checked,
+        # see also issue #2106668)
+        # skip BSShaderProperty blocks (see niftools issue #3009832)
+        if not ((isinstance(branch, NifFormat.NiProperty)
+                 and branch.controller)
+                or isinstance(branch, NifFormat.BSShaderProperty)):
+            for otherbranch in candidates:
+                if (branch is not otherbranch and
+                    branch.is_interchangeable(otherbranch)):
+                    # interchangeable branch found!
+                    self.toaster.msg("removing duplicate branch")
+                    # replacing is postponed until all duplicates have
+                    # been found, so the tree is traversed only once
+                    self.replacements[branch] = otherbranch
+                    self.changed = True
+                    # branch will be replaced, so no need to recurse further
+                    return False
+        # no duplicate found, add to list of visited branches
+        candidates.append(branch)
+        # continue recursion
+        return True
+
+    def dataexit(self):
+        if self.replacements:
+            self.data.replace_global_nodes(self.replacements)
 
 class SpellOptimizeGeometry(pyffi.spells.nif.NifSpell):
     """Optimize all geometries:
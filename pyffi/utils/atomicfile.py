@@ -0,0 +1,144 @@
+"""Files which are written atomically.
+
+An :class:`AtomicFile` writes to a temporary file next to the file it
+replaces, and only replaces the file when it is closed. So, if writing
+fails, :meth:`AtomicFile.discard` leaves the original file untouched,
+and other processes never see a partially written file.
+
+>>> import os.path
+>>> import tempfile
+>>> folder = tempfile.mkdtemp()
+>>> filename = os.path.join(folder, "test.bin")
+>>> with open(filename, "wb") as stream:
+...     _ = stream.write(b"original")
+>>> stream = AtomicFile(filename)
+>>> _ = stream.write(b"failed")
+>>> stream.discard()
+>>> open(filename, "rb").read()
+b'original'
+>>> with AtomicFile(filename) as stream:
+...     _ = stream.write(b"replaced")
+>>> open(filename, "rb").read()
+b'replaced'
+>>> os.listdir(folder)
+['test.bin']
+>>> os.remove(filename)
+>>> os.rmdir(folder)
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import io
+import os
+import shutil
+
+
+class AtomicFile(io.BufferedWriter):
+    """A file opened for writing in binary mode, whose content replaces
+    the file *filename* when the stream is closed. The temporary file
+    is created in the same folder, with the same permissions as
+    *filename* if it exists.
+    """
+
+    temp_name = None
+    """The name of the temporary file, or ``None`` once the stream is
+    closed or discarded.
+    """
+
+    def __init__(self, filename):
+        """Create the temporary file.
+
+        :param filename: The name of the file to write.
+        :type filename: ``str``
+        """
+        index = 0
+        while True:
+            temp_name = "%s.%i-%i.tmp" % (filename, os.getpid(), index)
+            try:
+                fileno = os.open(
+                    temp_name,
+                    os.O_WRONLY | os.O_CREAT | os.O_EXCL
+                    | getattr(os, "O_BINARY", 0), 0o666)
+            except FileExistsError:
+                index += 1
+            else:
+                break
+        raw = io.FileIO(fileno, "wb")
+        raw.name = filename
+        io.BufferedWriter.__init__(self, raw)
+        self.temp_name = temp_name
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_name)
+
+    def close(self):
+        """Close the temporary file, and replace the file by it."""
+        if self.closed:
+            return
+        io.BufferedWriter.close(self)
+        self.temp_name, temp_name = None, self.temp_name
+        try:
+            os.replace(temp_name, self.name)
+        except PermissionError:
+            # on windows, files which are open cannot be replaced,
+            # so copy the content instead
+            with open(temp_name, "rb") as source:
+                with open(self.name, "wb") as dest:
+                    shutil.copyfileobj(source, dest)
+            os.remove(temp_name)
+
+    def discard(self):
+        """Close and remove the temporary file, leaving the file which
+        was to be written untouched.
+        """
+        if not self.closed:
+            io.BufferedWriter.close(self)
+        if self.temp_name is not None:
+            self.temp_name, temp_name = None, self.temp_name
+            os.remove(temp_name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def __del__(self):
+        # never replace the file by an incompletely written one
+        if self.temp_name is not None:
+            self.discard()
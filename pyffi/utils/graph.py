@@ -113,6 +113,8 @@ class DetailNode(object):
     implemented.
     """
 
+    __slots__ = ()
+
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Generator which yields all children of this item in the
         detail view (by default, all acyclic and active ones).
@@ -168,9 +170,21 @@ class DetailNode(object):
         """Replace a particular branch in the graph."""
         raise NotImplementedError
 
+    def replace_global_nodes(self, replacements, edge_filter=EdgeFilter()):
+        """Replace several branches in the graph at once. This is
+        much faster than calling :meth:`replace_global_node` for every
+        branch, as the graph is traversed only once.
+
+        :param replacements: Maps old branches to new branches.
+        :type replacements: ``dict``
+        """
+        raise NotImplementedError
+
 class GlobalNode(DetailNode):
     """A node of the global graph."""
 
+    __slots__ = ()
+
     def get_global_display(self):
         """Very short summary of the data of this global branch for display
         purposes. Override this method.
@@ -0,0 +1,163 @@
+"""Read only file streams backed by a memory map.
+
+A :class:`MmapStream` can be passed to any ``read`` or ``inspect``
+method instead of a file opened in ``'rb'`` mode. Small reads are
+served straight from the page cache, and :meth:`MmapStream.read_view`
+gives access to large chunks of the file without copying them.
+
+>>> import tempfile
+>>> with tempfile.TemporaryFile() as stream:
+...     _ = stream.write(b"header, followed by a large payload")
+...     _ = stream.seek(0)
+...     mapped = MmapStream.from_stream(stream)
+...     mapped.read(6)
+...     _ = mapped.seek(2, 1)
+...     view = mapped.read_view(-1)
+...     view.tobytes()
+...     view.release()
+...     mapped.close()
+b'header'
+b'followed by a large payload'
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import mmap
+
+
+class MmapStream(mmap.mmap):
+    """A read only memory map of a file, with enough of the file
+    interface to be used as input stream. Reading, seeking, and so on,
+    are those of :class:`mmap.mmap`.
+
+    Views returned by :meth:`read_view` remain valid after the stream is
+    closed, as long as the file itself is not modified: the map is only
+    released once the last view is gone.
+    """
+
+    name = None
+    """The name of the mapped file."""
+
+    mode = 'rb'
+    """The mode of the stream."""
+
+    @classmethod
+    def from_stream(cls, stream):
+        """Map the file of *stream*, starting at its current position
+        (so reading starts at offset zero of the map, and the stream
+        itself is left untouched).
+
+        :param stream: The file to map.
+        :type stream: ``file``
+        :return: The mapped stream, or ``None`` if *stream* cannot be
+            mapped (for instance, if it is not a real file, or if it is
+            empty).
+        """
+        try:
+            stream.flush()
+            fileno = stream.fileno()
+            offset = stream.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+        # the offset of a map must be aligned
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        try:
+            mapped = cls(fileno, 0, access=mmap.ACCESS_READ, offset=start)
+        except (OSError, ValueError):
+            # mmap does not support empty files, pipes, ...
+            return None
+        mapped.seek(offset - start)
+        mapped.name = getattr(stream, "name", None)
+        return mapped
+
+    def read_view(self, size=-1):
+        """Like :meth:`read`, but return a read only :class:`memoryview`
+        into the map rather than a copy of the bytes.
+
+        :param size: The number of bytes to read, or ``-1`` to read
+            until the end of the file.
+        :type size: ``int``
+        :rtype: ``memoryview``
+        """
+        pos = self.tell()
+        end = len(self) if size < 0 else min(pos + size, len(self))
+        self.seek(end)
+        return memoryview(self)[pos:end]
+
+    def readinto(self, buffer_):
+        """Read bytes into a writable buffer, such as an
+        :class:`array.array` or a :class:`bytearray`.
+
+        :return: The number of bytes read.
+        :rtype: ``int``
+        """
+        with memoryview(buffer_) as dest:
+            with dest.cast('B') as dest:
+                with self.read_view(len(dest)) as source:
+                    dest[:len(source)] = source
+                    return len(source)
+
+    def readline(self, size=-1):
+        """Read up to and including the next newline, but at most *size*
+        bytes if *size* is not negative.
+        """
+        pos = self.tell()
+        end = self.find(b"\n", pos)
+        end = len(self) if end < 0 else end + 1
+        if size >= 0:
+            end = min(end, pos + size)
+        return self.read(end - pos)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def close(self):
+        """Close the stream. If views are still in use, then the map is
+        released when the last view is gone instead.
+        """
+        try:
+            mmap.mmap.close(self)
+        except BufferError:
+            pass
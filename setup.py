@@ -81,7 +81,28 @@ DOWNLOAD_URL = "https://github.com/niftools/pyffi/releases"
 try:
     from sphinx.setup_command import BuildDoc
 except ImportError:
-    from pyffi.utils import BuildDoc
+    from distutils.cmd import Command
+
+    class BuildDoc(Command):
+        """
+        Distutils command to stop setup.py from throwing errors
+        if sphinx is not installed
+        """
+
+        description = 'Sphinx is not installed'
+        user_options = []
+
+        def initialize_options(self):
+            self.source_dir = self.build_dir = None
+            self.project = ''
+            self.version = ''
+            self.release = ''
+
+        def finalize_options(self):
+            return
+
+        def run(self):
+            raise ModuleNotFoundError("Sphinx is not installed")
 
 CMD_CLASS = {'build_docs': BuildDoc}
 COMMAND_OPTIONS = {
@@ -0,0 +1,202 @@
+import io
+import os.path
+
+from nose.tools import (
+    assert_equals, assert_true, assert_false, assert_is, assert_raises)
+
+from pyffi.formats.nif import NifFormat
+
+FILES = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "spells", "nif", "files")
+
+
+def _read(filename, **kwargs):
+    data = NifFormat.Data()
+    with open(os.path.join(FILES, filename), "rb") as stream:
+        data.read(stream, **kwargs)
+    return data
+
+
+def _is_deferred(block):
+    return "_deferred_complete" in block.__dict__
+
+
+class TestLazyRead:
+    """Tests for NifFormat.Data.read with lazy=True."""
+
+    filename = "test_check_tangentspace2.nif"
+
+    def test_blocks_deferred(self):
+        data = _read(self.filename, lazy=True)
+        assert_equals(data.version, 0x14020007)
+        assert_true(all(_is_deferred(block) for block in data.blocks))
+        assert_true(isinstance(data.roots[0], NifFormat.NiNode))
+        assert_is(data.roots[0], data.blocks[0])
+
+    def test_parse_on_access(self):
+        data = _read(self.filename, lazy=True)
+        root = data.roots[0]
+        assert_equals(root.name, b"Scene Root")
+        assert_false(_is_deferred(root))
+        # children are linked, but not parsed
+        child = root.children[0]
+        assert_is(child, data.blocks[1])
+        assert_true(_is_deferred(child))
+        assert_equals(child.name, _read(self.filename).blocks[1].name)
+
+    def test_write(self):
+        data = _read(self.filename, lazy=True)
+        reference = _read(self.filename)
+        stream = io.BytesIO()
+        data.write(stream)
+        reference_stream = io.BytesIO()
+        reference.write(reference_stream)
+        assert_equals(stream.getvalue(), reference_stream.getvalue())
+        assert_equals([block.get_hash() for block in data.blocks],
+                      [block.get_hash() for block in reference.blocks])
+
+    def test_corrupt_block(self):
+        data = _read(self.filename, lazy=True)
+        child = data.blocks[1]
+        raw_block = data._raw_blocks[child]
+        raw_block.raw = raw_block.raw[:len(raw_block.raw) // 2]
+        # the block stays deferred, so every access fails
+        for i in range(2):
+            assert_raises(Exception, getattr, child, "name")
+            assert_true(_is_deferred(child))
+            assert_is(data._raw_blocks[child], raw_block)
+        # never written with default values
+        assert_raises(Exception, data.write, io.BytesIO())
+
+    def test_old_version(self):
+        # no block sizes in the header: blocks are parsed on read
+        data = _read("test_vertexcolor.nif", lazy=True)
+        assert_false(any(_is_deferred(block) for block in data.blocks))
+
+
+class TestPartialRead:
+    """Tests for NifFormat.Data.read with block_types."""
+
+    filename = "test_check_tangentspace2.nif"
+    block_types = (NifFormat.NiAVObject, NifFormat.NiMaterialProperty)
+
+    def test_blocks_deferred(self):
+        data = _read(self.filename, block_types=self.block_types)
+        for block in data.blocks:
+            assert_equals(_is_deferred(block),
+                          not isinstance(block, self.block_types))
+        # parsed blocks are linked to the unparsed ones
+        shape = data.blocks[1]
+        assert_is(shape.data, data.blocks[5])
+        assert_true(_is_deferred(shape.data))
+
+    def test_write(self):
+        data = _read(self.filename, block_types=self.block_types)
+        reference = _read(self.filename)
+        stream = io.BytesIO()
+        data.write(stream)
+        reference_stream = io.BytesIO()
+        reference.write(reference_stream)
+        assert_equals(stream.getvalue(), reference_stream.getvalue())
+        # writing does not parse the blocks
+        assert_true(_is_deferred(data.blocks[5]))
+
+    def test_modify(self):
+        data = _read(self.filename, block_types=self.block_types)
+        # rename, and remove a property, so that indices of strings and
+        # of blocks that are written unparsed change
+        shape = data.blocks[1]
+        shape.name = b"Renamed"
+        shape.remove_property(data.blocks[4])
+        stream = io.BytesIO()
+        data.write(stream)
+        assert_true(_is_deferred(data.blocks[2]))
+        stream.seek(0)
+        data = NifFormat.Data()
+        data.read(stream)
+        reference = _read(self.filename)
+        shape = data.roots[0].children[0]
+        assert_equals(shape.name, b"Renamed")
+        assert_equals([prop.__class__ for prop in shape.get_properties()],
+                      [NifFormat.BSShaderPPLightingProperty])
+        assert_equals(shape.data.get_hash(),
+                      reference.blocks[5].get_hash())
+        assert_equals(shape.get_properties()[0].texture_set.get_hash(),
+                      reference.blocks[3].get_hash())
+
+
+def _write(data):
+    stream = io.BytesIO()
+    data.write(stream)
+    return stream.getvalue()
+
+
+def _reread(raw):
+    data = NifFormat.Data()
+    data.read(io.BytesIO(raw))
+    return data
+
+
+class TestIncrementalWrite:
+    """Tests for NifFormat.Data.write after a read with incremental=True."""
+
+    filename = "test_vertexcolor.nif"
+
+    def test_write(self):
+        data = _read(self.filename, incremental=True)
+        assert_true(all(block._pristine for block in data.blocks))
+        assert_equals(_write(data), _write(_read(self.filename)))
+        assert_true(all(block._pristine for block in data.blocks))
+
+    def test_changes(self):
+        data = _read(self.filename, incremental=True)
+        reference = _read(self.filename)
+        shape = data.blocks[1]
+        # basic attribute, in place change, and replacing a link
+        shape.name = b"Renamed"
+        data.blocks[6].vertices[0].x = 10
+        data.replace_global_node(data.blocks[5], None)
+        assert_equals(
+            [block._pristine is not None for block in data.blocks],
+            [True, False, True, True, True, True, False])
+        reference.blocks[1].name = b"Renamed"
+        reference.blocks[6].vertices[0].x = 10
+        reference.replace_global_node(reference.blocks[5], None)
+        raw = _write(data)
+        assert_equals(raw, _write(reference))
+        data = _reread(raw)
+        assert_equals(data.blocks[1].name, b"Renamed")
+        assert_equals(len(data.blocks), 6)
+
+    def test_version(self):
+        data = _read(self.filename, incremental=True)
+        reference = _read(self.filename)
+        data.version = reference.version = 0x14020007
+        data.user_version = reference.user_version = 11
+        assert_equals(_write(data), _write(reference))
+
+    def test_partial(self):
+        # blocks which are parsed later on are also tracked
+        data = _read("test_check_tangentspace2.nif", lazy=True)
+        shape = data.blocks[1]
+        assert_equals(shape.name, b"Plane")
+        assert_true(shape._pristine)
+        shape.name = b"Renamed"
+        assert_is(shape._pristine, None)
+        assert_equals(_reread(_write(data)).blocks[1].name, b"Renamed")
+
+
+class TestRefs:
+    """Tests for get_refs, which uses the compiled plans."""
+
+    def test_plans(self):
+        for filename in ("test_check_tangentspace2.nif", "test_vertexcolor.nif",
+                         "test_opt_delunusedbones.nif", "test_dump_tex.nif"):
+            data = _read(filename)
+            for block in data.blocks:
+                refs = block.get_refs()
+                block._use_plans = False
+                try:
+                    assert_equals(refs, block.get_refs())
+                finally:
+                    del block._use_plans
@@ -0,0 +1,161 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_true, assert_is, assert_raises
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import Float, UShort
+from pyffi.object_models.xml.array import Array, _TypedBuffer
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    Float = Float
+    UShort = UShort
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+
+class Vector(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='x', type='Float')),
+        Attr(SimpleFormat, dict(name='y', type='Float')),
+        Attr(SimpleFormat, dict(name='z', type='Float')),
+        ]
+SimpleFormat.Vector = Vector
+
+
+class Mesh(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='num', type='UShort')),
+        Attr(SimpleFormat, dict(name='rows', type='UShort')),
+        Attr(SimpleFormat, dict(name='vertices', type='Vector', arr1='num')),
+        Attr(SimpleFormat, dict(name='indices', type='UShort', arr1='num')),
+        Attr(SimpleFormat, dict(name='uvs', type='Float', arr1='rows',
+                                arr2='num')),
+        ]
+SimpleFormat.Mesh = Mesh
+
+
+class Data(FileFormat.Data):
+    def __init__(self, byte_order='<'):
+        self.version = 0
+        self.user_version = 0
+        self._byte_order = byte_order
+
+
+class TestTypedStorage(unittest.TestCase):
+
+    def setUp(self):
+        Array.use_typed_storage = True
+        mesh = Mesh()
+        mesh.num = 20
+        mesh.rows = 2
+        mesh.vertices.update_size()
+        mesh.indices.update_size()
+        mesh.uvs.update_size()
+        for i in range(20):
+            mesh.vertices[i].x = i
+            mesh.vertices[i].y = -i
+            mesh.vertices[i].z = 0.5
+            mesh.indices[i] = 100 + i
+            mesh.uvs[0][i] = 0.25 * i
+            mesh.uvs[1][i] = 1
+        self.mesh = mesh
+
+    def tearDown(self):
+        Array.use_typed_storage = False
+
+    def read(self, data):
+        stream = io.BytesIO()
+        self.mesh.write(stream, data)
+        stream.seek(0)
+        mesh = Mesh()
+        mesh.read(stream, data)
+        return mesh, stream.getvalue()
+
+    def test_read_write(self):
+        for byte_order in '<>':
+            data = Data(byte_order)
+            mesh, raw = self.read(data)
+            assert_true(isinstance(mesh.vertices._typed, _TypedBuffer))
+            assert_true(isinstance(mesh.indices._typed, _TypedBuffer))
+            assert_true(isinstance(mesh.uvs[0]._typed, _TypedBuffer))
+            assert_equals(mesh.get_size(data), len(raw))
+            assert_equals(mesh.get_hash(data), self.mesh.get_hash(data))
+            stream = io.BytesIO()
+            mesh.write(stream, data)
+            assert_equals(stream.getvalue(), raw)
+
+    def test_basic_items(self):
+        mesh, raw = self.read(Data())
+        assert_equals(len(mesh.indices), 20)
+        assert_equals(mesh.indices[3], 103)
+        assert_equals(list(mesh.indices)[-1], 119)
+        assert_true(105 in mesh.indices)
+        mesh.indices[3] = 7
+        assert_equals(mesh.indices[3], 7)
+        assert_raises(ValueError, mesh.indices.__setitem__, 3, -1)
+        assert_equals(list(mesh.uvs[0])[:3], [0, 0.25, 0.5])
+        # still typed
+        assert_true(isinstance(mesh.indices._typed, _TypedBuffer))
+
+    def test_struct_items(self):
+        mesh, raw = self.read(Data())
+        assert_equals(len(mesh.vertices), 20)
+        vec = mesh.vertices[4]
+        assert_is(mesh.vertices._typed, None)
+        assert_equals((vec.x, vec.y, vec.z), (4, -4, 0.5))
+        vec.x = 8
+        stream = io.BytesIO()
+        mesh.write(stream, Data())
+        mesh2 = Mesh()
+        stream.seek(0)
+        mesh2.read(stream, Data())
+        assert_equals(mesh2.vertices[4].x, 8)
+
+    def test_resize(self):
+        mesh, raw = self.read(Data())
+        mesh.num = 25
+        mesh.indices.update_size()
+        mesh.uvs.update_size()
+        assert_is(mesh.indices._typed, None)
+        assert_equals(len(mesh.indices), 25)
+        assert_equals(mesh.indices[19], 119)
+        assert_equals(len(mesh.uvs[1]), 25)
+        assert_equals(mesh.uvs[1][0], 1)
+
+    def test_short_read(self):
+        mesh, raw = self.read(Data())
+        assert_raises(Exception, Mesh().read, io.BytesIO(raw[:-2]), Data())
+
+    def test_min_length(self):
+        Array.typed_storage_min_length = 21
+        try:
+            mesh, raw = self.read(Data())
+        finally:
+            Array.typed_storage_min_length = 16
+        assert_is(mesh.vertices._typed, None)
+        assert_equals(mesh.vertices[4].y, -4)
+
+
+class TestHashDigest(unittest.TestCase):
+
+    def test_changes(self):
+        mesh = Mesh()
+        mesh.num = 3
+        mesh.rows = 1
+        digests = [mesh.get_hash_digest()]
+        for change in (mesh.vertices.update_size, mesh.indices.update_size,
+                       lambda: mesh.indices.__setitem__(1, 4),
+                       lambda: setattr(mesh.vertices[2], "z", 1.5),
+                       mesh.indices.pop):
+            change()
+            digest = mesh.get_hash_digest()
+            assert_true(digest not in digests)
+            digests.append(digest)
@@ -0,0 +1,177 @@
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from nose.tools import assert_equals, assert_true, assert_is
+
+import pyffi.object_models.common
+from pyffi.object_models.xml import FileFormat, codegen
+
+
+XML = """<?xml version="1.0" encoding="utf-8" ?>
+<niftoolsxml>
+    <version num="1">Game One</version>
+    <version num="3">Game Three</version>
+    <basic name="uint">An unsigned integer.</basic>
+    <basic name="ushort">An unsigned short.</basic>
+    <basic name="float">A float.</basic>
+    <compound name="Vector">
+        <add name="X" type="float" />
+        <add name="Y" type="float" />
+        <add name="Z" type="float" />
+    </compound>
+    <compound name="Tagged">
+        <add name="Tag" type="ushort" />
+        <add name="Value" type="ushort" cond="ARG != 0" />
+    </compound>
+    <niobject name="Block">
+        <add name="Num Items" type="ushort" />
+        <add name="Flags" type="ushort" ver1="2" />
+        <add name="Scale" type="float" ver2="1" />
+        <add name="Items" type="ushort" arr1="Num Items" />
+        <add name="Position" type="Vector" cond="Num Items != 0" />
+        <add name="Tagged" type="Tagged" arg="Num Items" />
+        <add name="Extra" type="uint" userver="7" />
+        <add name="Unknown" type="uint" vercond="User Version >= 5" />
+        <add name="Count" type="uint" cond="Flags == 1" />
+        <add name="Count" type="uint" />
+        <add name="Hidden" type="uint" abstract="1" />
+        <add name="Size" type="uint" ver1="3" />
+        <add name="Size" type="uint" />
+    </niobject>
+</niftoolsxml>
+"""
+
+
+class _CodegenFormat(FileFormat):
+    uint = pyffi.object_models.common.UInt
+    ushort = pyffi.object_models.common.UShort
+    float = pyffi.object_models.common.Float
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str)
+
+    class Data(FileFormat.Data):
+        def __init__(self, version, user_version, byte_order='<'):
+            self.version = version
+            self.user_version = user_version
+            self._byte_order = byte_order
+
+
+class TestCodegen(unittest.TestCase):
+    """Read and write structures with generated code."""
+
+    def setUp(self):
+        self.xml_dir = tempfile.mkdtemp()
+        self.module_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.xml_dir, "codegen.xml"), "w") as stream:
+            stream.write(XML)
+        self.environ = os.environ.get("PYFFICACHEDIR")
+        os.environ["PYFFICACHEDIR"] = ""
+        sys.path.insert(0, self.module_dir)
+        # generate the module
+        self.module_file_name = os.path.join(
+            self.module_dir, "_codegen_structs.py")
+        codegen.write_module(self.create_format(), self.module_file_name)
+        importlib.invalidate_caches()
+
+    def tearDown(self):
+        sys.path.remove(self.module_dir)
+        sys.modules.pop("_codegen_structs", None)
+        shutil.rmtree(self.xml_dir)
+        shutil.rmtree(self.module_dir)
+        if self.environ is None:
+            del os.environ["PYFFICACHEDIR"]
+        else:
+            os.environ["PYFFICACHEDIR"] = self.environ
+
+    def create_format(self):
+        return type(_CodegenFormat)(
+            "CodegenFormat", (_CodegenFormat,),
+            dict(xml_file_name="codegen.xml", xml_file_path=[self.xml_dir],
+                 xml_struct_module="_codegen_structs", __module__=__name__))
+
+    @staticmethod
+    def create_block(fmt, num_items, flags):
+        block = fmt.Block()
+        block.num_items = num_items
+        block.items.update_size()
+        for i in range(num_items):
+            block.items[i] = 10 + i
+        block.flags = flags
+        block.scale = 0.5
+        block.position.y = -2
+        block.tagged.tag = 4
+        block.tagged.value = 6
+        block.extra = 8
+        block.unknown = 9
+        block.count = 11
+        block.size = 12
+        return block
+
+    @staticmethod
+    def write(block, data):
+        stream = io.BytesIO()
+        block.write(stream, data)
+        return stream.getvalue()
+
+    def check(self, fmt, data):
+        for num_items, flags in ((0, 0), (2, 1)):
+            block = self.create_block(fmt, num_items, flags)
+            raw = self.write(block, data)
+            size = block.get_size(data)
+            fmt.Block._use_plans = False
+            fmt.Tagged._use_plans = False
+            try:
+                assert_equals(raw, self.write(block, data))
+                assert_equals(size, block.get_size(data))
+                assert_equals(size, len(raw))
+            finally:
+                fmt.Block._use_plans = True
+                fmt.Tagged._use_plans = True
+            other = fmt.Block()
+            other.read(io.BytesIO(raw), data)
+            assert_equals(self.write(other, data), raw)
+            assert_equals(other.get_hash(data), block.get_hash(data))
+
+    def test_read_write(self):
+        fmt = self.create_format()
+        for version in (1, 3):
+            for user_version in (0, 5, 7):
+                for byte_order in "<>":
+                    data = fmt.Data(version, user_version, byte_order)
+                    self.check(fmt, data)
+                    assert_true(fmt.Block._get_plan(data).read is not None)
+
+    def test_unknown_version(self):
+        # no code is generated for versions which the format does not
+        # know, so these are read and written without it
+        fmt = self.create_format()
+        data = fmt.Data(2, 0)
+        assert_is(fmt.Block._get_plan(data).read, None)
+        self.check(fmt, data)
+
+    def test_changed_xml(self):
+        with open(os.path.join(self.xml_dir, "codegen.xml"), "w") as stream:
+            stream.write(XML.replace("Game Three", "Game Four"))
+        fmt = self.create_format()
+        data = fmt.Data(3, 0)
+        assert_is(fmt.Block._get_plan(data).read, None)
+        self.check(fmt, data)
+
+    def test_missing_module(self):
+        os.remove(self.module_file_name)
+        importlib.invalidate_caches()
+        fmt = self.create_format()
+        assert_is(fmt.Block._get_plan(fmt.Data(3, 0)).read, None)
+
+    def test_subclass(self):
+        # the code is not used by subclasses, which may add attributes
+        fmt = self.create_format()
+        subclass = type("SubBlock", (fmt.Block,), {})
+        assert_is(subclass._get_plan(fmt.Data(3, 0)).read, None)
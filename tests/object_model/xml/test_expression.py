@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 from pyffi.object_models.xml.expression import Expression
@@ -54,6 +55,48 @@ class TestExpression(unittest.TestCase):
         self.a.x = B()
         assert_equals(Expression('x * 10').eval(self.a), 70)
 
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        self.a = A()
+        self.a.b = A()
+        self.a.b.x = 4
+
+    def test_compile(self):
+        e = Expression('(b.x + 1) * 3')
+        function = e.compile()
+        assert_equals(function(self.a), 15)
+        # the compiled function is cached, and used by eval
+        assert_true(e.compile() is function)
+        assert_true(e.eval is function)
+
+    def test_operators(self):
+        for expr_str, result in (('7 - 2', 5), ('7 / 2', 3.5), ('6 | 1', 7),
+                                 ('1 < 2', True), ('2 >= 3', False),
+                                 ('!x', True), ('x || 5', 5), ('y && 3', 3)):
+            assert_equals(Expression(expr_str).eval(self.a), result)
+
+    def test_map(self):
+        e = Expression('b.x == 4')
+        assert_true(e.eval(self.a))
+        e.map_(lambda x: 3 if x == 4 else x)
+        # the expression is compiled again
+        assert_false(e.eval(self.a))
+
+    def test_type(self):
+        # classes (see map_) check the type of the data
+        e = Expression('Thing && y')
+        e.map_(lambda x: A if x == 'Thing' else x)
+        assert_true(e.eval(self.a))
+        assert_false(e.eval(B()))
+
+    def test_pickle(self):
+        e = Expression('(b.x + 1) * 3')
+        e.eval(self.a)
+        e = pickle.loads(pickle.dumps(e))
+        assert_equals(e.eval(self.a), 15)
+
 class TestPartition:
 
     def test_partition_empty(self):
@@ -0,0 +1,174 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equals, assert_true, assert_is
+
+import pyffi.object_models.xml
+import pyffi.object_models.common
+from pyffi.object_models.xml import FileFormat, StructBase
+
+
+XML = """<?xml version="1.0" encoding="utf-8" ?>
+<niftoolsxml>
+    <version num="1.0">Game One, Game Two</version>
+    <version num="2.0">Game Two</version>
+    <basic name="uint">An unsigned integer.</basic>
+    <basic name="ushort">An unsigned short.</basic>
+    <enum name="Color" storage="uint">
+        A color.
+        <option value="0" name="RED" />
+        <option value="1" name="GREEN" />
+    </enum>
+    <alias name="Index" type="ushort" />
+    <bitflags name="Flags" storage="ushort">
+        <option value="0" name="Hidden" />
+        <option value="2" name="Locked" />
+    </bitflags>
+    <compound name="Pair" istemplate="1">
+        <add name="First" type="TEMPLATE" />
+        <add name="Second" type="TEMPLATE" />
+    </compound>
+    <niobject name="Object">
+        An object.
+        <version num="1.0">Game One</version>
+        <add name="Weight" type="ushort" default="3">Weight.</add>
+        <add name="Num Children" type="uint">Count.</add>
+        <add name="Children" type="Child" arr1="Num Children" />
+        <add name="Extra" type="ushort" ver1="2.0" cond="Num Children != 0" />
+    </niobject>
+    <niobject name="Child" inherit="Object">
+        <add name="Color" type="Color" />
+        <add name="Flags" type="Flags" />
+        <add name="Index" type="Index" arr1="2" />
+        <add name="Pair" type="Pair" template="ushort" />
+        <add name="Parent" type="uint" cond="Object" />
+    </niobject>
+</niftoolsxml>
+"""
+
+
+class _SchemaFormat(FileFormat):
+    logger = pyffi.object_models.xml.FileFormat.logger
+    UInt = pyffi.object_models.common.UInt
+    UShort = pyffi.object_models.common.UShort
+    uint = UInt
+    ushort = UShort
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str.replace(".", ""))
+
+    class Object:
+        def get_weight(self):
+            return self.weight
+
+
+def _describe(fmt):
+    """All information that the classes of *fmt* got from the xml."""
+    def describe_type(type_):
+        if type_ is None or isinstance(type_, str):
+            return type_
+        return type_.__name__
+
+    def describe_expr(expr):
+        return str(expr) if expr else expr
+
+    classes = []
+    for klass in (fmt.xml_struct + fmt.xml_enum + fmt.xml_alias
+                  + fmt.xml_bit_struct):
+        attrs = []
+        for attr in getattr(klass, "_attribute_list", []):
+            attrs.append((
+                attr.name, describe_type(getattr(attr, "type_", None)),
+                describe_type(getattr(attr, "template", None)),
+                attr.default, describe_expr(attr.cond),
+                describe_expr(getattr(attr, "arr1", None)),
+                attr.ver1, attr.ver2, attr.doc))
+        classes.append((
+            klass.__name__, [base.__name__ for base in klass.__mro__],
+            klass.__doc__, getattr(klass, "_games", None),
+            getattr(klass, "_enumkeys", None), attrs))
+    return fmt.versions, fmt.games, classes
+
+
+class TestSchema(unittest.TestCase):
+    """Create the classes of a format from a compiled schema."""
+
+    def setUp(self):
+        self.xml_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.xml_dir, "schema.xml"), "w") as stream:
+            stream.write(XML)
+        self.environ = os.environ.get("PYFFICACHEDIR")
+        os.environ["PYFFICACHEDIR"] = self.cache_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.xml_dir)
+        shutil.rmtree(self.cache_dir)
+        if self.environ is None:
+            del os.environ["PYFFICACHEDIR"]
+        else:
+            os.environ["PYFFICACHEDIR"] = self.environ
+
+    def create_format(self):
+        return type(_SchemaFormat)(
+            "SchemaFormat", (_SchemaFormat,),
+            dict(xml_file_name="schema.xml", xml_file_path=[self.xml_dir],
+                 __module__=__name__))
+
+    def get_schema_file_names(self):
+        return [os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)]
+
+    def test_replay(self):
+        fmt = self.create_format()
+        schema_file_names = self.get_schema_file_names()
+        assert_equals(len(schema_file_names), 1)
+        cached_fmt = self.create_format()
+        assert_equals(_describe(cached_fmt), _describe(fmt))
+        # classes work as usual
+        child = cached_fmt.Child()
+        assert_equals(child.weight, 3)
+        child.pair.first = 5
+        assert_equals(child.pair.first, 5)
+        assert_true(issubclass(cached_fmt.Object, StructBase))
+        assert_equals(cached_fmt.Object().get_weight(), 3)
+        # references to classes are resolved to classes of the new format
+        assert_is(cached_fmt.Child._attrs[4].cond._left, cached_fmt._Object)
+        assert_is(cached_fmt.Object._attrs[2].type_, cached_fmt.Child)
+
+    def test_schema_is_used(self):
+        self.create_format()
+        schema_file_name, = self.get_schema_file_names()
+        with open(schema_file_name, "rb") as stream:
+            schema = pickle.load(stream)
+        schema["versions"]["3.0"] = 30
+        with open(schema_file_name, "wb") as stream:
+            pickle.dump(schema, stream)
+        assert_equals(self.create_format().versions["3.0"], 30)
+
+    def test_invalid_schema(self):
+        fmt = self.create_format()
+        schema_file_name, = self.get_schema_file_names()
+        with open(schema_file_name, "wb") as stream:
+            stream.write(b"invalid")
+        assert_equals(_describe(self.create_format()), _describe(fmt))
+        # the schema is written again
+        with open(schema_file_name, "rb") as stream:
+            assert_true(isinstance(pickle.load(stream), dict))
+
+    def test_changed_xml(self):
+        self.create_format()
+        with open(os.path.join(self.xml_dir, "schema.xml"), "w") as stream:
+            stream.write(XML.replace("Game Two", "Game Three"))
+        fmt = self.create_format()
+        assert_true("Game Three" in fmt.games)
+        assert_equals(len(self.get_schema_file_names()), 2)
+
+    def test_disabled(self):
+        os.environ["PYFFICACHEDIR"] = ""
+        self.create_format()
+        assert_equals(self.get_schema_file_names(), [])
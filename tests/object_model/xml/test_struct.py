@@ -0,0 +1,303 @@
+import io
+import math
+import unittest
+
+from nose.tools import assert_equals, assert_false, assert_true, assert_is
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import Float, UInt, UShort, ULittle32
+from pyffi.object_models.xml.struct_ import StructBase, _BulkRun
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    Float = Float
+    UInt = UInt
+    UShort = UShort
+    ULittle32 = ULittle32
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str)
+
+
+class X(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='a', type='UInt')),
+        Attr(SimpleFormat, dict(name='b', type='UInt', ver2='1')),
+        Attr(SimpleFormat, dict(name='c', type='UShort', ver1='2')),
+        Attr(SimpleFormat, dict(name='d', type='UInt', cond='a == 3')),
+        Attr(SimpleFormat, dict(name='e', type='UShort', userver='5')),
+        Attr(SimpleFormat, dict(name='d', type='UShort')),
+        ]
+SimpleFormat.X = X
+
+
+class Vector(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='x', type='Float')),
+        Attr(SimpleFormat, dict(name='y', type='Float')),
+        Attr(SimpleFormat, dict(name='z', type='Float')),
+        Attr(SimpleFormat, dict(name='n', type='UShort')),
+        Attr(SimpleFormat, dict(name='flags', type='ULittle32')),
+        Attr(SimpleFormat, dict(name='w', type='Float', cond='n == 1')),
+        ]
+SimpleFormat.Vector = Vector
+
+
+class Z(StructBase):
+    _is_template = False
+    _attrs = [
+        Attr(SimpleFormat, dict(name='n', type='UShort')),
+        Attr(SimpleFormat, dict(name='items', type='UShort', arr1='n',
+                                ver1='2')),
+        Attr(SimpleFormat, dict(name='pair', type='UShort', arr1='2',
+                                ver1='2')),
+        Attr(SimpleFormat, dict(name='x', type='X', ver1='2')),
+        ]
+SimpleFormat.Z = Z
+
+
+class Data(FileFormat.Data):
+    def __init__(self, version, user_version, byte_order='<'):
+        self.version = version
+        self.user_version = user_version
+        self._byte_order = byte_order
+
+
+class TestStructPlan(unittest.TestCase):
+
+    def tearDown(self):
+        X._use_plans = True
+
+    def test_plan_is_cached(self):
+        data = Data(1, 0)
+        assert_is(X._get_plan(data), X._get_plan(Data(1, 0)))
+        assert_false(X._get_plan(data) is X._get_plan(Data(2, 0)))
+
+    def test_plan_versions(self):
+        names = lambda data: [attr.name for attr in X._get_plan(data).attrs]
+        assert_equals(names(Data(1, 0)), ['a', 'b', 'd', 'd'])
+        assert_equals(names(Data(2, 5)), ['a', 'c', 'd', 'e', 'd'])
+        assert_equals(X._get_plan(Data(1, 0)).dups, set(['d']))
+
+    def check_attribute_list(self, data):
+        x = X()
+        for a in (1, 3):
+            x.a = a
+            X._use_plans = False
+            reference = list(x._get_filtered_attribute_list(data))
+            X._use_plans = True
+            assert_equals(list(x._get_filtered_attribute_list(data)),
+                          reference)
+
+    def test_attribute_list(self):
+        for version in (1, 2):
+            for user_version in (0, 5):
+                self.check_attribute_list(Data(version, user_version))
+        self.check_attribute_list(None)
+
+    def test_read_write(self):
+        data = Data(2, 5)
+        for a in (1, 3):
+            x = X()
+            x.a = a
+            x.c = 7
+            x.d = 9
+            x.e = 11
+            stream = io.BytesIO()
+            x.write(stream, data)
+            assert_equals(len(stream.getvalue()), x.get_size(data))
+            X._use_plans = False
+            reference = io.BytesIO()
+            x.write(reference, data)
+            assert_equals(stream.getvalue(), reference.getvalue())
+            assert_equals(x.get_size(data), len(reference.getvalue()))
+            X._use_plans = True
+            stream.seek(0)
+            y = X()
+            y.read(stream, data)
+            assert_equals((y.a, y.c, y.d, y.e), (a, 7, 9, 11))
+
+
+class TestBulkRun(unittest.TestCase):
+
+    def tearDown(self):
+        Vector._use_plans = True
+
+    def test_plan_runs(self):
+        io_ = Vector._get_plan(Data(1, 0)).io
+        assert_equals(len(io_), 3)
+        run = io_[0][0]
+        assert_true(isinstance(run, _BulkRun))
+        assert_equals(run.value_names,
+                      ('_x_value_', '_y_value_', '_z_value_', '_n_value_'))
+        assert_equals(run.size, 14)
+        # ULittle32 has a custom read, so it is not part of the run
+        assert_equals(io_[1][0].name, 'flags')
+        assert_equals(io_[2][0].name, 'w')
+
+    def test_read_write(self):
+        for byte_order in '<>':
+            data = Data(1, 0, byte_order)
+            vec = Vector()
+            vec.x, vec.y, vec.z, vec.n, vec.flags, vec.w = 1.5, -2, 3, 1, 7, 4
+            stream = io.BytesIO()
+            vec.write(stream, data)
+            Vector._use_plans = False
+            reference = io.BytesIO()
+            vec.write(reference, data)
+            Vector._use_plans = True
+            assert_equals(stream.getvalue(), reference.getvalue())
+            assert_equals(vec.get_size(data), 22)
+            stream.seek(0)
+            vec2 = Vector()
+            vec2.read(stream, data)
+            assert_equals((vec2.x, vec2.y, vec2.z, vec2.n, vec2.flags, vec2.w),
+                          (1.5, -2, 3, 1, 7, 4))
+
+    def test_write_overflow(self):
+        data = Data(1, 0)
+        vec = Vector()
+        vec.y = 1e300
+        stream = io.BytesIO()
+        vec.write(stream, data)
+        stream.seek(0)
+        vec.read(stream, data)
+        assert_true(math.isnan(vec.y))
+
+
+class TestHashDigest(unittest.TestCase):
+
+    def test_digest(self):
+        data = Data(1, 0)
+        vec1 = Vector()
+        vec2 = Vector()
+        assert_equals(vec1.get_hash_digest(data), vec2.get_hash_digest(data))
+        vec2.x = 1
+        assert_false(vec1.get_hash_digest(data) == vec2.get_hash_digest(data))
+        vec1.x = 1
+        assert_equals(vec1.get_hash_digest(data), vec2.get_hash_digest(data))
+
+    def test_cache(self):
+        data = Data(1, 0)
+        vec = Vector()
+        digest = vec.get_hash_digest(data)
+        # cached value is used as long as nothing changes...
+        vec._x_value_._value = 5
+        assert_equals(vec.get_hash_digest(data), digest)
+        # ...but not for other versions
+        assert_false(vec.get_hash_digest(Data(2, 0)) == digest)
+        # setters invalidate the cache
+        vec.y = 0
+        assert_false(vec.get_hash_digest(data) == digest)
+
+    def test_cache_set_value(self):
+        data = Data(1, 0)
+        vec = Vector()
+        digest = vec.get_hash_digest(data)
+        vec._x_value_.set_value(9)
+        assert_false(vec.get_hash_digest(data) == digest)
+
+    def test_cache_read(self):
+        data = Data(1, 0)
+        other = Vector()
+        other.x = 9
+        stream = io.BytesIO()
+        other.write(stream, data)
+        stream.seek(0)
+        vec = Vector()
+        digest = vec.get_hash_digest(data)
+        vec.read(stream, data)
+        assert_equals(vec.get_hash_digest(data), other.get_hash_digest(data))
+        assert_false(vec.get_hash_digest(data) == digest)
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_basic(self):
+        value = UInt()
+        assert_false(hasattr(value, "__dict__"))
+
+    def test_struct(self):
+        x = X()
+        # attribute values are not stored in the instance dictionary
+        assert_equals(x.__dict__, {})
+        assert_equals(sorted(X.__slots__),
+                      ['_a_value_', '_b_value_', '_c_value_', '_d_value_',
+                       '_e_value_'])
+        x.a = 3
+        assert_equals(x.a, 3)
+        assert_equals([child.get_value() for child in
+                       x.get_detail_child_nodes()], [3, 0, 0, 0, 0])
+
+    def test_subclass(self):
+        # slots of inherited attributes are not added again
+        Y = type("Y", (X,), dict(_attrs=X._attrs + [
+            Attr(SimpleFormat, dict(name='f', type='UInt'))]))
+        assert_equals(Y.__slots__, ('_f_value_',))
+        y = Y()
+        y.f = 7
+        assert_equals((y.a, y.f), (0, 7))
+
+
+def _is_instantiated(struct, name):
+    try:
+        getattr(type(struct), "_%s_value_" % name).__get__(struct)
+    except AttributeError:
+        return False
+    return True
+
+
+class TestInitData(unittest.TestCase):
+
+    def test_active(self):
+        x = X(data=Data(1, 0))
+        assert_equals([_is_instantiated(x, name) for name in "abcde"],
+                      [True, True, False, True, False])
+        # inactive attributes are instantiated on first access
+        assert_equals(x.c, 0)
+        assert_true(_is_instantiated(x, "c"))
+        assert_equals(X(data=Data(3, 5)).__dict__, {})
+
+    def test_read_write(self):
+        raw = b"\x03\x00\x00\x00\x01\x00\x00\x00\x02\x00\x00\x00"
+        data = Data(1, 0)
+        x = X(data=data)
+        x.read(io.BytesIO(raw), data)
+        stream = io.BytesIO()
+        x.write(stream, data)
+        assert_equals(stream.getvalue(), raw)
+        # write for another version: as if all attributes were instantiated
+        data = Data(3, 5)
+        y = X()
+        y.read(io.BytesIO(raw), Data(1, 0))
+        for struct in (x, y):
+            stream = io.BytesIO()
+            struct.write(stream, data)
+            assert_equals(struct.get_hash(), y.get_hash())
+        assert_equals(x.get_hash(data), y.get_hash(data))
+
+    def test_arrays(self):
+        z = Z(data=Data(1, 0))
+        # empty arrays are skipped, but they remain empty on first access
+        assert_false(_is_instantiated(z, "items"))
+        assert_true(_is_instantiated(z, "pair"))
+        assert_false(_is_instantiated(z, "x"))
+        z.n = 3
+        assert_equals(len(z.items), 0)
+        assert_equals(len(z.pair), 2)
+        assert_equals(z.x.a, 0)
+
+    def test_struct(self):
+        # struct attributes only instantiate their active attributes
+        z = Z(data=Data(3, 0))
+        assert_true(_is_instantiated(z, "x"))
+        assert_equals([_is_instantiated(z.x, name) for name in "abcde"],
+                      [True, False, True, True, False])
@@ -0,0 +1,83 @@
+"""Measure the memory taken by the data of a nif file, per vertex.
+
+The memory is measured with tracemalloc, so it includes everything
+that is allocated while reading the file, but not the memory that is
+freed again before reading ends.
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+from __future__ import print_function
+
+import argparse
+import os.path
+import tracemalloc
+
+from pyffi.formats.nif import NifFormat
+
+parser = argparse.ArgumentParser(
+    description='Measure the memory taken by the data of nif files.')
+parser.add_argument(
+    'files', nargs='*', default=[os.path.join(
+        os.path.dirname(__file__), os.pardir, "spells", "nif", "files",
+        "test_opt_grid_layout.nif")],
+    help='the nif files to read',
+    )
+
+args = parser.parse_args()
+
+def count_vertices(data):
+    """Count the vertices of all geometry data blocks."""
+    return sum(block.num_vertices for block in data.blocks
+               if isinstance(block, NifFormat.NiGeometryData))
+
+# the format must be fully set up before measuring
+NifFormat.Data()
+
+for file_name in args.files:
+    tracemalloc.start()
+    data = NifFormat.Data()
+    with open(file_name, "rb") as stream:
+        data.read(stream)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_vertices = count_vertices(data)
+    print("{0}: {1} vertices, {2:.1f}MB, {3:.0f} bytes per vertex".format(
+        os.path.basename(file_name), num_vertices, size / 1e6,
+        size / max(num_vertices, 1)))
@@ -0,0 +1,98 @@
+"""Time writing synthetic nif files with a growing number of blocks.
+
+Write time should grow linearly with the number of blocks, that is,
+the time per block should stay about the same for all sizes.
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+from __future__ import print_function
+
+import argparse
+import io
+import time
+
+from pyffi.formats.nif import NifFormat
+
+parser = argparse.ArgumentParser(
+    description='Time writing nif files with a growing number of blocks.')
+parser.add_argument(
+    '--repeat', dest='repeat', type=int, default=3,
+    help='number of times each file is written (the fastest one counts)',
+    )
+parser.add_argument(
+    'sizes', type=int, nargs='*', default=[1000, 10000, 50000],
+    help='the (approximate) number of blocks of each file',
+    )
+
+args = parser.parse_args()
+
+def make_data(num_blocks):
+    """Make a nif with a root node, and groups of 100 shapes, each
+    with its own data block, and a unique name.
+    """
+    data = NifFormat.Data(version=0x14020007, user_version=11)
+    root = NifFormat.NiNode()
+    root.name = "Scene Root"
+    data.roots = [root]
+    num_shapes = max(num_blocks // 2, 1)
+    group = None
+    for i in range(num_shapes):
+        if i % 100 == 0:
+            group = NifFormat.NiNode()
+            group.name = "Group %i" % i
+            root.add_child(group)
+        shape = NifFormat.NiTriShape()
+        shape.name = "Shape %i" % i
+        shape.data = NifFormat.NiTriShapeData()
+        group.add_child(shape)
+    return data
+
+for size in args.sizes:
+    data = make_data(size)
+    best = None
+    for i in range(args.repeat):
+        stream = io.BytesIO()
+        start = time.time()
+        data.write(stream)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    num_blocks = len(data.blocks)
+    print("{0:6} blocks: {1:8.3f}s, {2:6.1f}us per block".format(
+        num_blocks, best, 1e6 * best / num_blocks))
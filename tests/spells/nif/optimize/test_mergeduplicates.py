@@ -1,10 +1,13 @@
+import unittest
+
 from tests.scripts.nif import call_niftoaster
 
 from . import BaseFileTestCase
 import pyffi
+from pyffi.formats.nif import NifFormat
 from pyffi.spells import Toaster
 
-from nose.tools import assert_true, assert_false
+from nose.tools import assert_true, assert_false, assert_equal
 
 
 class TestMergeDuplicatesOptimisation(BaseFileTestCase):
@@ -80,4 +83,36 @@ class TestExplicitMergeDuplicatesGeomOptimisation(BaseFileTestCase):
         spell = pyffi.spells.nif.optimize.SpellMergeDuplicates(data=self.data)
         spell.recurse()
 
-        assert_false(has_duplicates(self.data.roots[0]))
\ No newline at end of file
+        assert_false(has_duplicates(self.data.roots[0]))
+
+class TestMergeDuplicateProperties(unittest.TestCase):
+    """Merge duplicate properties across many shapes."""
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        root = NifFormat.NiNode()
+        root.name = b"Scene Root"
+        for i in range(30):
+            shape = NifFormat.NiTriShape()
+            shape.name = ("Shape%i" % i).encode("ascii")
+            material = NifFormat.NiMaterialProperty()
+            material.name = ("Material%i" % i).encode("ascii")
+            material.alpha = (i % 3) * 0.5
+            alpha = NifFormat.NiAlphaProperty()
+            shape.add_property(material)
+            shape.add_property(alpha)
+            root.add_child(shape)
+        # special material names are not merged with other names
+        root.children[0].properties[0].name = b"Skin"
+        self.data.roots = [root]
+
+    def test_merge(self):
+        spell = pyffi.spells.nif.optimize.SpellMergeDuplicates(data=self.data)
+        spell.recurse()
+        properties = set()
+        for shape in self.data.roots[0].children:
+            properties.update(shape.properties)
+        # three alpha values for non special materials, one special
+        # material, and one alpha property
+        assert_equal(len(properties), 5)
+        assert_false(has_duplicates(self.data.roots[0]))
@@ -1,12 +1,23 @@
 """Tests for pyffi."""
+import csv
+import json
+import multiprocessing
 import tempfile
 import os
 import shutil
+import signal
+import time
+import unittest
 
 import nose.tools
 
 from pyffi.formats.nif import NifFormat
-from pyffi.spells import Toaster
+from pyffi.spells import Toaster, fake_logger
+import pyffi.spells.cgf
+import pyffi.spells.check
+import pyffi.spells.nif
+import pyffi.spells.nif.check
+import pyffi.spells.nif.modify
 
 
 class MyToaster(Toaster):
@@ -57,6 +68,23 @@ class TestToaster:
         nose.tools.assert_false(toaster.is_admissible_branch_class(NifFormat.NiMaterialProperty))
         nose.tools.assert_true(toaster.is_admissible_branch_class(NifFormat.NiAlphaProperty))
 
+    def test_toaster_read_options(self):
+        """Only nif files are read with the lazy and block_types options"""
+        class SpellReadBlocks(pyffi.spells.check.SpellRead):
+            BLOCKTYPES = (NifFormat.NiAVObject,)
+        nif_toaster = pyffi.spells.nif.NifToaster(
+            spellclass=SpellReadBlocks, options={"lazy": True})
+        nose.tools.assert_equal(
+            nif_toaster.get_read_options(),
+            {"lazy": True, "block_types": (NifFormat.NiAVObject,)})
+        cgf_toaster = pyffi.spells.cgf.CgfToaster(
+            spellclass=SpellReadBlocks, logger=fake_logger,
+            options={"lazy": True, "jobs": 1})
+        nose.tools.assert_equal(cgf_toaster.get_read_options(), {})
+        cgf_toaster.toast("tests/formats/cgf/vcols.cgf")
+        nose.tools.assert_equal(len(cgf_toaster.files_done), 1)
+        nose.tools.assert_equal(cgf_toaster.files_failed, set())
+
 
 class TestIniParser:
     """Test the Ini parser"""
@@ -164,3 +192,518 @@ class TestIniParser:
 
 
 
+
+
+class DelToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [pyffi.spells.nif.modify.SpellDelBranches]
+
+
+class CheckToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [pyffi.spells.nif.check.SpellCheckVersion]
+
+
+class CountingDelBranches(pyffi.spells.nif.modify.SpellDelBranches):
+    """Counts the files that the spell inspects."""
+
+    count = 0
+
+    def datainspect(self):
+        CountingDelBranches.count += 1
+        return True
+
+
+class CountingToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [CountingDelBranches]
+
+
+class SpellBreakFlags(pyffi.spells.nif.NifSpell):
+    """Sets flags that cannot be written."""
+
+    SPELLNAME = "test_breakflags"
+    READONLY = False
+
+    def dataentry(self):
+        root = self.data.roots[0]
+        root._flags_value_._value = -1
+        # the block is not copied on write
+        root._pristine = None
+        self.changed = True
+        return False
+
+
+class BreakToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [SpellBreakFlags, pyffi.spells.nif.modify.SpellDelBranches]
+
+
+class SpellHang(pyffi.spells.nif.NifSpell):
+    """Hangs on files named hang, and crashes on files named crash."""
+
+    SPELLNAME = "test_hang"
+    READONLY = True
+
+    def dataentry(self):
+        name = os.path.basename(self.stream.name)
+        if name.startswith("hang"):
+            time.sleep(60)
+        elif name.startswith("crash"):
+            os._exit(3)
+        return False
+
+
+class HangToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [SpellHang]
+
+
+class SpellNoStart(SpellHang):
+    """Kills every worker process before it can toast any file."""
+
+    SPELLNAME = "test_nostart"
+
+    @classmethod
+    def toastentry(cls, toaster):
+        if multiprocessing.current_process().name != "MainProcess":
+            os._exit(4)
+        return True
+
+
+class NoStartToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [SpellNoStart]
+
+
+class TestParallelToast(unittest.TestCase):
+    """Toast files with more than one process."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        self.names = ["test%i.nif" % i for i in range(7)]
+        for name in self.names:
+            shutil.copy(src_file, os.path.join(self.src, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.dest)
+
+    def test_toast(self):
+        # with refresh=2, processes are replaced while toasting
+        toaster = DelToaster(
+            spellnames=["modify_delbranches"], logger=fake_logger,
+            options=dict(jobs=2, refresh=2, interactive=False,
+                         exclude=["NiVertexColorProperty"],
+                         sourcedir=self.src, destdir=self.dest))
+        toaster.toast(self.src)
+        nose.tools.assert_equal(sorted(os.listdir(self.dest)), self.names)
+        for name in self.names:
+            data = NifFormat.Data()
+            with open(os.path.join(self.dest, name), "rb") as stream:
+                data.read(stream)
+            nose.tools.assert_false(any(
+                isinstance(block, NifFormat.NiVertexColorProperty)
+                for block in data.blocks))
+
+    def test_results(self):
+        # results and statistics of all processes are gathered
+        toaster = CheckToaster(
+            spellnames=["check_version"], logger=fake_logger,
+            options=dict(jobs=2, refresh=2, interactive=False))
+        toaster.toast(self.src)
+        names = sorted(os.path.join(self.src, name) for name in self.names)
+        nose.tools.assert_equal(sorted(toaster.files_done), names)
+        nose.tools.assert_equal(sorted(toaster.file_results), names)
+        nose.tools.assert_false(toaster.files_failed)
+        nose.tools.assert_true(all(
+            result.status == "done" and not result.changed
+            for result in toaster.file_results.values()))
+        nose.tools.assert_equal(toaster.versions, {0x14000005: 7})
+        nose.tools.assert_equal(toaster.user_versions, {0x14000005: [11]})
+
+
+class TestCache(unittest.TestCase):
+    """Reuse results of an earlier toast."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        for name in ("test0.nif", "test1.nif"):
+            shutil.copy(src_file, os.path.join(self.src, name))
+        CountingDelBranches.count = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.dest)
+        shutil.rmtree(self.cache)
+
+    def toast(self, exclude):
+        toaster = CountingToaster(
+            spellnames=["modify_delbranches"], logger=fake_logger,
+            options=dict(jobs=1, interactive=False, exclude=exclude,
+                         cache=self.cache,
+                         sourcedir=self.src, destdir=self.dest))
+        toaster.toast(self.src)
+        outputs = {}
+        for name in sorted(os.listdir(self.dest)):
+            with open(os.path.join(self.dest, name), "rb") as stream:
+                outputs[name] = stream.read()
+            os.remove(os.path.join(self.dest, name))
+        return toaster, outputs
+
+    def test_cache(self):
+        toaster, outputs = self.toast(["NiVertexColorProperty"])
+        # both files have the same content, so the second one is cached
+        nose.tools.assert_equal(CountingDelBranches.count, 1)
+        nose.tools.assert_equal(sorted(outputs), ["test0.nif", "test1.nif"])
+        nose.tools.assert_equal(outputs["test0.nif"], outputs["test1.nif"])
+        # second run replays the written files
+        toaster, cached_outputs = self.toast(["NiVertexColorProperty"])
+        nose.tools.assert_equal(CountingDelBranches.count, 1)
+        nose.tools.assert_equal(cached_outputs, outputs)
+        nose.tools.assert_equal(len(toaster.files_done), 2)
+        nose.tools.assert_true(all(
+            result.changed for result in toaster.file_results.values()))
+        # changed options or files are toasted again
+        toaster, other_outputs = self.toast(["NiMaterialProperty"])
+        nose.tools.assert_equal(CountingDelBranches.count, 2)
+        nose.tools.assert_not_equal(other_outputs, outputs)
+        shutil.copy(
+            os.path.join(TestIniParser.input_files, 'test_dump_tex.nif'),
+            os.path.join(self.src, "test1.nif"))
+        toaster, outputs = self.toast(["NiVertexColorProperty"])
+        nose.tools.assert_equal(CountingDelBranches.count, 3)
+
+    def test_corrupt_cache(self):
+        self.toast(["NiVertexColorProperty"])
+        for dirpath, dirnames, filenames in os.walk(self.cache):
+            for name in filenames:
+                with open(os.path.join(dirpath, name), "wb") as stream:
+                    # unsupported pickle protocol: raises ValueError
+                    stream.write(b"\x80\x99")
+        toaster, outputs = self.toast(["NiVertexColorProperty"])
+        # corrupt entries are ignored, and replaced
+        nose.tools.assert_equal(CountingDelBranches.count, 2)
+        nose.tools.assert_equal(len(toaster.files_done), 2)
+        nose.tools.assert_equal(toaster.files_failed, set())
+        nose.tools.assert_equal(sorted(outputs), ["test0.nif", "test1.nif"])
+
+    def test_cache_write_fails(self):
+        toaster = CountingToaster(
+            spellnames=["modify_delbranches"], logger=fake_logger,
+            options=dict(jobs=1, interactive=False,
+                         exclude=["NiVertexColorProperty"], cache=self.cache,
+                         sourcedir=self.src, destdir=self.dest))
+        with open(os.path.join(self.src, "test0.nif"), "rb") as stream:
+            filename = toaster._get_cache_file_name(
+                toaster._get_cache_key(stream))
+        # a directory in place of the entry cannot be replaced
+        os.makedirs(os.path.join(filename, "subdir"))
+        toaster, outputs = self.toast(["NiVertexColorProperty"])
+        nose.tools.assert_equal(CountingDelBranches.count, 2)
+        nose.tools.assert_equal(len(toaster.files_done), 2)
+        nose.tools.assert_equal(toaster.files_failed, set())
+        nose.tools.assert_equal(sorted(outputs), ["test0.nif", "test1.nif"])
+        # no temporary files are left behind
+        nose.tools.assert_equal(
+            os.listdir(os.path.dirname(filename)),
+            [os.path.basename(filename)])
+
+
+class TestPipeline(unittest.TestCase):
+    """Cast spells with different options on a single read."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        for name in ("test0.nif", "test1.nif"):
+            shutil.copy(src_file, os.path.join(self.src, name))
+        CountingDelBranches.count = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.dest)
+
+    def toast(self, jobs):
+        toaster = CountingToaster(
+            logger=fake_logger,
+            options=dict(jobs=jobs, interactive=False,
+                         sourcedir=self.src, destdir=self.dest))
+        toaster.add_stage(
+            ["modify_delbranches"], dict(exclude=["NiVertexColorProperty"]))
+        toaster.add_stage(
+            ["modify_delbranches"], dict(exclude=["NiMaterialProperty"],
+                                         skip=["test1"]))
+        toaster.toast(self.src)
+        return toaster
+
+    def get_block_types(self, name):
+        data = NifFormat.Data()
+        with open(os.path.join(self.dest, name), "rb") as stream:
+            data.read(stream)
+        return set(block.__class__.__name__ for block in data.blocks)
+
+    def check(self, toaster):
+        nose.tools.assert_equal(len(toaster.files_done), 2)
+        block_types = self.get_block_types("test0.nif")
+        nose.tools.assert_false("NiVertexColorProperty" in block_types)
+        nose.tools.assert_false("NiMaterialProperty" in block_types)
+        # the second stage skips test1.nif
+        block_types = self.get_block_types("test1.nif")
+        nose.tools.assert_false("NiVertexColorProperty" in block_types)
+        nose.tools.assert_true("NiMaterialProperty" in block_types)
+
+    def test_pipeline(self):
+        toaster = self.toast(jobs=1)
+        self.check(toaster)
+        nose.tools.assert_equal(CountingDelBranches.count, 3)
+        reports = toaster.files_done[os.path.join(self.src, "test0.nif")]
+        nose.tools.assert_equal(
+            [(report["spellname"], report["changed"]) for report in reports],
+            [("modify_delbranches", True), ("modify_delbranches", True)])
+        nose.tools.assert_equal(
+            len(toaster.files_done[os.path.join(self.src, "test1.nif")]), 1)
+
+    def test_parallel(self):
+        self.check(self.toast(jobs=2))
+
+
+class TestWrite(unittest.TestCase):
+    """Overwrite files, with and without reading ahead."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        with open(src_file, "rb") as stream:
+            self.original = stream.read()
+        self.names = ["test%i.nif" % i for i in range(3)]
+        for name in self.names:
+            shutil.copy(src_file, os.path.join(self.src, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+
+    def toast(self, spellname, readahead):
+        toaster = BreakToaster(
+            spellnames=[spellname], logger=fake_logger,
+            options=dict(jobs=1, readahead=readahead, interactive=False,
+                         exclude=["NiVertexColorProperty"]))
+        toaster.toast(self.src)
+        nose.tools.assert_equal(sorted(os.listdir(self.src)), self.names)
+        return toaster
+
+    def test_overwrite(self):
+        for readahead in (0, 2):
+            toaster = self.toast("modify_delbranches", readahead)
+            nose.tools.assert_equal(len(toaster.files_done), 3)
+            for name in self.names:
+                data = NifFormat.Data()
+                with open(os.path.join(self.src, name), "rb") as stream:
+                    data.read(stream)
+                nose.tools.assert_false(any(
+                    isinstance(block, NifFormat.NiVertexColorProperty)
+                    for block in data.blocks))
+
+    def test_write_failure(self):
+        for readahead in (0, 2):
+            toaster = self.toast("test_breakflags", readahead)
+            nose.tools.assert_equal(len(toaster.files_failed), 3)
+            # original files are untouched
+            for name in self.names:
+                with open(os.path.join(self.src, name), "rb") as stream:
+                    nose.tools.assert_equal(stream.read(), self.original)
+
+
+class TestProfile(unittest.TestCase):
+    """Record the time it takes to toast every file."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        self.names = sorted(
+            os.path.join(self.src, "test%i.nif" % i) for i in range(3))
+        for name in self.names:
+            shutil.copy(src_file, name)
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.dest)
+
+    def toast(self, jobs, profile):
+        toaster = DelToaster(
+            spellnames=["modify_delbranches"], logger=fake_logger,
+            options=dict(jobs=jobs, interactive=False,
+                         exclude=["NiVertexColorProperty"],
+                         profile=os.path.join(self.dest, profile),
+                         sourcedir=self.src, destdir=self.dest))
+        toaster.toast(self.src)
+        return toaster
+
+    def test_json(self):
+        for jobs in (1, 2):
+            self.toast(jobs, "profile.json")
+            with open(os.path.join(self.dest, "profile.json")) as stream:
+                profile = json.load(stream)
+            nose.tools.assert_equal(
+                sorted(record["name"] for record in profile["files"]),
+                self.names)
+            for record in profile["files"]:
+                nose.tools.assert_equal(
+                    sorted(record["phases"]),
+                    ["cast", "inspect", "read", "write"])
+                wall, calls = record["spells"]["modify_delbranches"]["NiNode"]
+                nose.tools.assert_equal(calls, 1)
+            wall, calls = profile["spells"]["modify_delbranches"]["NiNode"]
+            nose.tools.assert_equal(calls, 3)
+
+    def test_csv(self):
+        self.toast(1, "profile.csv")
+        with open(os.path.join(self.dest, "profile.csv")) as stream:
+            rows = list(csv.DictReader(stream))
+        nose.tools.assert_equal(
+            sorted(row["name"] for row in rows), self.names)
+        nose.tools.assert_true(all(
+            float(row["time"]) >= float(row["cast_time"]) for row in rows))
+        nose.tools.assert_true(all(
+            int(row["peak_allocated"]) > 0 for row in rows))
+
+    def test_peak_allocated(self):
+        # the peak memory of a file does not depend on earlier files
+        profiler = pyffi.spells._ToastProfiler()
+        profiler.begin_file("large")
+        large = bytearray(10000000)
+        del large
+        record = profiler.end_file()
+        nose.tools.assert_true(record["peak_allocated"] >= 10000000)
+        profiler.begin_file("small")
+        small = bytearray(100000)
+        del small
+        record = profiler.end_file()
+        nose.tools.assert_true(
+            100000 <= record["peak_allocated"] < 1000000)
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """Toast files with more than one process, within a memory budget."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        self.names = []
+        for i, name in enumerate(("test_vertexcolor.nif", "test_dump_tex.nif",
+                                  "test_opt_grid_layout.nif") * 2):
+            self.names.append("test%i.nif" % i)
+            shutil.copy(os.path.join(TestIniParser.input_files, name),
+                        os.path.join(self.src, self.names[-1]))
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.dest)
+
+    def test_estimate_memory(self):
+        toaster = DelToaster(spellnames=["modify_delbranches"],
+                             logger=fake_logger)
+        filename = os.path.join(self.src, "test0.nif")
+        size = os.path.getsize(filename)
+        nose.tools.assert_equal(
+            toaster.estimate_memory(filename, size),
+            size * toaster.MEMORY_PER_BYTE + 7 * toaster.MEMORY_PER_BLOCK)
+        # files which are not nifs are estimated from their size
+        filename = os.path.join(self.src, "test.txt")
+        with open(filename, "w") as stream:
+            stream.write("not a nif")
+        nose.tools.assert_equal(
+            toaster.estimate_memory(filename, 9),
+            9 * toaster.MEMORY_PER_BYTE)
+
+    def test_toast(self):
+        # every process exceeds the budget, so it is replaced after
+        # every file, and files are toasted one at a time
+        toaster = DelToaster(
+            spellnames=["modify_delbranches"], logger=fake_logger,
+            options=dict(jobs=2, maxmemory=1, interactive=False,
+                         exclude=["NiVertexColorProperty"],
+                         sourcedir=self.src, destdir=self.dest))
+        toaster.toast(self.src)
+        nose.tools.assert_equal(len(toaster.files_done), 6)
+        nose.tools.assert_false(toaster.files_failed)
+        # only files with vertex colors are changed
+        nose.tools.assert_equal(sorted(os.listdir(self.dest)),
+                                ["test0.nif", "test3.nif"])
+
+
+class TestTimeout(unittest.TestCase):
+    """Stop and replace processes which hang or crash."""
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        for name in ("test0.nif", "hang.nif", "test1.nif", "crash.nif",
+                     "test2.nif", "test3.nif"):
+            shutil.copy(src_file, os.path.join(self.src, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+
+    def test_timeout(self):
+        toaster = HangToaster(
+            spellnames=["test_hang"], logger=fake_logger,
+            options=dict(jobs=2, timeout=2, interactive=False))
+        start = time.time()
+        toaster.toast(self.src)
+        nose.tools.assert_true(time.time() - start < 30)
+        nose.tools.assert_equal(len(toaster.files_done), 4)
+        hang = os.path.join(self.src, "hang.nif")
+        crash = os.path.join(self.src, "crash.nif")
+        nose.tools.assert_equal(toaster.files_failed, set([hang, crash]))
+        nose.tools.assert_equal(toaster.file_results[hang].status, "timeout")
+        nose.tools.assert_equal(toaster.file_results[crash].status, "crashed")
+
+    def test_crash_first_file(self):
+        # every worker toasts a single file, so crashes happen on the
+        # first file that a worker gets
+        for name in os.listdir(self.src):
+            os.remove(os.path.join(self.src, name))
+        src_file = os.path.join(
+            TestIniParser.input_files, 'test_vertexcolor.nif')
+        for name in ("crash0.nif", "test0.nif", "crash1.nif", "test1.nif"):
+            shutil.copy(src_file, os.path.join(self.src, name))
+        toaster = HangToaster(
+            spellnames=["test_hang"], logger=fake_logger,
+            options=dict(jobs=2, refresh=1, timeout=10, interactive=False))
+        toaster.toast(self.src)
+        crashes = set(os.path.join(self.src, name)
+                      for name in ("crash0.nif", "crash1.nif"))
+        nose.tools.assert_equal(len(toaster.files_done), 2)
+        nose.tools.assert_equal(toaster.files_failed, crashes)
+        for crash in crashes:
+            nose.tools.assert_equal(
+                toaster.file_results[crash].status, "crashed")
+
+    def test_idle_worker_killed(self):
+        toaster = HangToaster(
+            spellnames=["test_hang"], logger=fake_logger,
+            options=dict(jobs=2, interactive=False))
+        pool = pyffi.spells._ToasterPool(toaster, 2)
+        os.kill(pool.workers[0].process.pid, signal.SIGKILL)
+        names = [os.path.join(self.src, "test%i.nif" % i) for i in range(4)]
+        for name in names:
+            pool.submit(name)
+        pool.close()
+        nose.tools.assert_equal(sorted(toaster.files_done), names)
+        nose.tools.assert_equal(toaster.files_failed, set())
+
+    def test_workers_cannot_start(self):
+        toaster = NoStartToaster(
+            spellnames=["test_nostart"], logger=fake_logger,
+            options=dict(jobs=2, interactive=False))
+        pool = pyffi.spells._ToasterPool(toaster, 2)
+        pool.submit(os.path.join(self.src, "test0.nif"))
+        nose.tools.assert_raises(RuntimeError, pool.close)
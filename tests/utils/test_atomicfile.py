@@ -0,0 +1,62 @@
+"""Tests for pyffi.utils.atomicfile module."""
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import nose.tools
+
+from pyffi.utils.atomicfile import AtomicFile
+
+
+class TestAtomicFile(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, "test.bin")
+        with open(self.filename, "wb") as stream:
+            stream.write(b"original")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read(self):
+        with open(self.filename, "rb") as stream:
+            return stream.read()
+
+    def test_replace(self):
+        os.chmod(self.filename, 0o640)
+        stream = AtomicFile(self.filename)
+        nose.tools.assert_equal(stream.name, self.filename)
+        stream.write(b"new")
+        # not yet replaced
+        nose.tools.assert_equal(self.read(), b"original")
+        stream.close()
+        nose.tools.assert_equal(self.read(), b"new")
+        nose.tools.assert_equal(
+            stat.S_IMODE(os.stat(self.filename).st_mode), 0o640)
+        nose.tools.assert_equal(os.listdir(self.folder), ["test.bin"])
+
+    def test_new_file(self):
+        filename = os.path.join(self.folder, "new.bin")
+        with AtomicFile(filename) as stream:
+            stream.write(b"new")
+        with open(filename, "rb") as stream:
+            nose.tools.assert_equal(stream.read(), b"new")
+
+    def test_discard(self):
+        try:
+            with AtomicFile(self.filename) as stream:
+                stream.write(b"new")
+                raise ValueError
+        except ValueError:
+            pass
+        nose.tools.assert_equal(self.read(), b"original")
+        # unclosed streams are discarded as well
+        stream = AtomicFile(self.filename)
+        stream.write(b"new")
+        del stream
+        nose.tools.assert_equal(self.read(), b"original")
+        nose.tools.assert_equal(os.listdir(self.folder), ["test.bin"])
@@ -0,0 +1,74 @@
+"""Tests for pyffi.utils.mmapstream module."""
+
+import array
+import io
+import os.path
+import tempfile
+
+import nose.tools
+
+from pyffi.formats.dds import DdsFormat
+from pyffi.formats.nif import NifFormat
+from pyffi.object_models.xml.array import Array
+from pyffi.utils.mmapstream import MmapStream
+
+TESTS = os.path.join(os.path.dirname(__file__), os.pardir)
+
+
+def _map(filename):
+    with open(filename, "rb") as stream:
+        return MmapStream.from_stream(stream)
+
+
+def test_read_nif():
+    filename = os.path.join(
+        TESTS, "spells", "nif", "files", "test_check_tangentspace2.nif")
+    Array.use_typed_storage = True
+    try:
+        reference = NifFormat.Data()
+        with open(filename, "rb") as stream:
+            reference.read(stream)
+        data = NifFormat.Data()
+        stream = _map(filename)
+        data.inspect(stream)
+        nose.tools.assert_equal(stream.tell(), 0)
+        data.read(stream)
+        stream.close()
+    finally:
+        Array.use_typed_storage = False
+    nose.tools.assert_equal([block.get_hash() for block in data.blocks],
+                            [block.get_hash() for block in reference.blocks])
+
+
+def test_read_dds():
+    filename = os.path.join(TESTS, "formats", "dds", "test.dds")
+    data = DdsFormat.Data()
+    stream = _map(filename)
+    data.read(stream)
+    # the pixel data refers to the map, which outlives the stream
+    stream.close()
+    pixeldata = data.pixeldata.get_value()
+    nose.tools.assert_true(isinstance(pixeldata, memoryview))
+    nose.tools.assert_equal(len(pixeldata), 888)
+    out = io.BytesIO()
+    data.write(out)
+    with open(filename, "rb") as stream:
+        nose.tools.assert_equal(out.getvalue(), stream.read())
+
+
+def test_readinto():
+    with tempfile.TemporaryFile() as stream:
+        stream.write(b"\x01\x00\x02\x00\x03\x00")
+        stream.seek(2)
+        mapped = MmapStream.from_stream(stream)
+        values = array.array("H", [0, 0, 0])
+        nose.tools.assert_equal(mapped.readinto(values), 4)
+        nose.tools.assert_equal(values[:2].tolist(), [2, 3])
+        nose.tools.assert_equal(mapped.read(1), b"")
+        mapped.close()
+
+
+def test_unmappable():
+    nose.tools.assert_is(MmapStream.from_stream(io.BytesIO(b"abc")), None)
+    with tempfile.TemporaryFile() as stream:
+        nose.tools.assert_is(MmapStream.from_stream(stream), None)
@@ -25,3 +25,20 @@ def test_unique_map():
     nose.tools.assert_equals(unique_map([3, 2, 6, None, 1]), ([0, 1, 2, None, 3], [0, 1, 2, 4]))
     nose.tools.assert_equals(unique_map([3, 1, 6, 1]), ([0, 1, 2, 1], [0, 1, 2]))
     nose.tools.assert_equals(unique_map([3, 1, 6, 1, 2, 2, 9, 3, 2]), ([0, 1, 2, 1, 3, 3, 4, 0, 3], [0, 1, 2, 4, 6]))
+
+
+def test_scan():
+    """Test that scan finds the same files as walk"""
+    import os.path
+    import re
+    from pyffi.utils import scan, walk
+    top = os.path.join(os.path.dirname(__file__), os.pardir, "spells")
+    re_filename = re.compile(r"^.*\.nif$")
+    files = list(scan(top, re_filename=re_filename))
+    nose.tools.assert_equal(
+        sorted(filename for filename, size in files),
+        sorted(walk(top, re_filename=re_filename)))
+    for filename, size in files:
+        nose.tools.assert_equal(size, os.path.getsize(filename))
+    # single file
+    nose.tools.assert_equal(list(scan(filename)), [(filename, size)])